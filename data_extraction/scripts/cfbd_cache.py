@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+from __future__ import annotations
+import hashlib, json, os, threading, time
+from datetime import date
+from pathlib import Path
+
+# On-disk cache of raw CFBD responses plus a per-season manifest of finished weeks/games/rosters.
+# Responses are stored by a hash of (endpoint, year, week, game, ...) so a restarted pull only
+# requests what is missing, and re-running a finished season makes no network calls.
+# Past seasons are immutable; entries for the current season expire after ttl seconds.
+
+# CFB seasons end with January bowls, so a season stays "current" through January of the next year
+def current_season(today: date | None = None) -> int:
+    today = today or date.today()
+    return today.year if today.month >= 2 else today.year - 1
+
+# write to a temp file then rename so concurrent workers and crashes never leave partial files
+def atomic_write(path: Path, text: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+class ResponseCache:
+    def __init__(self, root: Path, ttl: float | None = 6 * 3600):
+        self.root = Path(root)
+        self.ttl = ttl
+        self.manifests = {}
+        self.lock = threading.Lock()
+
+    # content address for one request: endpoint + sorted key fields (year, week, game, team, ...)
+    def key(self, endpoint: str, params: dict) -> str:
+        canon = json.dumps({"endpoint": endpoint, **params}, sort_keys=True, default=str)
+        return hashlib.sha1(canon.encode()).hexdigest()
+
+    def path(self, endpoint: str, params: dict) -> Path:
+        h = self.key(endpoint, params)
+        return self.root / "responses" / endpoint / h[:2] / f"{h}.json"
+
+    def expired(self, year: int | None, fetched_at: float) -> bool:
+        if not self.ttl or year is None or year < current_season():
+            return False
+        return time.time() - fetched_at > self.ttl
+
+    # cached JSON payload for a request, or None on a miss/expired entry
+    def get(self, endpoint: str, params: dict):
+        p = self.path(endpoint, params)
+        try:
+            entry = json.loads(p.read_text())
+        except (OSError, ValueError):
+            return None
+        if self.expired(params.get("year"), entry["fetched_at"]):
+            return None
+        return entry["data"]
+
+    def put(self, endpoint: str, params: dict, data):
+        entry = {"endpoint": endpoint, "params": params, "fetched_at": time.time(), "data": data}
+        atomic_write(self.path(endpoint, params), json.dumps(entry, default=str))
+
+    def manifest(self, year: int) -> "Manifest":
+        with self.lock:
+            if year not in self.manifests:
+                self.manifests[year] = Manifest(self.root / "manifests" / f"{year}.json", self)
+            return self.manifests[year]
+
+# progress for one season: which weeks, games and team rosters have been fully fetched
+class Manifest:
+    def __init__(self, path: Path, cache: ResponseCache):
+        self.path = path
+        self.lock = cache.lock
+        try:
+            self.data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            self.data = {"weeks": {}, "games": {}, "rosters": {}}
+
+    def save(self):
+        atomic_write(self.path, json.dumps(self.data, indent=1, sort_keys=True))
+
+    def mark_game(self, week: int, game_id, n_stats: int):
+        with self.lock:
+            self.data["games"][str(game_id)] = {"week": week, "play_stats": n_stats, "fetched_at": time.time()}
+            self.save()
+
+    def mark_week(self, week: int, game_ids, n_plays: int):
+        with self.lock:
+            self.data["weeks"][str(week)] = {"games": [str(g) for g in game_ids], "plays": n_plays,
+                                             "complete": True, "fetched_at": time.time()}
+            self.save()
+
+    def mark_roster(self, team: str, n_players: int):
+        with self.lock:
+            self.data["rosters"][team] = {"players": n_players, "fetched_at": time.time()}
+            self.save()
+
+    def complete_weeks(self) -> list:
+        return sorted(int(w) for w, v in self.data["weeks"].items() if v.get("complete"))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+from __future__ import annotations
+import hashlib, os, sys, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+# Local stand-in for the CFBD API: replays recorded JSON responses so pull_cfbd.py can be run
+# (and timed) offline. Point the pull at it with --host http://127.0.0.1:<port>.
+# With --upstream, requests that have no recording yet are forwarded to the real API and saved,
+# so one online run records everything a later offline run needs.
+
+# recordings live at <root>/<endpoint path>/<hash of sorted query>.json
+def recording_path(root: Path, url: str) -> Path:
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query)))
+    key = hashlib.sha1(query.encode()).hexdigest()[:16]
+    return root / parts.path.strip("/") / f"{key}.json"
+
+def make_handler(root: Path, upstream: str | None, latency: float):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            p = recording_path(root, self.path)
+            if p.exists():
+                body, status = p.read_bytes(), 200
+            elif upstream:
+                body, status = self.forward()
+                if status == 200:
+                    p.parent.mkdir(parents=True, exist_ok=True)
+                    p.write_bytes(body)
+            else:
+                body, status = b'{"message": "no recording"}', 404
+            # simulate network round trip so concurrency gains show up in benchmarks
+            if latency:
+                time.sleep(latency)
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def forward(self):
+            req = Request(upstream.rstrip("/") + self.path, headers={
+                "Authorization": f"Bearer {os.environ.get('CFBD_API_KEY', '')}",
+                "Accept": "application/json",
+            })
+            try:
+                with urlopen(req) as r:
+                    return r.read(), r.status
+            except HTTPError as e:
+                return e.read(), e.code
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--root", type=str, default="data/recorded")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--upstream", type=str, default=None,
+                    help="record misses from this API, e.g. https://api.collegefootballdata.com")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="artificial delay per response")
+    args = ap.parse_args()
+    root = Path(args.root); root.mkdir(parents=True, exist_ok=True)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(root, args.upstream, args.latency_ms / 1000.0))
+    print(f"Replaying {root} on http://127.0.0.1:{args.port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
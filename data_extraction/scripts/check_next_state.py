@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+from __future__ import annotations
+import argparse, sys
+import numpy as np, pandas as pd
+from map_cfbd_pbp import compare_next_state, next_state
+
+# Regression check for the vectorized next state (map_cfbd_pbp.next_state): it has to agree with the
+# row-wise reference (calculate_next_*) on one play per branch, including every form a missing fumble
+# recovery takes (None, NaN, pd.NA, ''), and give the expected possession on the recovery plays.
+# Optionally also on a mapped pbp file (--pbp). Exits 1 on any difference.
+
+NAN = np.nan
+# (fumble_recovery_name, interception, down, distance, yards_gained, yardline_100, is_rush, is_pass,
+#  touchdown, safety, fg_attempt, punt_attempt, expected next_possession)
+CASES = [
+    (None, 0, 1, 10, 4, 75, 1, 0, 0, 0, 0, 0, 1),    # gain short of the line: 2nd down
+    (None, 0, 2, 6, 8, 71, 0, 1, 0, 0, 0, 0, 1),     # first down
+    (None, 0, 3, 5, 2, 20, 1, 0, 0, 0, 0, 0, 1),     # 4th down next
+    (None, 0, 1, 10, 3, 5, 1, 0, 0, 0, 0, 0, 1),     # goal to go: distance is the yardline
+    (None, 0, 4, 2, 1, 40, 1, 0, 0, 0, 0, 0, -1),    # turnover on downs
+    (None, 0, 4, 2, 3, 40, 0, 1, 0, 0, 0, 0, 1),     # 4th down converted
+    (None, 1, 2, 7, 0, 60, 0, 1, 0, 0, 0, 0, -1),    # interception
+    ("J. Doe", 0, 2, 7, 3, 60, 1, 0, 0, 0, 0, 0, -1),  # fumble recovered by the defense
+    (NAN, 0, 2, 7, 3, 60, 1, 0, 0, 0, 0, 0, 1),      # missing recovery name (NaN): no recovery
+    (pd.NA, 0, 2, 7, 3, 60, 1, 0, 0, 0, 0, 0, 1),    # missing recovery name (pd.NA): no recovery
+    ("", 0, 2, 7, 3, 60, 1, 0, 0, 0, 0, 0, 1),       # empty recovery name: no recovery
+    (None, 0, 1, 10, 25, 25, 0, 1, 1, 0, 0, 0, 1),   # touchdown: no next state
+    (None, 0, 2, 8, -3, 98, 1, 0, 0, 1, 0, 0, 1),    # safety
+    (None, 0, 4, 6, 0, 22, 0, 0, 0, 0, 1, 0, 1),     # field goal attempt
+    (None, 0, 4, 9, 0, 55, 0, 0, 0, 0, 0, 1, 1),     # punt
+    (None, 0, NAN, NAN, 0, 65, 0, 0, 0, 0, 0, 0, 1),  # kickoff: no down
+]
+COLUMNS = ["fumble_recovery_name", "interception", "down", "distance", "yards_gained", "yardline_100", "is_rush",
+           "is_pass", "touchdown", "safety", "fg_attempt", "punt_attempt", "expected_possession"]
+
+def cases() -> pd.DataFrame:
+    df = pd.DataFrame(CASES, columns=COLUMNS)
+    df["fumble_recovery_name"] = df["fumble_recovery_name"].astype(object)
+    return df
+
+def main():
+    ap = argparse.ArgumentParser(description="Check the vectorized next state against the row-wise reference")
+    ap.add_argument("--pbp", type=str, default=None, help="also check the plays of this mapped pbp parquet")
+    args = ap.parse_args()
+    df = cases()
+    try:
+        compare_next_state(df.drop(columns="expected_possession"))
+        if args.pbp:
+            compare_next_state(pd.read_parquet(args.pbp))
+    except AssertionError as e:
+        print(e)
+        sys.exit(1)
+    got = next_state(df)["next_possession"].to_numpy()
+    wrong = np.flatnonzero(got != df["expected_possession"].to_numpy())
+    if len(wrong):
+        print(f"next_possession wrong on case(s) {wrong.tolist()}: {got[wrong].tolist()}")
+        sys.exit(1)
+    print(f"next_possession as expected on all {len(df)} cases")
+
+if __name__ == "__main__":
+    main()
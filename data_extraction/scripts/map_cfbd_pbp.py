@@ -1,12 +1,18 @@
 #!/usr/bin/env python
 from __future__ import annotations
+import sys
 from pathlib import Path
 import pandas as pd, numpy as np, pyarrow.parquet as pq, pyarrow as pa
+from pbp_dataset import read_season, write_season
+# stage instrumentation shared with the transformation pipeline (stdlib only, no other cfb_analytics imports)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'data_transformation' / 'src'))
+from cfb_analytics.instrument import Instrument, PROFILERS, print_report
 
 def calculate_next_possession(play):
     if play['interception'] == 1:
         return -1
-    elif play['fumble_recovery_name']:
+    elif pd.notna(play['fumble_recovery_name']) and play['fumble_recovery_name'] != '':
+        # a missing name (None or NaN) is no recovery, as in next_state
         return -1
     elif play['down'] == 4 and (play['is_rush'] == 1 or play['is_pass'] == 1) and play['yards_gained'] < play['distance']:
         return -1
@@ -45,7 +51,160 @@ def calculate_next_yl(play):
     else:
         return play['yardline_100'] - play['yards_gained']
 
-def map_cfbd_to_standard(df: pd.DataFrame) -> pd.DataFrame:
+def next_state_rowwise(out: pd.DataFrame) -> pd.DataFrame:
+    """Reference implementation: one Python call per play (slow, used to check next_state)."""
+    ref = out.copy()
+    ref['next_possession'] = ref.apply(calculate_next_possession, axis=1)
+    ref['next_down'] = ref.apply(calculate_next_down, axis=1)
+    ref['next_distance'] = ref.apply(calculate_next_distance, axis=1)
+    ref['next_yardline_100'] = ref.apply(calculate_next_yl, axis=1)
+    return ref[['next_possession', 'next_down', 'next_distance', 'next_yardline_100']]
+
+def compare_next_state(out: pd.DataFrame) -> None:
+    """Check next_state against next_state_rowwise on the same plays and print timings."""
+    import time
+    t0 = time.perf_counter(); vec = next_state(out); t1 = time.perf_counter()
+    ref = next_state_rowwise(out); t2 = time.perf_counter()
+    for c in vec.columns:
+        a = vec[c].to_numpy(dtype='float64'); b = pd.to_numeric(ref[c]).to_numpy(dtype='float64')
+        bad = ~((a == b) | (np.isnan(a) & np.isnan(b)))
+        if bad.any():
+            raise AssertionError(f'{c}: {int(bad.sum())} plays differ from the row-wise reference')
+    print(f'next state matches row-wise reference on {len(out)} plays')
+    print(f'vectorized: {t1 - t0:.3f}s  row-wise: {t2 - t1:.3f}s  speedup: {(t2 - t1) / max(t1 - t0, 1e-9):.0f}x')
+    # out's own next state comes from the following snaps (next_state_from_snaps) where there is one
+    cols = list(vec.columns)
+    if not set(cols) <= set(out.columns):
+        return
+    changed = (out[cols].fillna(-99).to_numpy(dtype='float64') != vec.fillna(-99).to_numpy(dtype='float64')).any(axis=1)
+    print(f'next state taken from the following snap differs from the heuristic on {int(changed.sum())} plays')
+
+def next_state(out: pd.DataFrame) -> pd.DataFrame:
+    """Columnar equivalent of the calculate_next_* functions above.
+
+    Evaluates the same branches with boolean masks and np.select instead of a
+    Python call per play. Returns next_possession, next_down, next_distance and
+    next_yardline_100 aligned to out.index.
+    """
+    def flag(col):
+        return out[col].to_numpy(dtype='float64', na_value=np.nan) == 1
+
+    down = out['down'].to_numpy(dtype='float64', na_value=np.nan)
+    distance = out['distance'].to_numpy(dtype='float64', na_value=np.nan)
+    yl = out['yardline_100'].to_numpy(dtype='float64', na_value=np.nan)
+    gained = out['yards_gained'].to_numpy(dtype='float64', na_value=np.nan)
+
+    # a fumble recovery name only counts when it is present and non-empty
+    rec = out['fumble_recovery_name']
+    recovered = (rec.notna() & (rec.astype(str) != '')).to_numpy()
+
+    turnover_on_downs = (down == 4) & (flag('is_rush') | flag('is_pass')) & (gained < distance)
+    next_possession = np.where(flag('interception') | recovered | turnover_on_downs, -1, 1)
+
+    # touchdowns, safeties, field goals and punts end the series: no next state
+    terminal = flag('touchdown') | flag('safety') | flag('fg_attempt') | flag('punt_attempt')
+    next_yl = np.where(terminal, np.nan, yl - gained)
+
+    in_series = np.isin(down, [1, 2, 3])
+    next_down = np.select(
+        [terminal, next_possession == -1, down == 4, in_series & (gained >= distance), in_series],
+        [np.nan, 1.0, 1.0, 1.0, down + 1],
+        default=0.0,
+    )
+
+    next_distance = np.select(
+        [terminal, (next_down == 1) & (yl - gained < 10), next_down == 1],
+        [np.nan, yl - gained, 10.0],
+        default=distance - gained,
+    )
+
+    return pd.DataFrame({
+        'next_possession': next_possession.astype('int64'),
+        'next_down': next_down,
+        'next_distance': next_distance,
+        'next_yardline_100': next_yl,
+    }, index=out.index)
+
+# play types that are not a snap from a down and distance
+NOT_A_SNAP = 'kickoff|timeout|end of|end period|two point|extra point|uncategorized'
+
+def next_state_from_snaps(df: pd.DataFrame, out: pd.DataFrame) -> pd.DataFrame:
+    """next_state taken from the snap that actually follows each play; next_state() where there is none.
+
+    Plays are ordered once by (game, drive, play number). For every snap the next snap of the same
+    game is found with one searchsorted over the snap positions. Its down, distance and yardline are
+    the next state when it continues the drive (this covers penalties and fumbles the offense recovers),
+    or when a drive ended without scoring (punt, turnover, missed field goal) or a kickoff was returned
+    and the next snap is in the same half of regulation; next_possession is -1 when the offense changed.
+    Scoring plays, the last play of a half, overtime drive ends and other non-snaps keep the heuristic.
+    """
+    heur = next_state(out)
+    n = len(out)
+    if n == 0:
+        return heur
+
+    def number(name):
+        if name not in df.columns:
+            return np.full(n, np.nan)
+        return pd.to_numeric(df[name], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+
+    game = pd.to_numeric(out['game_id'], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    drive_no, play_no, play_id = number('driveNumber'), number('playNumber'), number('id')
+    # sort once; missing keys sort last within their level (lexsort: the last key is the primary one)
+    order = np.lexsort((np.arange(n), play_id, play_no, drive_no, game))
+
+    def sorted_(values):
+        return np.asarray(values)[order]
+
+    pt = pd.Series(sorted_(out['play_type'].astype(str).str.lower().to_numpy()))
+    down = sorted_(out['down'].to_numpy(dtype='float64', na_value=np.nan))
+    distance = sorted_(out['distance'].to_numpy(dtype='float64', na_value=np.nan))
+    yl = sorted_(out['yardline_100'].to_numpy(dtype='float64', na_value=np.nan))
+    period = sorted_(out['period'].to_numpy(dtype='float64', na_value=np.nan)) if 'period' in out.columns else np.full(n, np.nan)
+    offense = sorted_(out['offense'].astype(str).to_numpy()) if 'offense' in out.columns else np.full(n, '')
+    drive = sorted_(df['driveId'].to_numpy()) if 'driveId' in df.columns else None
+    game = game[order]
+
+    def flag(c):
+        return sorted_(out[c].to_numpy(dtype='float64', na_value=np.nan) == 1)
+
+    snap = np.isin(down, [1, 2, 3, 4]) & ~pt.str.contains(NOT_A_SNAP).to_numpy()
+    kickoff = pt.str.contains('kickoff').to_numpy()
+    # points were scored (field goals are terminal in the heuristic too; missed ones are not)
+    scoring = flag('touchdown') | flag('safety') | (flag('fg_attempt') & pt.str.contains('good|made').to_numpy())
+
+    snaps = np.flatnonzero(snap)
+    if len(snaps) == 0:
+        return heur
+    pos = np.arange(n)
+    k = np.searchsorted(snaps, pos, side='right')
+    has = k < len(snaps)
+    nxt = snaps[np.minimum(k, len(snaps) - 1)]
+    same_offense = offense[nxt] == offense
+    # without drive ids a drive is a run of snaps by one offense
+    same_drive = (drive[nxt] == drive) if drive is not None else same_offense
+    half = np.where(period <= 2, 1, np.where(period <= 4, 2, period + 10))
+    regulation_half = (half[nxt] == half) & (period <= 4)
+    use = (snap | kickoff) & has & (game[nxt] == game) & ~scoring & (same_drive | regulation_half)
+
+    sorted_heur = heur.to_numpy(dtype='float64')[order]
+    states = np.column_stack([np.where(same_offense[use], 1.0, -1.0), down[nxt][use], distance[nxt][use], yl[nxt][use]])
+    sorted_heur[use] = states
+    result = np.empty_like(sorted_heur)
+    result[order] = sorted_heur
+    return pd.DataFrame({
+        'next_possession': result[:, 0].astype('int64'),
+        'next_down': result[:, 1],
+        'next_distance': result[:, 2],
+        'next_yardline_100': result[:, 3],
+    }, index=out.index)
+
+def team_ids(rosters: pd.DataFrame) -> pd.Series:
+    # team name -> CFBD team id, from a season's rosters.csv (plays only carry the team names)
+    return rosters.drop_duplicates('team_name').set_index('team_name')['team_id']
+
+def map_cfbd_to_standard(df: pd.DataFrame, teams: pd.Series | None = None) -> pd.DataFrame:
+    # teams: team name -> team id (team_ids); offense_id/defense_id stay null without it, and for teams not listed
     
     # COLUMNS OF DATAFRAME BEING PROCESSED
     # ['id', 'driveId', 'gameId', 'driveNumber', 'playNumber', 'offense', 'offenseConference', 
@@ -135,6 +294,17 @@ def map_cfbd_to_standard(df: pd.DataFrame) -> pd.DataFrame:
 
     out['season'] = df.get('season') # from play data
     out['game_id'] = df.get('game_id') # from play data
+    if 'week' in df.columns:
+        out['week'] = df['week'] # set by pull_cfbd.py, used to partition the pbp dataset
+    # game situation needed to label the next score for EP model fitting (cfb_analytics.ep_fit)
+    out['period'] = df.get('period') # from play data
+    out['offense'] = df.get('offense') # from play data
+    out['defense'] = df.get('defense') # from play data
+    # team ids key the team-season/team-game tables and the players' team share metrics
+    for side in ['offense', 'defense']:
+        names = df[side] if side in df.columns else pd.Series(np.nan, index=df.index)
+        out[f'{side}_id'] = (names.map(teams) if teams is not None else pd.Series(np.nan, index=df.index)).astype('Int64')
+    out['play_type'] = df.get('playType') # from play data
     out['down'] = df.get('down') # from play data
     out['distance'] = df.get('distance') # from play data
     out['yardline_100'] = df.get('yardsToGoal', df.get('yardline')) # from play data
@@ -191,10 +361,11 @@ def map_cfbd_to_standard(df: pd.DataFrame) -> pd.DataFrame:
     # 4) update down and distance based on yards gained and previous down and distance
     # 5) check for goal to go
 
-    out['next_possession'] = out.apply(calculate_next_possession, axis=1)
-    out['next_down'] = out.apply(calculate_next_down, axis=1)
-    out['next_distance'] = out.apply(calculate_next_distance, axis=1)
-    out['next_yardline_100'] = out.apply(calculate_next_yl, axis=1)
+    # from the snap that follows each play; the heuristics (next_state, vectorized over all plays; the
+    # calculate_next_* functions above are its row-wise reference) where no snap follows in the drive/half
+    nxt = next_state_from_snaps(df, out)
+    for c in nxt.columns:
+        out[c] = nxt[c]
 
     # Next state (not available -> NaN) - commented out for now
     # out['next_down'] = df.get('next_down')
@@ -210,9 +381,22 @@ def main():
     ap = argparse.ArgumentParser()
     ap.add_argument('--year', type=int, required=True)
     ap.add_argument('--rawdir', type=str, default='data/raw')
+    ap.add_argument('--check-next-state', action='store_true',
+                    help='compare the vectorized next state against the row-wise reference and print timings')
+    ap.add_argument('--report', type=str, default=None,
+                    help='write a JSON run report (wall/CPU time, peak RSS, rows in/out per stage) here')
+    ap.add_argument('--profile', choices=PROFILERS, default=None,
+                    help='with --report: also dump a profile of the slowest stage next to the report')
     args = ap.parse_args()
-    p = Path(args.rawdir)/str(args.year)/'pbp_cfbd_raw.parquet'
-    df = pd.read_parquet(p)
+    inst = Instrument(enabled=bool(args.report), profile=args.profile, command='map_cfbd_pbp', season=args.year)
+    rawdir = Path(args.rawdir)
+    with inst.stage('read_raw', season=args.year) as s:
+        if (rawdir/'pbp_cfbd_raw'/f'season={args.year}').is_dir():
+            df = read_season(rawdir/'pbp_cfbd_raw', args.year)
+        else:
+            # pulls made before the partitioned dataset: one file per season, no week column
+            df = pd.read_parquet(rawdir/str(args.year)/'pbp_cfbd_raw.parquet')
+        s.rows_out = len(df)
     
 
     # print(list(df.columns))
@@ -221,7 +405,16 @@ def main():
     #     print(df['playText'][i])
     
 
-    mapped = map_cfbd_to_standard(df)
+    rosters = rawdir/str(args.year)/'rosters.csv'
+    teams = team_ids(pd.read_csv(rosters)) if rosters.exists() else None
+    if teams is None:
+        print(f'[warn] no {rosters}: offense_id/defense_id left null', file=sys.stderr)
+    with inst.stage('map', rows_in=len(df), season=args.year) as s:
+        mapped = map_cfbd_to_standard(df, teams)
+        s.rows_out = len(mapped)
+    if args.check_next_state:
+        with inst.stage('check_next_state', rows_in=len(mapped), season=args.year):
+            compare_next_state(mapped)
 
     print(list(mapped.columns))
     print('Number of plays in dataset: ', len(mapped))
@@ -230,9 +423,16 @@ def main():
     for i in range(10):
         print(mapped.sample(n=1))
 
-    outp = Path(args.rawdir)/str(args.year)/'pbp.parquet'
-    pq.write_table(pa.Table.from_pandas(mapped, preserve_index=False), outp)
+    with inst.stage('write', rows_in=len(mapped), season=args.year):
+        if 'week' in mapped.columns:
+            outp = rawdir/'pbp'
+            write_season(mapped, outp, args.year)
+        else:
+            outp = rawdir/str(args.year)/'pbp.parquet'
+            pq.write_table(pa.Table.from_pandas(mapped, preserve_index=False), outp)
     print('Wrote', outp)
+    if args.report:
+        print_report(inst.write_report(args.report), args.report)
 
 if __name__ == '__main__':
     main()
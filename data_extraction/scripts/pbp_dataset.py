@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+from __future__ import annotations
+from pathlib import Path
+import pandas as pd, pyarrow as pa, pyarrow.dataset as ds
+
+# Play-by-play stored as hive-partitioned parquet datasets instead of one file per season:
+#   <rawroot>/pbp_cfbd_raw/season=2019/week=1/part-0.parquet   (pull_cfbd.py)
+#   <rawroot>/pbp/season=2019/week=1/part-0.parquet            (map_cfbd_pbp.py)
+# Readers can prune whole seasons/weeks from the directory names and project columns;
+# rows keep their original (game, play) order inside each week.
+
+# one row group per ~64k plays: a regular-season week fits in one or two, big enough for
+# efficient column scans, small enough that column statistics still prune something
+ROW_GROUP_ROWS = 64 * 1024
+PARTITIONING = ds.partitioning(pa.schema([("season", pa.int32()), ("week", pa.int32())]), flavor="hive")
+
+def write_season(df: pd.DataFrame, root: Path, season: int):
+    """Write one season's plays under root, replacing only that season's week directories."""
+    if "week" not in df.columns:
+        raise ValueError("pbp needs a 'week' column to be partitioned")
+    df = df.assign(season=season)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    ds.write_dataset(table, root, format="parquet", partitioning=PARTITIONING,
+                     basename_template="part-{i}.parquet", existing_data_behavior="delete_matching",
+                     max_rows_per_group=ROW_GROUP_ROWS, min_rows_per_group=ROW_GROUP_ROWS // 4)
+
+def read_season(root: Path, season: int) -> pd.DataFrame:
+    dataset = ds.dataset(root, format="parquet", partitioning=PARTITIONING)
+    return dataset.to_table(filter=ds.field("season") == season).to_pandas()
@@ -1,249 +1,306 @@
 #!/usr/bin/env python
 from __future__ import annotations
-import os, sys
+import os, sys, json, time, random, threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import pandas as pd, pyarrow as pa, pyarrow.parquet as pq
-import random
+import pandas as pd
 
 try:
-    import cfbd
+    import cfbd, urllib3
 except ImportError:
     print("Install cfbd: pip install -r requirements.txt", file=sys.stderr)
     raise
+from cfbd_cache import ResponseCache
+from pbp_dataset import write_season
+# stage instrumentation shared with the transformation pipeline (stdlib only, no other cfb_analytics imports)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "data_transformation" / "src"))
+from cfb_analytics.instrument import Instrument, PROFILERS, print_report
 
-def get_client():
+def get_client(host: str | None = None, pool_size: int | None = None):
     token = os.environ.get("CFBD_API_KEY")
     if not token:
         raise RuntimeError("Please export CFBD_API_KEY")
     cfg = cfbd.Configuration(access_token=token)
+    # point at a different server, e.g. scripts/cfbd_replay_server.py for offline runs
+    if host:
+        cfg.host = host
+    # one keep-alive connection per worker thread
+    if pool_size:
+        cfg.connection_pool_maxsize = pool_size
     return cfbd.ApiClient(cfg)
 
-# fetch rosters for a given year from CFBD API
-def fetch_rosters(year: int) -> pd.DataFrame:
-    with get_client() as api:
-        teams_api = cfbd.TeamsApi(api)
-        # players_api = cfbd.PlayersApi(api)
-        rows = []
-        teams = teams_api.get_teams(year=year)
-
-        # loop through list of teams returned by get_teams API call
-        for t in teams:
-            print(t.school, t.conference)
+# HTTP statuses worth retrying: rate limited or a transient server error
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# spaces requests at least 1/rate seconds apart across all worker threads
+class RateLimiter:
+    def __init__(self, rate: float | None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_at = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            at = max(now, self.next_at)
+            self.next_at = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+# one pooled ApiClient shared by every request, plus the concurrency, rate limit, retry and cache settings
+class CfbdSession:
+    def __init__(self, workers: int = 1, rate: float | None = 10.0, retries: int = 4,
+                 backoff: float = 0.5, host: str | None = None, cache: ResponseCache | None = None):
+        self.workers = max(1, workers)
+        self.retries = retries
+        self.backoff = backoff
+        self.limiter = RateLimiter(rate)
+        self.cache = cache
+        self.requests = 0
+        self.count_lock = threading.Lock()
+        self.client = get_client(host=host, pool_size=self.workers)
+        self.teams = cfbd.TeamsApi(self.client)
+        self.plays = cfbd.PlaysApi(self.client)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.client.__exit__(*exc)
+
+    # call an API method, retrying rate limits (429), server errors and dropped connections
+    # with exponential backoff plus jitter; anything else is raised straight away
+    def call(self, fn, *args, **kwargs):
+        for attempt in range(self.retries + 1):
+            self.limiter.wait()
+            with self.count_lock:
+                self.requests += 1
             try:
-                roster = teams_api.get_roster(year=year, team=t.school)
-            except Exception as e:
-                print(f"[warn] roster {t.school} {year}: {e}", file=sys.stderr); continue
-            # loop through players in the current roster
-            for p in roster:
-                # for each player, add their details to the master list
-                rows.append({
-                    "season": year, "player_id": p.id,
-                    "player_name": f"{(p.first_name or '').strip()} {(p.last_name or '').strip()}".strip(),
-                    "team_id": t.id, "team_name": t.school, "conference": t.conference,
-                    "position": p.position
-                })
-        # convert list of players to dataframe and return
-        return pd.DataFrame(rows)
+                return fn(*args, **kwargs)
+            except (cfbd.ApiException, urllib3.exceptions.HTTPError, OSError) as e:
+                status = getattr(e, "status", None)
+                retryable = status in RETRY_STATUSES or not isinstance(e, cfbd.ApiException)
+                if not retryable or attempt == self.retries:
+                    raise
+                delay = self.backoff * 2 ** attempt * (1 + random.random())
+                print(f"[retry] {getattr(fn, '__name__', fn)} status={status} in {delay:.1f}s", file=sys.stderr)
+                time.sleep(delay)
+
+    # like call, but served from / saved to the response cache when there is one;
+    # key holds the cache fields (year, week, game, team) and kwargs go to the API method
+    def fetch(self, endpoint: str, model, fn, key: dict, **kwargs) -> list:
+        if self.cache is not None:
+            data = self.cache.get(endpoint, key)
+            if data is not None:
+                return [model.from_dict(x) for x in data]
+        result = self.call(fn, **kwargs)
+        if self.cache is not None:
+            self.cache.put(endpoint, key, [json.loads(x.to_json()) for x in result])
+        return result
+
+    # progress manifest for a season, or None when running without a cache
+    def manifest(self, year: int):
+        return self.cache.manifest(year) if self.cache is not None else None
+
+    # apply fn to every item on a bounded thread pool; results come back in input order
+    def map(self, fn, items) -> list:
+        items = list(items)
+        if self.workers == 1 or len(items) <= 1:
+            return [fn(x) for x in items]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(fn, items))
+
+# fetch one team's roster rows for a given year
+def fetch_team_roster(session: CfbdSession, year: int, t) -> list:
+    try:
+        roster = session.fetch("roster", cfbd.RosterPlayer, session.teams.get_roster,
+                               {"year": year, "team": t.school}, year=year, team=t.school)
+    except Exception as e:
+        print(f"[warn] roster {t.school} {year}: {e}", file=sys.stderr); return []
+    print(t.school, t.conference)
+    if session.manifest(year) is not None:
+        session.manifest(year).mark_roster(t.school, len(roster))
+    # for each player, add their details to the master list
+    return [{
+        "season": year, "player_id": p.id,
+        "player_name": f"{(p.first_name or '').strip()} {(p.last_name or '').strip()}".strip(),
+        "team_id": t.id, "team_name": t.school, "conference": t.conference,
+        "position": p.position
+    } for p in roster]
+
+# fetch rosters for a given year from CFBD API
+def fetch_rosters(year: int, session: CfbdSession | None = None) -> pd.DataFrame:
+    if session is None:
+        with CfbdSession() as session:
+            return fetch_rosters(year, session)
+    teams = session.fetch("teams", cfbd.Team, session.teams.get_teams, {"year": year}, year=year)
+
+    # one roster request per team, run concurrently when the session has more than one worker
+    rosters = session.map(lambda t: fetch_team_roster(session, year, t), teams)
+    rows = [r for roster in rosters for r in roster]
+    # convert list of players to dataframe and return
+    return pd.DataFrame(rows)
 
 # for a given game ID, get play stats (used in combination with play by play to construct play details)
-def get_play_stats(game_id: int) -> list:
-    with get_client() as api:
-        plays_api = cfbd.PlaysApi(api)
+def get_play_stats(game_id: int, session: CfbdSession | None = None,
+                   year: int | None = None, week: int | None = None) -> list:
+    if session is None:
+        with CfbdSession() as session:
+            return get_play_stats(game_id, session, year, week)
+    try:
+        # get play stats based on the requested game ID
+        play_stats = session.fetch("play_stats", cfbd.PlayStat, session.plays.get_play_stats,
+                                   {"year": year, "week": week, "game": game_id}, game_id=game_id)
+    except Exception as e:
+        print(f"[warn] play stats game={game_id}: {e}", file=sys.stderr)
+        return []
+    if year is not None and session.manifest(year) is not None:
+        session.manifest(year).mark_game(week, game_id, len(play_stats))
+    # return the list of PlayStat objects
+    return play_stats
+
+# play stat type -> (name column, id column, flags set to 1, column that receives ps.stat)
+# one table for every play so the columns can't drift between code paths
+PLAY_STAT_COLUMNS = {
+    "incompletion":        ("passer_player_name", "passer_player_id", (), None),
+    "completion":          ("passer_player_name", "passer_player_id", ("completion",), None),
+    "sack taken":          ("passer_player_name", "passer_player_id", (), "sack_yards"),
+    "interception thrown": ("passer_player_name", "passer_player_id", (), None),
+    "rush":                ("rusher_player_name", "rusher_player_id", (), None),
+    "target":              ("receiver_player_name", "receiver_player_id", (), None),
+    "reception":           ("receiver_player_name", "receiver_player_id", (), None),
+    # sack - TODO check if half sacks are recorded for multiple players
+    "sack":                ("sacker_name", "sacker_id", ("sack",), None),
+    # primary pass defender: pass breakup, interception
+    "pass breakup":        ("primary_pass_defender_name", "primary_pass_defender_id", ("pass_breakup",), None),
+    "interception":        ("primary_pass_defender_name", "primary_pass_defender_id", ("interception",), None),
+    "fumble forced":       ("fumble_forced_name", "fumble_forced_id", ("fumble",), None),
+    "fumble recovered":    ("fumble_recovery_name", "fumble_recovery_id", ("fumble",), None),
+    "tackle":              ("tackler_name", "tackler_id", (), None),
+    "touchdown":           (None, None, ("touchdown",), None),
+}
+
+# bucket a game's play stats by play id so each play finds its stats with one dict lookup
+def index_play_stats(play_stats: list, by_play: dict) -> None:
+    for ps in play_stats:
+        by_play.setdefault(ps.play_id, []).append(ps)
+
+# add the details from a play's stats to its record
+def apply_play_stats(d: dict, play_stats) -> None:
+    for ps in play_stats:
+        cols = PLAY_STAT_COLUMNS.get((ps.stat_type or "").lower())
+        if cols is None:
+            continue
+        name_col, id_col, flags, stat_col = cols
+        if name_col:
+            d[name_col] = ps.athlete_name
+            d[id_col] = ps.athlete_id
+        for f in flags:
+            d[f] = 1
+        if stat_col:
+            d[stat_col] = ps.stat
+
+# fetch all play by play details for a given year
+def fetch_pbp(year: int, session: CfbdSession | None = None) -> pd.DataFrame:
+    if session is None:
+        with CfbdSession() as session:
+            return fetch_pbp(year, session)
+    recs = []
+    manifest = session.manifest(year)
+    if manifest is not None and manifest.complete_weeks():
+        print('weeks already complete (served from cache): ', manifest.complete_weeks())
+
+    # loop through 14 weeks in CFB regular season
+    for i in range(1, 15):
+        print('play by play week: ', i)
+
         try:
-            # get play stats based on the requested game ID
-            play_stats = plays_api.get_play_stats(game_id=game_id)
+            # get all plays for the current week
+            plays_i = session.fetch("plays", cfbd.Play, session.plays.get_plays,
+                                    {"year": year, "week": i}, year=year, week=i)
         except Exception as e:
-            print(f"[warn] play stats game={game_id}: {e}", file=sys.stderr)
-        # return the list of PlayStat objects
-        return play_stats
+            print(f"[warn] plays week={i} {year}: {e}", file=sys.stderr); continue
 
-# fetch all play by play details for a given year
-def fetch_pbp(year: int) -> pd.DataFrame:
-    with get_client() as api:
-        games_api = cfbd.GamesApi(api); plays_api = cfbd.PlaysApi(api)
-        recs = []
-
-        # loop through 14 weeks in CFB regular season
-        for i in range(1, 15):
-            print('play by play week: ', i)
-
-            # counters for logging
-            play_count = 0
-            play_stat_count = 0
-            
-            # initialize stats lists for the current week
-            play_stats = []
-            play_stats_game_ids = []
-            
-            try:
-                # get all plays for the current week
-                plays_i = plays_api.get_plays(year, i)
-            except Exception as e:
-                print(f"[warn] plays week={i} {year}: {e}", file=sys.stderr); continue
-
-            # loop through plays to add stats
-            for pl in plays_i:
-                d = pl.to_dict(); d["season"] = year; d["game_id"] = pl.game_id
-
-                # increment play counter
-                play_count += 1
-
-                # if the needed player stats aren't already available, fetch them from cfbd api
-                # then search through stats from the appropriate game to find stats for the correct play
-                # then add the stats and game ID to the list so they don't get requested again
-                if pl.game_id not in play_stats_game_ids:
-                    new_play_stats = get_play_stats(pl.game_id)
-                    for ps in new_play_stats:
-
-                        # increment play stat counter
-                        play_stat_count += 1
-
-                        # add stats if the current stats are for the correct play
-                        if ps.play_id == pl.id:
-                            # add passer details
-                            if ps.stat_type.lower() in ("incompletion", "completion", "sack taken", "interception thrown"):
-                                d["passer_player_name"] = ps.athlete_name
-                                d["passer_player_id"] = ps.athlete_id
-                                if ps.stat_type.lower() == "completion":
-                                    d["completion"] = 1
-                                if ps.stat_type.lower() == "sack taken":
-                                    d["sack_yards"] = ps.stat
-                            # add rusher details
-                            elif ps.stat_type.lower() == "rush":
-                                d["rusher_player_name"] = ps.athlete_name
-                                d["rusher_player_id"] = ps.athlete_id
-                            # add receiver details
-                            elif ps.stat_type.lower() in ("target", "reception"):
-                                d["receiver_player_name"] = ps.athlete_name
-                                d["receiver_played_id"] = ps.athlete_id
-                            # sack - TODO check if half sacks are recorded for multiple players
-                            elif ps.stat_type.lower() == "sack":
-                                d["sacker_name"] = ps.athlete_name
-                                d["sacker_id"] = ps.athlete_id
-                                d["sack"] = 1
-                            # primary pass defender: pass breakup, interception
-                            elif ps.stat_type.lower() in ("pass breakup", "interception"):
-                                d["primary_pass_defender_name"] = ps.athlete_name
-                                d["primary_pass_defender_id"] = ps.athlete_id
-                                if ps.stat_type.lower() == "pass breakup":
-                                    d["pass_breakup"] = 1
-                                if ps.stat_type.lower() == "interception":
-                                    d["interception"] = 1
-                            # forced fumble
-                            elif ps.stat_type.lower() == "fumble forced":
-                                d["fumble_forced_name"] = ps.athlete_name
-                                d["fumble_forced_id"] = ps.athlete_id
-                                d["fumble"] = 1
-                            # fumble recovery
-                            elif ps.stat_type.lower() == "fumble recovered":
-                                d["fumble_recovery_name"] = ps.athlete_name
-                                d["fumble_recovery_id"] = ps.athlete_id
-                                d["fumble"] = 1
-                            # tackle
-                            elif ps.stat_type.lower() == "tackle":
-                                d["tackler_name"] = ps.athlete_name
-                                d["tackler_id"] = ps.athlete_id
-                            # touchdown
-                            elif ps.stat_type.lower() == "touchdown":
-                                d["touchdown"] = 1
-
-                    # add all new play_stats objects to the list
-                    play_stats.extend(new_play_stats)
-                    # add new game_id to the list
-                    play_stats_game_ids.append(pl.game_id)
-
-                # if the needed player stats are already available, search through all stats to find relevant ones
-                else:
-                    for ps in play_stats:
-                        # if current play stat is linked to the current play, add details to the play object
-                        if ps.play_id == pl.id:
-                            # add passer details
-                            if ps.stat_type.lower() in ("incompletion", "completion", "sack taken",
-                                                        "interception thrown"):
-                                d["passer_player_name"] = ps.athlete_name
-                                d["passer_player_id"] = ps.athlete_id
-                                if ps.stat_type.lower() == "completion":
-                                    d["completion"] = 1
-                                if ps.stat_type.lower() == "sack taken":
-                                    d["sack_yards"] = ps.stat
-                            # add rusher details
-                            elif ps.stat_type.lower() == "rush":
-                                d["rusher_player_name"] = ps.athlete_name
-                                d["rusher_played_id"] = ps.athlete_id
-                            # add receiver details
-                            elif ps.stat_type.lower() in ("target", "reception"):
-                                d["receiver_player_name"] = ps.athlete_name
-                                d["receiver_played_id"] = ps.athlete_id
-                            # sack - TODO check if half sacks are recorded for multiple players
-                            elif ps.stat_type.lower() == "sack":
-                                d["sacker_name"] = ps.athlete_name
-                                d["sacker_id"] = ps.athlete_id
-                                d["sack"] = 1
-                            # primary pass defender: pass breakup, interception
-                            elif ps.stat_type.lower() in ("pass breakup", "interception"):
-                                d["primary_pass_defender_name"] = ps.athlete_name
-                                d["primary_pass_defender_id"] = ps.athlete_id
-                                if ps.stat_type.lower() == "pass breakup":
-                                    d["pass_breakup"] = 1
-                                if ps.stat_type.lower() == "interception":
-                                    d["interception"] = 1
-                            # forced fumble
-                            elif ps.stat_type.lower() == "fumble forced":
-                                d["fumble_forced_name"] = ps.athlete_name
-                                d["fumble_forced_id"] = ps.athlete_id
-                                d["fumble"] = 1
-                            # fumble recovery
-                            elif ps.stat_type.lower() == "fumble recovered":
-                                d["fumble_recovery_name"] = ps.athlete_name
-                                d["fumble_recovery_id"] = ps.athlete_id
-                            # tackle
-                            elif ps.stat_type.lower() == "tackle":
-                                d["tackler_name"] = ps.athlete_name
-                                d["tackler_id"] = ps.athlete_id
-                            # touchdown
-                            elif ps.stat_type.lower() == "touchdown":
-                                d["touchdown"] = 1
-
-                recs.append(d)
-
-            # display game count, play count, and play stat count for the week
-            print('week ', i, 'games: ', len(play_stats_game_ids))
-            print('week ', i, 'plays: ', play_count)
-            print('week ', i, 'play stats: ', play_stat_count)
-        
-        # for g in games:
-        #     print(g.id, g.season, g.week, g.home_team, g.home_points, g.away_team, g.away_points)
-        # week_1_plays = plays_api.get_plays(2019, 1)
-        # game_1_id = week_1_plays[0].game_id
-        # for p in week_1_plays:
-        #     if p.game_id == game_1_id:
-        #         print(p.offense, p.offense_score, p.defense, p.defense_score, p.period, p.clock, p.yardline, p.down, p.distance, p.play_type, p.yards_gained, p.scoring)
-                
-    #     for g in games:
-    #         try:
-    #             plays = plays_api.get_plays(game_id=g.id)
-    #         except Exception as e:
-    #             print(f"[warn] plays game_id={g.id} {year}: {e}", file=sys.stderr); continue
-    #         for pl in plays:
-    #             d = pl.to_dict(); d["season"] = year; d["game_id"] = g.id
-    #             recs.append(d)
+        # fetch play stats for every game in the week (concurrently when the session allows)
+        # and index them by play id so each play finds its stats with one lookup
+        game_ids = list(dict.fromkeys(pl.game_id for pl in plays_i))
+        stats_by_play = {}
+        play_stat_count = 0
+        for new_play_stats in session.map(lambda g: get_play_stats(g, session, year, i), game_ids):
+            play_stat_count += len(new_play_stats)
+            index_play_stats(new_play_stats, stats_by_play)
+
+        # loop through plays to add stats
+        for pl in plays_i:
+            d = pl.to_dict(); d["season"] = year; d["week"] = i; d["game_id"] = pl.game_id
+
+            # add the stats recorded for this play
+            apply_play_stats(d, stats_by_play.get(pl.id, ()))
+
+            recs.append(d)
+
+        # display game count, play count, and play stat count for the week
+        print('week ', i, 'games: ', len(game_ids))
+        print('week ', i, 'plays: ', len(plays_i))
+        print('week ', i, 'play stats: ', play_stat_count)
+
+        # checkpoint the week once every game's play stats are in the cache
+        if manifest is not None and all(str(g) in manifest.data["games"] for g in game_ids):
+            manifest.mark_week(i, game_ids, len(plays_i))
+
+    # for g in games:
+    #     print(g.id, g.season, g.week, g.home_team, g.home_points, g.away_team, g.away_points)
+    # week_1_plays = plays_api.get_plays(2019, 1)
+    # game_1_id = week_1_plays[0].game_id
+    # for p in week_1_plays:
+    #     if p.game_id == game_1_id:
+    #         print(p.offense, p.offense_score, p.defense, p.defense_score, p.period, p.clock, p.yardline, p.down, p.distance, p.play_type, p.yards_gained, p.scoring)
+    if recs:
         print(random.choice(recs))
         print(random.choice(recs))
-        return pd.json_normalize(recs, max_level=1)
+    return pd.json_normalize(recs, max_level=1)
 
 def main():
     import argparse
     ap = argparse.ArgumentParser()
     ap.add_argument("--years", type=int, nargs="+", default=[2019,2020,2021,2022,2023,2024])
     ap.add_argument("--rawroot", type=str, default="data/raw")
+    ap.add_argument("--workers", type=int, default=1, help="concurrent requests (games, team rosters); 1 = sequential")
+    ap.add_argument("--rate", type=float, default=10.0, help="max requests per second across all workers (0 = unlimited)")
+    ap.add_argument("--retries", type=int, default=4, help="retries on 429/5xx/connection errors, with exponential backoff")
+    ap.add_argument("--host", type=str, default=None, help="API host override, e.g. http://127.0.0.1:8765 for the replay server")
+    ap.add_argument("--cache-dir", type=str, default="data/cache", help="on-disk response cache and per-season manifests")
+    ap.add_argument("--no-cache", action="store_true", help="always hit the API and write nothing to the cache")
+    ap.add_argument("--cache-ttl-hours", type=float, default=6.0,
+                    help="expiry for current-season responses (0 = never); past seasons never expire")
+    ap.add_argument("--report", type=str, default=None,
+                    help="write a JSON run report (wall/CPU time, peak RSS, rows per stage and season) here")
+    ap.add_argument("--profile", choices=PROFILERS, default=None,
+                    help="with --report: also dump a profile of the slowest stage next to the report")
     args = ap.parse_args()
+    inst = Instrument(enabled=bool(args.report), profile=args.profile, command="pull_cfbd", workers=args.workers)
     rawroot = Path(args.rawroot)
-    for yr in args.years:
-        outdir = rawroot / str(yr); outdir.mkdir(parents=True, exist_ok=True)
-        rost = fetch_rosters(yr); rost.to_csv(outdir/"rosters.csv", index=False)
-        pbp = fetch_pbp(yr)
-        pq.write_table(pa.Table.from_pandas(pbp, preserve_index=False), outdir/"pbp_cfbd_raw.parquet")
-        print("Wrote", outdir)
+    cache = None if args.no_cache else ResponseCache(Path(args.cache_dir), ttl=args.cache_ttl_hours * 3600 or None)
+    with CfbdSession(workers=args.workers, rate=args.rate or None, retries=args.retries, host=args.host,
+                     cache=cache) as session:
+        for yr in args.years:
+            t0 = time.perf_counter()
+            outdir = rawroot / str(yr); outdir.mkdir(parents=True, exist_ok=True)
+            with inst.stage("fetch_rosters", season=yr) as s:
+                rost = fetch_rosters(yr, session); rost.to_csv(outdir/"rosters.csv", index=False)
+                s.rows_out = len(rost)
+            with inst.stage("fetch_pbp", season=yr) as s:
+                pbp = fetch_pbp(yr, session)
+                s.rows_out = len(pbp)
+            with inst.stage("write_pbp", rows_in=len(pbp), season=yr):
+                write_season(pbp, rawroot/"pbp_cfbd_raw", yr)
+            print("Wrote", outdir, "and", rawroot/"pbp_cfbd_raw", f"in {time.perf_counter() - t0:.1f}s with {session.workers} worker(s),",
+                  session.requests, "API requests so far")
+    if args.report:
+        inst.meta["api_requests"] = session.requests
+        print_report(inst.write_report(args.report), args.report)
 
 if __name__ == "__main__":
     main()
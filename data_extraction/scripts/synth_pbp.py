@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+from __future__ import annotations
+import json, time
+from pathlib import Path
+import numpy as np, pandas as pd
+from map_cfbd_pbp import map_cfbd_to_standard, team_ids
+from pbp_dataset import write_season
+
+# Synthetic seasons for benchmarking the pipeline at scales the real data can't reach
+# (20 seasons, thousands of teams, tens of millions of plays). Plays are simulated as
+# CFBD plays + play stats (the pbp_cfbd_raw columns pull_cfbd.py writes) and then run through
+# map_cfbd_to_standard, so the output is exactly the mapped schema:
+#   <rawdir>/pbp/season=YYYY/week=W/part-0.parquet   (pbp_dataset layout, like map_cfbd_pbp.py)
+#   <rawdir>/YYYY/rosters.csv                        (pull_cfbd.py roster columns)
+#   <rawdir>/synthetic.json                          (generator settings, to reuse or replace the data)
+#
+# Games are simulated in lockstep: one vectorized step per play, over every game of the season.
+# The football is plausible, not calibrated: down/distance/field position, scoring, turnovers,
+# kicks and player usage roughly follow real rates so the pipeline sees realistic shapes.
+
+# roster slots per team, by position; starters first
+ROSTER = [('QB', 3), ('RB', 4), ('WR', 6), ('TE', 3), ('DL', 8), ('LB', 7), ('DB', 9)]
+POSITIONS = [pos for pos, n in ROSTER for _ in range(n)]
+SLOTS = {pos: np.flatnonzero(np.array(POSITIONS) == pos) for pos, _ in ROSTER}
+QB_WEIGHTS = [0.9, 0.08, 0.02]
+RB_WEIGHTS = [0.55, 0.3, 0.1, 0.05]
+RECEIVER_SLOTS = np.concatenate([SLOTS['WR'], SLOTS['TE'], SLOTS['RB']])
+RECEIVER_WEIGHTS = np.array([20, 17, 14, 8, 4, 2, 10, 4, 1, 10, 5, 3, 2]) / 100
+DEFENDER_SLOTS = np.concatenate([SLOTS['DL'], SLOTS['LB'], SLOTS['DB']])
+CONFERENCES = 10
+
+# CFBD play types the simulation produces, indexed by the codes below
+PLAY_TYPES = ['Kickoff', 'Field Goal Good', 'Field Goal Missed', 'Punt', 'Penalty', 'Safety',
+              'Passing Touchdown', 'Rushing Touchdown', 'Pass Interception Return', 'Sack',
+              'Pass Reception', 'Pass Incompletion', 'Fumble Recovery (Opponent)', 'Rush']
+(KICKOFF, FG_GOOD, FG_MISSED, PUNT, PENALTY, SAFETY, PASS_TD, RUSH_TD, INTERCEPTION, SACK,
+ RECEPTION, INCOMPLETION, FUMBLE_LOST, RUSH) = range(len(PLAY_TYPES))
+
+def player_ids(team, slot):
+    return 1_000_000 + np.asarray(team) * 100 + np.asarray(slot)
+
+def team_names(teams: int) -> np.ndarray:
+    return np.array([f'Synthetic {t:04d}' for t in range(teams)], dtype=object)
+
+def season_rosters(season: int, teams: int) -> pd.DataFrame:
+    """Every team's ROSTER, in the rosters.csv layout pull_cfbd.py writes plus position_group."""
+    team = np.repeat(np.arange(teams), len(POSITIONS))
+    slot = np.tile(np.arange(len(POSITIONS)), teams)
+    names = team_names(teams)[team]
+    position = np.array(POSITIONS, dtype=object)[slot]
+    return pd.DataFrame({
+        'season': season, 'player_id': player_ids(team, slot),
+        'player_name': names + ' ' + position + slot.astype(str),
+        'team_id': 10_000 + team, 'team_name': names,
+        'conference': np.array([f'Conference {c}' for c in range(CONFERENCES)], dtype=object)[team % CONFERENCES],
+        # position_group is read by assemble_defense (load_rosters: position/position_group)
+        'position': position, 'position_group': position,
+    })
+
+def schedule(rng, teams: int, weeks: int) -> pd.DataFrame:
+    """teams // 2 games a week between random pairs."""
+    rows = []
+    for week in range(1, weeks + 1):
+        pairs = rng.permutation(teams)[: teams - teams % 2].reshape(-1, 2)
+        rows.append(pd.DataFrame({'week': week, 'home': pairs[:, 0], 'away': pairs[:, 1]}))
+    return pd.concat(rows, ignore_index=True)
+
+def simulate_season(season: int, teams: int = 130, weeks: int = 14, plays_per_game: int = 180,
+                    seed: int = 0) -> pd.DataFrame:
+    """One season of plays in the pbp_cfbd_raw layout (plays + play stat columns), in (game, play) order.
+
+    Each season has its own random stream, so a season is the same whichever others are generated.
+    """
+    rng = np.random.default_rng([seed, season, teams])
+    games = schedule(rng, teams, weeks)
+    G, P = len(games), plays_per_game
+    sides = games[['home', 'away']].to_numpy()
+    rows = np.arange(G)
+
+    # state of every game before its next play; poss indexes sides (0 home, 1 away)
+    receives_first = rng.integers(0, 2, G)
+    poss = 1 - receives_first  # the kicking team is the offense on a kickoff
+    kick = np.ones(G, bool)
+    down = np.ones(G, np.int64); dist = np.full(G, 10); yl = np.full(G, 75)
+
+    names = ['period', 'offense', 'defense', 'down', 'distance', 'yardline', 'gained', 'kind',
+             'passer', 'rusher', 'receiver', 'recovery']
+    out = {c: np.empty((P, G), np.int64) for c in names}
+    for s in range(P):
+        if s == P // 2:
+            # second half: the team that received the opening kick kicks off
+            kick[:] = True; poss = receives_first.copy()
+        off, de = sides[rows, poss], sides[rows, 1 - poss]
+
+        fourth = (down == 4) & ~kick
+        go_for_it = fourth & (dist <= 2) & (yl > 35) & (yl < 65) & (rng.random(G) < 0.5)
+        fg = fourth & ~go_for_it & (yl <= 35)
+        punt = fourth & ~go_for_it & ~fg
+        scrimmage = ~kick & ~fg & ~punt
+        penalty = scrimmage & (rng.random(G) < 0.05)
+        scrimmage &= ~penalty
+        pass_rate = np.clip(0.35 + 0.03 * dist + 0.15 * (down == 3), 0.3, 0.85)
+        is_pass = scrimmage & (rng.random(G) < pass_rate)
+        is_rush = scrimmage & ~is_pass
+
+        u = rng.random(G)
+        sack = is_pass & (u < 0.06)
+        intercepted = is_pass & (u >= 0.06) & (u < 0.085)
+        complete = is_pass & (u >= 0.085) & (u < 0.65)
+        fumble_lost = is_rush & (u < 0.01)
+
+        gain = np.select(
+            [is_rush, complete, sack, penalty],
+            [np.round(rng.exponential(6.0, G) - 1 - 4 * (rng.random(G) < 0.12)),
+             np.round(rng.exponential(11.0, G) + 1),
+             -rng.integers(1, 13, G),
+             rng.choice([-10, -5, 5, 15], G)], default=0).astype(np.int64)
+        gain = np.minimum(gain, yl)  # nobody gains past the goal line
+        td = (is_rush | complete) & (gain == yl)
+        safety = (is_rush | sack) & (yl - gain >= 100)
+        gain = np.where(safety, yl - 100, gain)
+        fg_good = fg & (rng.random(G) < np.clip(1.1 - 0.017 * yl, 0.2, 0.98))
+        targeted = is_pass & ~sack & (rng.random(G) < 0.93)
+
+        out['period'][s] = s * 4 // P + 1
+        out['offense'][s] = off; out['defense'][s] = de
+        out['down'][s] = np.where(kick, 0, down)
+        out['distance'][s] = np.where(kick, 10, dist)
+        out['yardline'][s] = np.where(kick, 65, yl)
+        out['gained'][s] = gain
+        out['kind'][s] = np.select(
+            [kick, fg_good, fg, punt, penalty, safety, td & is_pass, td, intercepted, sack, complete,
+             is_pass, fumble_lost], [KICKOFF, FG_GOOD, FG_MISSED, PUNT, PENALTY, SAFETY, PASS_TD, RUSH_TD,
+                                     INTERCEPTION, SACK, RECEPTION, INCOMPLETION, FUMBLE_LOST], default=RUSH)
+        out['passer'][s] = np.where(is_pass, player_ids(off, rng.choice(SLOTS['QB'], G, p=QB_WEIGHTS)), -1)
+        out['rusher'][s] = np.where(is_rush, player_ids(off, rng.choice(SLOTS['RB'], G, p=RB_WEIGHTS)), -1)
+        out['receiver'][s] = np.where(targeted, player_ids(off, rng.choice(RECEIVER_SLOTS, G, p=RECEIVER_WEIGHTS)), -1)
+        out['recovery'][s] = np.where(fumble_lost, player_ids(de, rng.choice(DEFENDER_SLOTS, G)), -1)
+
+        # next state on the same offense
+        first_down = gain >= dist
+        new_yl = np.clip(yl - gain, 1, 99)
+        dist = np.where(first_down, 10, dist - gain)
+        down = np.where(first_down, 1, np.where(penalty, down, down + 1))  # a penalty replays the down
+        dist = np.clip(dist, 1, new_yl)
+        # turnovers, punts, missed field goals and kickoffs: the other team's 1st and 10
+        flip = intercepted | fumble_lost | punt | (fg & ~fg_good) | (go_for_it & ~first_down) | kick
+        net = np.round(rng.normal(40, 8, G))
+        spot = np.select(
+            [kick, punt, fg, intercepted],
+            [np.clip(np.round(rng.normal(72, 8, G)), 50, 90),
+             np.where(yl - net <= 0, 80, np.clip(100 - yl + net, 20, 95)),
+             np.clip(100 - yl - 7, 1, 80),
+             np.clip(100 - yl + np.round(rng.exponential(8, G)), 1, 99)], default=100 - new_yl).astype(np.int64)
+        poss = np.where(flip, 1 - poss, poss)
+        yl = np.where(flip, spot, new_yl)
+        down = np.where(flip, 1, down)
+        dist = np.where(flip, np.minimum(10, yl), dist)
+        # after a touchdown or field goal the scorer kicks off; after a safety the team scored on does
+        kick = td | fg_good | safety
+
+    cols = {c: a.T.ravel() for c, a in out.items()}  # (play, game) -> rows in (game, play) order
+    n = G * P
+    kind = cols['kind']
+    teams_ = team_names(teams)
+    game_id = 400_000_000 + (season - 2000) * 1_000_000 + games['week'].to_numpy() * 10_000 + rows
+    df = pd.DataFrame({
+        'id': np.arange(n, dtype=np.int64) + game_id[0] * 1000,
+        'season': season, 'week': np.repeat(games['week'].to_numpy(), P), 'game_id': np.repeat(game_id, P),
+        'playNumber': np.tile(np.arange(1, P + 1), G), 'period': cols['period'],
+        'offense': teams_[cols['offense']], 'defense': teams_[cols['defense']],
+        'down': cols['down'], 'distance': cols['distance'], 'yardsToGoal': cols['yardline'],
+        'yardsGained': cols['gained'], 'playType': np.array(PLAY_TYPES, dtype=object)[kind],
+    })
+    # play stats: athlete ids arrive as strings, and a stat a play doesn't have is missing
+    roster = season_rosters(season, teams).set_index('player_id')['player_name']
+    for col, id_col, name_col in [('passer', 'passer_player_id', 'passer_player_name'),
+                                  ('rusher', 'rusher_player_id', 'rusher_player_name'),
+                                  ('receiver', 'receiver_player_id', 'receiver_player_name'),
+                                  ('recovery', 'fumble_recovery_id', 'fumble_recovery_name')]:
+        ids = pd.Series(cols[col]).where(cols[col] >= 0)
+        df[id_col] = ids.map(lambda v: str(int(v)), na_action='ignore').astype(object)
+        df[name_col] = ids.map(roster).astype(object)
+    # flags are 1 or absent, as apply_play_stats records them
+    flag = lambda m: np.where(m, 1.0, np.nan)
+    df['completion'] = flag(np.isin(kind, [RECEPTION, PASS_TD]))
+    df['touchdown'] = flag(np.isin(kind, [PASS_TD, RUSH_TD]))
+    df['interception'] = flag(kind == INTERCEPTION)
+    df['sack'] = flag(kind == SACK)
+    df['sack_yards'] = np.where(kind == SACK, -cols['gained'], np.nan)
+    df['fumble'] = flag(kind == FUMBLE_LOST)
+    df['ppa'] = np.where(np.isin(kind, [KICKOFF, PENALTY]), np.nan,
+                         (cols['gained'] - 0.4 * cols['distance']) / 8 + rng.normal(0, 0.3, n))
+    return df
+
+def settings_path(rawdir: Path) -> Path:
+    return Path(rawdir)/'synthetic.json'
+
+def generate(rawdir: Path, seasons, teams: int = 130, weeks: int = 14, plays_per_game: int = 180,
+             seed: int = 0, log=print) -> dict:
+    """Write mapped pbp and rosters for these seasons under rawdir; seasons already there with the same settings are kept."""
+    rawdir = Path(rawdir)
+    # format 2: plays carry offense_id/defense_id; seasons written before are regenerated
+    settings = {'teams': teams, 'weeks': weeks, 'plays_per_game': plays_per_game, 'seed': seed, 'format': 2}
+    try:
+        existing = json.loads(settings_path(rawdir).read_text())
+    except (OSError, ValueError):
+        existing = {}
+    done = set(existing.get('seasons', [])) if {k: existing.get(k) for k in settings} == settings else set()
+    for season in seasons:
+        if season in done:
+            continue
+        t0 = time.perf_counter()
+        rosters = season_rosters(season, teams)
+        mapped = map_cfbd_to_standard(simulate_season(season, teams, weeks, plays_per_game, seed), team_ids(rosters))
+        write_season(mapped, rawdir/'pbp', season)
+        (rawdir/str(season)).mkdir(parents=True, exist_ok=True)
+        rosters.to_csv(rawdir/str(season)/'rosters.csv', index=False)
+        done.add(season)
+        # record after every season so an interrupted run keeps what it finished
+        settings_path(rawdir).write_text(json.dumps({**settings, 'seasons': sorted(done)}, indent=1))
+        log(f'{season}: {len(mapped)} plays in {time.perf_counter() - t0:.1f}s')
+    return {**settings, 'seasons': sorted(done)}
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description='Generate synthetic mapped pbp + rosters for benchmarking')
+    ap.add_argument('--start', type=int, default=2001)
+    ap.add_argument('--end', type=int, default=2001)  # inclusive
+    ap.add_argument('--rawdir', type=str, default='data/synthetic')
+    ap.add_argument('--teams', type=int, default=130, help='teams per season (teams // 2 games a week)')
+    ap.add_argument('--weeks', type=int, default=14)
+    ap.add_argument('--plays-per-game', type=int, default=180)
+    ap.add_argument('--seed', type=int, default=0)
+    args = ap.parse_args()
+    generate(Path(args.rawdir), range(args.start, args.end + 1), args.teams, args.weeks, args.plays_per_game, args.seed)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+from __future__ import annotations
+import argparse, sys, unicodedata, zlib
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np, pandas as pd
+
+from transfer_store import REPO, TransferStore
+
+# Links transfer records (transfer_store.py) to CFBD roster player_ids.
+#
+# Candidates are blocked instead of compared all-pairs: a transfer of `year` from A to B is looked
+# for on B's roster that season and on A's the season before, first among players of the same
+# position group, then (for what is still unmatched) among the whole roster. Names are scored
+# vectorized over all candidate pairs: Jaccard similarity of character trigrams (as fixed-width
+# bit signatures, so a pair costs a few AND/OR/popcounts) plus first/last token agreement.
+# A player found on both rosters scores higher. The mapping transfer_id -> player_id is kept in
+# <store>/player_ids.parquet with its score and margin over the runner-up; a rerun only resolves
+# transfers that are new or were not matched before.
+
+SIGNATURE_BITS = 512
+THRESHOLD = 0.75    # accept a match at or above this confidence...
+MIN_MARGIN = 0.10   # ...if the runner-up (another player) scores at least this much lower
+BOTH_ROSTERS_BONUS = 0.10
+# transfer-portal school names -> CFBD team names, after normalize_school
+SCHOOL_ALIASES = {
+    "appalachian state": "app state", "fiu": "florida international", "fau": "florida atlantic",
+    "pitt": "pittsburgh", "umass": "massachusetts", "usf": "south florida", "ulm": "ul monroe",
+    "louisiana monroe": "ul monroe", "ul lafayette": "louisiana", "louisiana lafayette": "louisiana",
+    "middle tennessee state": "middle tennessee", "grambling state": "grambling", "albany": "ualbany",
+    "central connecticut state": "central connecticut", "southeastern louisiana": "se louisiana",
+    "nc central": "north carolina central", "miami fl": "miami", "miami florida": "miami",
+    "southern mississippi": "southern miss", "connecticut": "uconn", "mississippi": "ole miss",
+    "north carolina state": "nc state", "southern california": "usc", "brigham young": "byu",
+    "texas san antonio": "utsa", "texas el paso": "utep", "nevada las vegas": "unlv",
+    "sam houston state": "sam houston", "mcneese state": "mcneese", "nicholls state": "nicholls",
+}
+POSITION_GROUPS = {
+    "QB": "QB", "RB": "RB", "FB": "RB", "WR": "WR", "TE": "TE",
+    "OL": "OL", "OT": "OL", "IOL": "OL", "G": "OL", "OG": "OL", "C": "OL",
+    "DL": "DL", "DE": "DL", "DT": "DL", "NT": "DL", "EDGE": "DL",
+    "LB": "LB", "OLB": "LB", "ILB": "LB", "MLB": "LB",
+    "DB": "DB", "CB": "DB", "S": "DB", "SAF": "DB",
+    "K": "ST", "PK": "ST", "P": "ST", "LS": "ST",
+}
+SUFFIXES = {"jr", "sr", "ii", "iii", "iv", "v"}
+MAPPING_COLUMNS = ["transfer_id", "player_id", "status", "score", "margin", "sides", "roster_name", "team_name",
+                   "season", "candidates", "resolved_at"]
+
+def _ascii(s: pd.Series) -> pd.Series:
+    # accents off (San José -> san jose), lower case, punctuation to spaces, whitespace collapsed
+    s = s.fillna("").astype(str).map(lambda t: unicodedata.normalize("NFKD", t).encode("ascii", "ignore").decode())
+    s = s.str.casefold().str.replace("&", " and ").str.replace(r"[’'.]", "", regex=True)
+    return s.str.replace(r"[^a-z0-9 ]+", " ", regex=True).str.split().str.join(" ")
+
+def normalize_school(s: pd.Series) -> pd.Series:
+    s = _ascii(s).str.replace(r"\bst\b", "state", regex=True).str.replace(r"^the ", "", regex=True)
+    return s.replace(SCHOOL_ALIASES)
+
+def normalize_name(s: pd.Series) -> pd.Series:
+    """'Billy McCrary III' -> 'billy mccrary'; 'C.J. Smith' -> 'cj smith'."""
+    tokens = _ascii(s).str.split()
+    return tokens.map(lambda t: " ".join(w for w in t if w not in SUFFIXES) if len(t) > 1 else " ".join(t))
+
+def position_group(s: pd.Series) -> pd.Series:
+    return s.fillna("").astype(str).str.strip().str.upper().map(POSITION_GROUPS)
+
+def name_signatures(names: pd.Series, bits: int = SIGNATURE_BITS) -> np.ndarray:
+    """One row of bits/64 uint64 words per name, with a bit set for each character trigram of ' name '."""
+    sig = np.zeros((len(names), bits // 64), dtype=np.uint64)
+    rows, cols = [], []
+    for i, name in enumerate(names):
+        padded = f" {name} "
+        for j in range(len(padded) - 2):
+            rows.append(i)
+            cols.append(zlib.crc32(padded[j:j + 3].encode()) % bits)
+    rows, cols = np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+    np.bitwise_or.at(sig, (rows, cols // 64), np.left_shift(np.uint64(1), (cols % 64).astype(np.uint64)))
+    return sig
+
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def _popcount(words: np.ndarray) -> np.ndarray:
+    # bits set per row; np.bitwise_count needs numpy 2
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int64)
+    return _POPCOUNT8[words.view(np.uint8)].sum(axis=1, dtype=np.int64)
+
+def name_similarity(a_names: pd.Series, b_names: pd.Series, a_sig: np.ndarray, b_sig: np.ndarray) -> np.ndarray:
+    """Score in [0, 1] for aligned pairs: 0.7 trigram Jaccard + 0.2 same last token + 0.1 same first initial."""
+    inter = _popcount(a_sig & b_sig)
+    union = _popcount(a_sig | b_sig)
+    jaccard = np.divide(inter, union, out=np.zeros(len(inter)), where=union > 0)
+    a_tok, b_tok = a_names.str.split(), b_names.str.split()
+    last = (a_tok.str[-1].to_numpy() == b_tok.str[-1].to_numpy())
+    first = (a_names.str[:1].to_numpy() == b_names.str[:1].to_numpy())
+    return 0.7 * jaccard + 0.2 * last + 0.1 * first
+
+def load_rosters(rawdir: Path, seasons) -> pd.DataFrame:
+    frames = [pd.read_csv(Path(rawdir) / str(y) / "rosters.csv", dtype={"player_id": "Int32", "team_id": "Int32"})
+              for y in sorted(set(seasons)) if (Path(rawdir) / str(y) / "rosters.csv").exists()]
+    if not frames:
+        return pd.DataFrame(columns=["season", "player_id", "player_name", "team_name", "position"])
+    return pd.concat(frames, ignore_index=True)
+
+def candidates(transfers: pd.DataFrame, rosters: pd.DataFrame, by_position: bool) -> pd.DataFrame:
+    """Transfer x roster pairs sharing a block: (school, season) on either side, plus position group if by_position."""
+    pairs = []
+    for side, school, offset in [("to", "school_transferred_to", 0), ("from", "school_transferred_from", -1)]:
+        left = pd.DataFrame({"t": np.arange(len(transfers)), "school": transfers[f"{school}_norm"].to_numpy(),
+                             "season": transfers["year"].to_numpy(dtype="float64") + offset,
+                             "group": transfers["group"].to_numpy()})
+        keys = ["school", "season"] + (["group"] if by_position else [])
+        if by_position:
+            left = left[left["group"].notna()]
+        right = pd.DataFrame({"r": np.arange(len(rosters)), "school": rosters["school_norm"].to_numpy(),
+                              "season": rosters["season"].to_numpy(dtype="float64"),
+                              "group": rosters["group"].to_numpy()})
+        p = left.merge(right, on=keys, how="inner")[["t", "r"]]
+        p["side"] = side
+        pairs.append(p)
+    return pd.concat(pairs, ignore_index=True)
+
+def score_pairs(pairs: pd.DataFrame, transfers: pd.DataFrame, rosters: pd.DataFrame, t_sig, r_sig) -> pd.DataFrame:
+    """Best score per (transfer, player), with the sides it was found on and the both-rosters bonus."""
+    t, r = pairs["t"].to_numpy(), pairs["r"].to_numpy()
+    pairs = pairs.assign(player_id=rosters["player_id"].to_numpy()[r],
+                         score=name_similarity(transfers["name_norm"].iloc[t].reset_index(drop=True),
+                                               rosters["name_norm"].iloc[r].reset_index(drop=True),
+                                               t_sig[t], r_sig[r]))
+    best = pairs.sort_values("score", ascending=False, kind="stable").groupby(["t", "player_id"], sort=False)
+    per = best.agg(score=("score", "max"), r=("r", "first"), sides=("side", lambda s: "+".join(sorted(set(s)))))
+    per = per.reset_index()
+    both = per["sides"].str.contains("+", regex=False)
+    per["score"] = np.minimum(1.0, per["score"] + BOTH_ROSTERS_BONUS * both)
+    return per
+
+def pick(per: pd.DataFrame, n: int, threshold: float, min_margin: float) -> pd.DataFrame:
+    """Per transfer row: the best player, its margin over the runner-up, and matched/ambiguous/unmatched."""
+    per = per.sort_values(["t", "score"], ascending=[True, False], kind="stable")
+    first = per.groupby("t", sort=False).head(1).set_index("t")
+    second = per.groupby("t", sort=False)["score"].nth(1)
+    second = pd.Series(second.to_numpy(dtype="float64"), index=per.loc[second.index, "t"].to_numpy())
+    out = first.reindex(np.arange(n))
+    out["candidates"] = per.groupby("t").size().reindex(np.arange(n), fill_value=0)
+    out["score"] = out["score"].astype("float64")
+    out["margin"] = out["score"] - second.reindex(out.index).fillna(0.0)
+    # ambiguous: a confident name, but another player on the roster fits (almost) as well
+    confident = out["score"].ge(threshold)
+    out["status"] = np.where(confident & out["margin"].ge(min_margin), "matched",
+                             np.where(confident, "ambiguous", "unmatched"))
+    return out
+
+def resolve(transfers: pd.DataFrame, rosters: pd.DataFrame, threshold: float = THRESHOLD,
+            min_margin: float = MIN_MARGIN) -> pd.DataFrame:
+    """A mapping row (MAPPING_COLUMNS) for every transfer; player_id only where status == 'matched'."""
+    transfers = transfers.reset_index(drop=True).assign(
+        school_transferred_to_norm=lambda d: normalize_school(d["school_transferred_to"]),
+        school_transferred_from_norm=lambda d: normalize_school(d["school_transferred_from"]),
+        name_norm=lambda d: normalize_name(d["player_name"]), group=lambda d: position_group(d["position"]))
+    rosters = rosters.reset_index(drop=True).assign(
+        school_norm=lambda d: normalize_school(d["team_name"]), name_norm=lambda d: normalize_name(d["player_name"]),
+        group=lambda d: position_group(d["position"]))
+    t_sig, r_sig = name_signatures(transfers["name_norm"]), name_signatures(rosters["name_norm"])
+
+    n = len(transfers)
+    result = pick(pd.DataFrame(columns=["t", "player_id", "score", "r", "sides"]), n, threshold, min_margin)
+    # no roster rows, no candidates: every transfer stays unmatched
+    todo = np.arange(n) if len(rosters) else np.arange(0)
+    # same position group first; the whole roster only for what that leaves unmatched
+    for by_position in (True, False):
+        if not len(todo):
+            break
+        sub = transfers.iloc[todo]
+        pairs = candidates(sub, rosters, by_position)
+        pairs["t"] = todo[pairs["t"].to_numpy()]
+        per = score_pairs(pairs, transfers, rosters, t_sig, r_sig)
+        got = pick(per, n, threshold, min_margin).loc[todo]
+        better = got["status"].eq("matched") | result.loc[todo, "status"].eq("unmatched")
+        result.loc[todo[better.to_numpy()]] = got[better.to_numpy()]
+        todo = todo[~result.loc[todo, "status"].eq("matched").to_numpy()]
+
+    r = result["r"].to_numpy(dtype="float64")
+    # a transfer without a best candidate points at a null row past the end of the roster
+    ri = np.where(np.isnan(r), len(rosters), r).astype(np.int64)
+    at = lambda col, dtype, null: np.append(rosters[col].to_numpy(dtype=dtype), null)[ri]
+    out = pd.DataFrame({
+        "transfer_id": transfers["transfer_id"].to_numpy(),
+        "player_id": pd.array(np.where(result["status"].eq("matched"), result["player_id"], pd.NA), dtype="Int32"),
+        "status": result["status"].to_numpy(),
+        "score": result["score"].to_numpy(dtype="float64"), "margin": result["margin"].to_numpy(dtype="float64"),
+        "sides": result["sides"].to_numpy(dtype=object),
+        "roster_name": at("player_name", object, None),
+        "team_name": at("team_name", object, None),
+        "season": pd.array(at("season", "float64", np.nan), dtype="Int16"),
+        "candidates": result["candidates"].to_numpy(dtype="int64"),
+        "resolved_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    })
+    return out[MAPPING_COLUMNS]
+
+def update_mapping(store: TransferStore, rawdir: Path, path: Path, threshold: float = THRESHOLD,
+                   min_margin: float = MIN_MARGIN, rerun_all: bool = False) -> tuple:
+    """Resolve the store's transfers that have no match in the mapping at `path` yet; returns (mapping, resolved now)."""
+    # every transfer ever listed, in its latest version
+    h = store.history()
+    transfers = h.sort_values("valid_from", kind="stable").drop_duplicates("transfer_id", keep="last")
+    old = pd.read_parquet(path) if Path(path).exists() and not rerun_all else pd.DataFrame(columns=MAPPING_COLUMNS)
+    done = set(old.loc[old["status"] == "matched", "transfer_id"])
+    todo = transfers[~transfers["transfer_id"].isin(done)]
+    years = todo["year"].dropna().astype(int)
+    seasons = sorted(set(years) | set(years - 1))
+    missing = [y for y in seasons if not (Path(rawdir) / str(y) / "rosters.csv").exists()]
+    if missing:
+        print(f"Warning: no rosters.csv under {rawdir} for season(s) {', '.join(map(str, missing))}; "
+              "transfers only found there stay unmatched", file=sys.stderr)
+    rosters = load_rosters(rawdir, seasons)
+    new = resolve(todo, rosters, threshold, min_margin)
+    mapping = pd.concat([old[old["transfer_id"].isin(done)], new], ignore_index=True) if len(old) else new
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    mapping.to_parquet(path, index=False)
+    return mapping, new
+
+def main():
+    ap = argparse.ArgumentParser(description="Link transfer records to roster player_ids")
+    ap.add_argument("--store", type=str, default=str(REPO / "transfer_list" / "store"))
+    ap.add_argument("--rawdir", type=str, default=str(REPO / "data_extraction" / "data" / "raw"),
+                    help="rosters.csv per season under <rawdir>/<season>/")
+    ap.add_argument("--out", type=str, default=None, help="mapping parquet (default: <store>/player_ids.parquet)")
+    ap.add_argument("--threshold", type=float, default=THRESHOLD)
+    ap.add_argument("--min-margin", type=float, default=MIN_MARGIN)
+    ap.add_argument("--rerun-all", action="store_true", help="resolve every transfer again, matched ones included")
+    args = ap.parse_args()
+
+    store = TransferStore(Path(args.store))
+    out = Path(args.out) if args.out else Path(args.store) / "player_ids.parquet"
+    mapping, new = update_mapping(store, Path(args.rawdir), out, args.threshold, args.min_margin, args.rerun_all)
+    counts = new["status"].value_counts().to_dict()
+    print(f"Resolved {len(new)} transfer(s): {counts.get('matched', 0)} matched, "
+          f"{counts.get('ambiguous', 0)} ambiguous, {counts.get('unmatched', 0)} unmatched")
+    print(f"{int((mapping['status'] == 'matched').sum())}/{len(mapping)} transfers mapped -> {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+from __future__ import annotations
+import argparse, hashlib, json, re
+from datetime import datetime
+from pathlib import Path
+import numpy as np, pandas as pd, pyarrow as pa, pyarrow.parquet as pq
+
+from cfbd_cache import atomic_write
+
+# Transfer-list history as one delta store instead of a full CSV copy per snapshot.
+#
+#   <store>/manifest.json        snapshots in order: version, name, file sha1, taken_at, rows, added/removed/changed
+#   <store>/events/v00012.parquet  what snapshot 12 changed: 'open' rows (full record) and 'close' rows (id only)
+#
+# A transfer is identified by transfer_id, a hash of (player, year, from, to); its content by record_hash,
+# a hash of every field after normalisation, so '0.8600' and '0.86' or '2021.0' and '2021' are the same
+# record. A record version is valid from the snapshot that opened it up to (not including) the one that
+# closed it: an edited record is closed and reopened in the same snapshot, a dropped one only closed.
+# Snapshots identical to the previous one add no events, and appending one writes only its diff.
+
+REPO = Path(__file__).resolve().parents[2]
+SNAPSHOT_DIRS = [REPO / "transfer_list" / "Archive", REPO / "transfer_list" / "Current"]
+# every other column is text
+INTS = ["year", "hs_graduation_year"]
+FLOATS = ["transfer_rating_247", "transfer_rating_on3", "hs_rating_247", "hs_rating_rivals"]
+COLUMNS = ["player_name", "position", "year", "school_transferred_from", "school_transferred_to",
+           "transfer_rating_247", "transfer_rating_on3", "hs_rating_247", "hs_stars_247", "hs_rating_rivals",
+           "hs_stars_rivals", "hs_graduation_year"]
+IDENTITY = ["player_name", "year", "school_transferred_from", "school_transferred_to"]
+EVENT_KEYS = ["op", "version", "transfer_id", "record_hash"]
+# cfb_transfers_master_20250904_171334_*.csv; a few snapshots only carry the date
+STAMP = re.compile(r"(20\d{6})(?:_(\d{6}))?")
+
+def snapshot_time(path: Path) -> datetime:
+    """When a snapshot was taken, from the timestamp in its file name (start of day if there is no time)."""
+    m = STAMP.search(Path(path).stem)
+    if not m:
+        raise ValueError(f"no YYYYMMDD[_HHMMSS] timestamp in snapshot name {Path(path).name}")
+    return datetime.strptime(m.group(1) + (m.group(2) or "000000"), "%Y%m%d%H%M%S")
+
+def list_snapshots(dirs=SNAPSHOT_DIRS) -> list:
+    """Every cfb_transfers_master_*.csv under dirs, oldest first (ties by name)."""
+    paths = [p for d in dirs for p in Path(d).glob("cfb_transfers_master_*.csv")]
+    return sorted(paths, key=lambda p: (snapshot_time(p), p.name))
+
+def read_snapshot(path: Path) -> pd.DataFrame:
+    """A snapshot CSV with typed, normalised columns plus its transfer_id and record_hash."""
+    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    extra = [c for c in df.columns if c not in COLUMNS]
+    out = {}
+    for c in COLUMNS + extra:
+        s = df[c] if c in df.columns else pd.Series("", index=df.index)
+        if c in INTS:
+            out[c] = pd.to_numeric(s.str.strip().replace("", None)).round().astype("Int16")
+        elif c in FLOATS:
+            out[c] = pd.to_numeric(s.str.strip().replace("", None)).astype("float64")
+        else:
+            # collapse runs of whitespace, then blank -> null
+            s = s.str.split().str.join(" ")
+            out[c] = s.where(s != "").astype("string")
+    df = pd.DataFrame(out)
+    # the same transfer twice in one snapshot stays two records
+    ident = pd.DataFrame({c: _canonical(df[c]).str.casefold() for c in IDENTITY})
+    ident["n"] = ident.groupby(IDENTITY, sort=False).cumcount().astype(str)
+    df.insert(0, "transfer_id", _hash(ident))
+    df.insert(1, "record_hash", _hash(pd.DataFrame({c: _canonical(df[c]) for c in COLUMNS + extra})))
+    return df
+
+def _canonical(s: pd.Series) -> pd.Series:
+    # one text form per value: floats in shortest round-trip repr, nulls empty
+    if s.dtype == "float64":
+        return s.map(repr).where(s.notna(), "")
+    return s.astype("string").fillna("")
+
+def _hash(parts: pd.DataFrame) -> pd.Series:
+    # blake2b, not pandas' hash_pandas_object: the hashes are persisted and must not change with library versions
+    text = parts.iloc[:, 0].str.cat([parts[c] for c in parts.columns[1:]], sep="\x1f")
+    return pd.Series([hashlib.blake2b(t.encode(), digest_size=8).hexdigest() for t in text], index=parts.index,
+                     dtype="string")
+
+class TransferStore:
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.events_dir = self.root / "events"
+        try:
+            self.manifest = json.loads((self.root / "manifest.json").read_text())
+        except (OSError, ValueError):
+            self.manifest = {"snapshots": []}
+        self._history = None
+        self._current = None
+
+    @property
+    def snapshots(self) -> list:
+        return self.manifest["snapshots"]
+
+    def version(self, ref) -> int:
+        """A snapshot version from its number or its name (file stem); 'latest' is the newest."""
+        if ref == "latest":
+            if not self.snapshots:
+                raise KeyError("the store is empty")
+            return self.snapshots[-1]["version"]
+        if isinstance(ref, int) or str(ref).isdigit():
+            v = int(ref)
+            if not 1 <= v <= len(self.snapshots):
+                raise KeyError(f"no snapshot version {v} (store has 1-{len(self.snapshots)})")
+            return v
+        for s in self.snapshots:
+            if s["name"] == ref or s["name"] == Path(str(ref)).stem:
+                return s["version"]
+        raise KeyError(f"no snapshot named {ref!r}")
+
+    def history(self) -> pd.DataFrame:
+        """Every record version with valid_from and valid_to (null: still current)."""
+        if self._history is None:
+            files = sorted(self.events_dir.glob("v*.parquet"))
+            if not files:
+                return pd.DataFrame(columns=["transfer_id", "record_hash", "valid_from", "valid_to"] + COLUMNS)
+            ev = pa.concat_tables([pq.read_table(f) for f in files], promote_options="default").to_pandas(
+                types_mapper={pa.string(): pd.StringDtype()}.get)
+            # per transfer, events in version order with a close before the reopen of the same version:
+            # an open is valid up to the next event of its transfer, which is always a close
+            ev = ev.sort_values(["transfer_id", "version", "op"], kind="stable").reset_index(drop=True)
+            nxt = ev.groupby("transfer_id", sort=False)["version"].shift(-1)
+            ev["valid_to"] = nxt.astype("Int32")
+            opens = ev[ev["op"] == "open"].drop(columns="op").rename(columns={"version": "valid_from"})
+            front = ["transfer_id", "record_hash", "valid_from", "valid_to"]
+            self._history = opens[front + [c for c in opens.columns if c not in front]].reset_index(drop=True)
+        return self._history
+
+    def current(self) -> pd.Series:
+        """record_hash of every transfer in the newest snapshot, by transfer_id."""
+        if self._current is None:
+            h = self.history()
+            cur = h[h["valid_to"].isna()] if len(h) else h
+            self._current = pd.Series(cur["record_hash"].to_numpy(dtype=object), index=pd.Index(cur["transfer_id"], dtype=object))
+        return self._current
+
+    def as_of(self, ref) -> pd.DataFrame:
+        """The transfer list as it was in one snapshot."""
+        v = self.version(ref)
+        h = self.history()
+        live = (h["valid_from"] <= v) & (h["valid_to"].isna() | (h["valid_to"] > v).fillna(False))
+        return h[live].drop(columns=["valid_from", "valid_to"]).sort_values(IDENTITY, kind="stable").reset_index(drop=True)
+
+    def changes(self, ref_from, ref_to) -> pd.DataFrame:
+        """Transfers added, removed or changed from one snapshot to another (change, changed_columns, record)."""
+        x, y = self.version(ref_from), self.version(ref_to)
+        h = self.history()
+        # only transfers with an event in between can differ
+        lo, hi = min(x, y), max(x, y)
+        touched = h.loc[((h["valid_from"] > lo) & (h["valid_from"] <= hi)) |
+                        ((h["valid_to"] > lo) & (h["valid_to"] <= hi)).fillna(False), "transfer_id"].unique()
+        a, b = self.as_of(x), self.as_of(y)
+        a, b = a[a["transfer_id"].isin(touched)], b[b["transfer_id"].isin(touched)]
+        m = a.merge(b, on="transfer_id", how="outer", suffixes=("_from", "_to"), indicator=True)
+        fields = [c for c in a.columns if c not in ("transfer_id", "record_hash")]
+        change = np.select([m["_merge"].eq("right_only"), m["_merge"].eq("left_only"),
+                            m["record_hash_from"].ne(m["record_hash_to"]).fillna(False).astype(bool)],
+                           ["added", "removed", "changed"], "same")
+        m = m[change != "same"]
+        change = change[change != "same"]
+        out = pd.DataFrame({"change": change, "transfer_id": m["transfer_id"].to_numpy()}, index=m.index)
+        names = pd.Series("", index=m.index, dtype=object)
+        for c in fields:
+            same = m[f"{c}_from"].eq(m[f"{c}_to"]).fillna(False) | (m[f"{c}_from"].isna() & m[f"{c}_to"].isna())
+            names = names.where(same.to_numpy(dtype=bool), names + "," + c)
+        out["changed_columns"] = np.where(out["change"] == "changed", names.str[1:], "")
+        for c in fields:
+            # the newer version of each record (the removed one for removals)
+            out[c] = m[f"{c}_to"].where(out["change"] != "removed", m[f"{c}_from"])
+        return out.sort_values(["change"] + IDENTITY, kind="stable").reset_index(drop=True)
+
+    def append(self, path: Path, name: str = None, taken_at: datetime = None) -> dict:
+        """Add one snapshot after the newest; writes only what changed. Returns its manifest entry.
+
+        A file already in the store (same sha1) is skipped and its existing entry returned.
+        """
+        path = Path(path)
+        sha1 = hashlib.sha1(path.read_bytes()).hexdigest()
+        for s in self.snapshots:
+            if s["sha1"] == sha1 and s["name"] == (name or path.stem):
+                return {**s, "skipped": True}
+        taken_at = taken_at or snapshot_time(path)
+        if self.snapshots and taken_at < datetime.fromisoformat(self.snapshots[-1]["taken_at"]):
+            raise ValueError(f"{path.name} ({taken_at}) is older than the newest snapshot "
+                             f"{self.snapshots[-1]['name']} ({self.snapshots[-1]['taken_at']}); snapshots are append-only")
+        new = read_snapshot(path)
+        cur_hash = self.current()
+        version = len(self.snapshots) + 1
+
+        old_ids = cur_hash.index
+        new_ids = pd.Index(new["transfer_id"].to_numpy(dtype=object))
+        kept = new_ids.isin(old_ids)
+        changed = kept & (cur_hash.reindex(new_ids).to_numpy() != new["record_hash"].to_numpy())
+        added = ~kept
+        removed = ~old_ids.isin(new_ids)
+        opens = new[added | changed].assign(op="open", version=version)
+        closes = pd.DataFrame({"op": "close", "version": version,
+                               "transfer_id": np.concatenate([old_ids[removed].to_numpy(), new_ids[changed].to_numpy()]),
+                               "record_hash": np.concatenate([cur_hash[removed].to_numpy(),
+                                                              cur_hash.reindex(new_ids[changed]).to_numpy()])})
+        events = pd.concat([closes.astype({"transfer_id": "string", "record_hash": "string"}), opens], ignore_index=True)
+        if len(events):
+            self.events_dir.mkdir(parents=True, exist_ok=True)
+            events = events[EVENT_KEYS + [c for c in events.columns if c not in EVENT_KEYS]]
+            pq.write_table(pa.Table.from_pandas(events.astype({"version": "int32"}), preserve_index=False),
+                           self.events_dir / f"v{version:05d}.parquet")
+        entry = {"version": version, "name": path.stem, "sha1": sha1, "taken_at": taken_at.isoformat(),
+                 "rows": len(new), "added": int(added.sum()), "removed": int(removed.sum()),
+                 "changed": int(changed.sum())}
+        if name:
+            entry["name"] = name
+        self.snapshots.append(entry)
+        atomic_write(self.root / "manifest.json", json.dumps(self.manifest, indent=1))
+        # the newest state is the new snapshot itself; the full history is rebuilt when next asked for
+        self._current = pd.Series(new["record_hash"].to_numpy(dtype=object), index=new_ids)
+        self._history = None
+        return entry
+
+def main():
+    ap = argparse.ArgumentParser(description="Transfer-list snapshots as one delta store")
+    ap.add_argument("--store", type=str, default=str(REPO / "transfer_list" / "store"))
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("ingest", help="append every snapshot not yet in the store (default: Archive + Current), oldest first")
+    p.add_argument("paths", nargs="*", help="snapshot CSVs or directories")
+    p = sub.add_parser("append", help="append one new snapshot")
+    p.add_argument("path")
+    p.add_argument("--name", default=None, help="version name (default: the file stem)")
+    sub.add_parser("log", help="list the snapshot versions")
+    p = sub.add_parser("asof", help="the transfer list as of one snapshot (version number, name or 'latest')")
+    p.add_argument("ref")
+    p.add_argument("--out", default=None, help="write it as CSV here")
+    p = sub.add_parser("diff", help="transfers added/removed/changed between two snapshots")
+    p.add_argument("ref_from")
+    p.add_argument("ref_to", nargs="?", default="latest")
+    p.add_argument("--out", default=None, help="write the changes as CSV here")
+    args = ap.parse_args()
+
+    store = TransferStore(Path(args.store))
+    if args.cmd in ("ingest", "append"):
+        if args.cmd == "append":
+            entries = [store.append(Path(args.path), args.name)]
+        else:
+            dirs = [Path(p) for p in args.paths if Path(p).is_dir()] or (SNAPSHOT_DIRS if not args.paths else [])
+            files = [Path(p) for p in args.paths if Path(p).is_file()]
+            paths = sorted(set(list_snapshots(dirs) + files), key=lambda p: (snapshot_time(p), p.name))
+            entries = [store.append(p) for p in paths]
+        for e in entries:
+            state = "already stored" if e.get("skipped") else f"+{e['added']} -{e['removed']} ~{e['changed']}"
+            print(f"v{e['version']:<4} {e['name']:<70} {e['rows']:5d} rows  {state}")
+    elif args.cmd == "log":
+        for e in store.snapshots:
+            print(f"v{e['version']:<4} {e['taken_at']}  {e['name']:<70} {e['rows']:5d} rows  "
+                  f"+{e['added']} -{e['removed']} ~{e['changed']}")
+        events = sorted(store.events_dir.glob("v*.parquet"))
+        print(f"{len(store.snapshots)} snapshots, {len(store.history())} record versions, "
+              f"{sum(f.stat().st_size for f in events) / 1024:.0f} KiB of events")
+    else:
+        df = store.as_of(args.ref) if args.cmd == "asof" else store.changes(args.ref_from, args.ref_to)
+        if args.out:
+            df.to_csv(args.out, index=False)
+            print(f"Wrote {len(df)} rows to {args.out}")
+        else:
+            print(df.to_string(index=False, max_rows=60))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+from __future__ import annotations
+import sys
+from pathlib import Path
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+import argparse, gc, json, os, platform, resource, subprocess, tempfile, time, tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import numpy as np, pandas as pd, pyarrow as pa
+
+from cfb_analytics.etl.common import load_pbp, enrich_pbp, pbp_path
+from cfb_analytics.etl.passing import assemble_passing, PASSING
+from cfb_analytics.etl.rushing import assemble_rushing, RUSHING
+from cfb_analytics.etl.receiving import assemble_receiving, RECEIVING
+from cfb_analytics.etl.defense import assemble_defense, DEFENSE
+from cfb_analytics.etl.team import assemble_team_season, TEAM
+from cfb_analytics.ep_model import compute_epa, ep_lookup
+from cfb_analytics.rosters import RosterIndex
+from cfb_analytics.metrics import partials
+from cfb_analytics.weekly import assemble_weekly, game_weeks
+from cfb_analytics.uncertainty import intervals
+from cfb_analytics.output import write_table
+from cfb_analytics.streaming import stream_totals
+from cfb_analytics import validation
+
+# Scaling benchmark on synthetic seasons (data_extraction/scripts/synth_pbp.py).
+# A scale is SEASONSxTEAMS: 1x130 is one season about the size of a real one (~165k plays),
+# 20x1300 is twenty seasons ten times that (~33M plays). Every stage runs once per season,
+# as build_range does; seconds are summed over seasons, peak memory is the largest season's.
+# Results are written as JSON; --baseline compares with an earlier file and exits 1 on a regression.
+
+SYNTH = ROOT.parent / "data_extraction" / "scripts" / "synth_pbp.py"
+FIRST_SEASON = 2001
+ASSEMBLERS = {"passing": assemble_passing, "rushing": assemble_rushing,
+              "receiving": assemble_receiving, "defense": assemble_defense, "team_season": assemble_team_season}
+
+# stages this small are mostly timer/allocator noise; they are reported but never flagged
+NOISE_FLOOR = {"seconds": 0.01, "peak_mib": 1.0}
+
+def parse_scale(text: str) -> tuple:
+    seasons, _, teams = text.lower().partition("x")
+    return int(seasons), int(teams or 130)
+
+def ensure_data(datadir: Path, seasons: int, teams: int) -> Path:
+    """Synthetic seasons for this team count, generated on first use and reused afterwards."""
+    rawdir = datadir / f"teams{teams}"
+    cmd = [sys.executable, str(SYNTH), "--rawdir", str(rawdir.resolve()), "--teams", str(teams),
+           "--start", str(FIRST_SEASON), "--end", str(FIRST_SEASON + seasons - 1)]
+    subprocess.run(cmd, check=True, cwd=SYNTH.parent)
+    return rawdir
+
+def measure(fn, repeat: int = 1, memory: bool = True) -> tuple:
+    """(best seconds of `repeat` runs, peak MiB allocated during one extra traced run, or None)."""
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    peak = None
+    if memory:
+        # a separate run: tracemalloc slows allocation-heavy code too much to time under it
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+def assemble_concurrent(pbp, rosters, parts, season) -> dict:
+    with ThreadPoolExecutor(max_workers=len(ASSEMBLERS)) as pool:
+        futures = {t: pool.submit(f, pbp, rosters, parts, season) for t, f in ASSEMBLERS.items()}
+        return {t: f.result() for t, f in futures.items()}
+
+def season_stages(rawdir: Path, season: int, outdir: Path, formats, ctx: dict) -> list:
+    """(name, fn) in pipeline order; each fn leaves its output in ctx for the later stages."""
+    def put(key, fn):
+        def run():
+            ctx[key] = fn()
+        return run
+
+    parts = pd.DataFrame()
+    stages = [
+        ("load_pbp", put("pbp", lambda: load_pbp(pbp_path(rawdir, season), season=season))),
+        ("load_rosters", put("rosters", lambda: RosterIndex.load(rawdir, [season]))),
+        ("compute_epa", lambda: compute_epa(ctx["pbp"], ep_lookup())),
+        ("enrich_pbp", put("enriched", lambda: enrich_pbp(ctx["pbp"]))),
+    ]
+    for t, assemble in ASSEMBLERS.items():
+        stages.append((f"assemble_{t}", put(t, lambda f=assemble: f(ctx["enriched"], ctx["rosters"], parts, season))))
+    # every receiver's game, last-3 and to-date rows from one grouping by game
+    stages.append(("weekly_receiving", lambda: assemble_weekly(
+        assemble_receiving, partials(ctx["enriched"], RECEIVING), game_weeks(ctx["enriched"]), RECEIVING,
+        ctx["rosters"], season)))
+    # 1000 Poisson-bootstrap replicates of every passing rate (build --intervals)
+    stages.append(("intervals_passing", lambda: intervals(ctx["enriched"], PASSING)))
+    # one thread per table, as build_season runs them: ideally about the slowest single one
+    stages.append(("assemble_concurrent", lambda: assemble_concurrent(ctx["enriched"], ctx["rosters"], parts, season)))
+    stages.append(("validate", lambda: validation.validate({t: ctx[t] for t in ASSEMBLERS})))
+    for fmt in formats:
+        stages.append((f"write_{fmt}", lambda fmt=fmt: [write_table(ctx[t], t, season, outdir, (fmt,)) for t in ASSEMBLERS]))
+    # out-of-core alternative to load_pbp + enrich_pbp + grouping: every table's totals in one batched pass
+    stages.append(("stream_totals", lambda: stream_totals(pbp_path(rawdir, season), [PASSING, RUSHING, RECEIVING, DEFENSE, TEAM],
+                                                          season=season)))
+    return stages
+
+def run_scale(rawdir: Path, seasons: int, repeat: int = 1, memory: bool = True, formats=("parquet",)) -> dict:
+    stages, plays = {}, 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for season in range(FIRST_SEASON, FIRST_SEASON + seasons):
+            ctx = {}
+            for name, fn in season_stages(rawdir, season, Path(tmp), formats, ctx):
+                seconds, peak = measure(fn, repeat, memory)
+                s = stages.setdefault(name, {"seconds": 0.0, "peak_mib": None})
+                s["seconds"] += seconds
+                if peak is not None:
+                    s["peak_mib"] = max(s["peak_mib"] or 0.0, peak)
+            plays += len(ctx["pbp"])
+    for s in stages.values():
+        s["plays_per_second"] = plays / s["seconds"] if s["seconds"] else None
+    # process high-water mark so far (includes Arrow buffers, which tracemalloc doesn't see)
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+    return {"plays": plays, "seconds": sum(s["seconds"] for s in stages.values()), "max_rss_mib": max_rss,
+            "stages": stages}
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"created": datetime.now(timezone.utc).isoformat(timespec="seconds"), "commit": commit,
+            "python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+            "pyarrow": pa.__version__, "platform": platform.platform(), "cpus": os.cpu_count()}
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """Stages slower (or using more memory) than the baseline by more than `tolerance`, as printable lines."""
+    regressions = []
+    for scale, r in result["scales"].items():
+        old = baseline.get("scales", {}).get(scale)
+        if old is None:
+            continue
+        for name, s in r["stages"].items():
+            o = old["stages"].get(name)
+            if o is None:
+                continue
+            for key, unit in [("seconds", "s"), ("peak_mib", " MiB")]:
+                if s.get(key) is None or not o.get(key) or max(s[key], o[key]) < NOISE_FLOOR[key]:
+                    continue
+                ratio = s[key] / o[key]
+                mark = "REGRESSION" if ratio > 1 + tolerance else ""
+                print(f"{scale:>9} {name:<20} {key:<9} {o[key]:10.3f}{unit} -> {s[key]:10.3f}{unit}  x{ratio:5.2f} {mark}")
+                if mark:
+                    regressions.append(f"{scale} {name} {key} x{ratio:.2f}")
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser(description="Time and memory-profile the pipeline stages on synthetic seasons")
+    ap.add_argument("--scales", nargs="+", default=["1x130", "5x130", "20x130"],
+                    help="SEASONSxTEAMS, e.g. 1x130 (one real-size season) or 20x1300 (~33M plays)")
+    ap.add_argument("--datadir", type=str, default="data/synthetic", help="where the synthetic seasons are kept")
+    ap.add_argument("--out", type=str, default=None, help="result JSON (default: benchmarks/<timestamp>.json)")
+    ap.add_argument("--baseline", type=str, default=None, help="earlier result JSON to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown/memory growth vs the baseline")
+    ap.add_argument("--repeat", type=int, default=1, help="timed runs per stage (best is kept)")
+    ap.add_argument("--no-memory", action="store_true", help="skip the traced run that measures peak memory")
+    ap.add_argument("--formats", nargs="+", default=["parquet", "feather", "csv"], choices=["parquet", "feather", "csv"])
+    args = ap.parse_args()
+
+    result = {**environment(), "settings": {"repeat": args.repeat, "memory": not args.no_memory,
+                                            "formats": args.formats}, "scales": {}}
+    for scale in args.scales:
+        seasons, teams = parse_scale(scale)
+        rawdir = ensure_data(Path(args.datadir), seasons, teams)
+        print(f"=== {scale}: {seasons} season(s), {teams} teams ===")
+        r = result["scales"][f"{seasons}x{teams}"] = {"seasons": seasons, "teams": teams,
+                                                      **run_scale(rawdir, seasons, args.repeat, not args.no_memory, args.formats)}
+        print(f"{r['plays']} plays, {r['seconds']:.2f}s")
+        for name, s in r["stages"].items():
+            mem = f"{s['peak_mib']:9.1f} MiB" if s["peak_mib"] is not None else ""
+            print(f"  {name:<20} {s['seconds']:8.3f}s {s['plays_per_second']:14,.0f} plays/s {mem}")
+
+    out = Path(args.out) if args.out else ROOT / "benchmarks" / f"{result['created'][:19].replace(':', '')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=1))
+    print("Wrote", out)
+
+    if args.baseline:
+        regressions = compare(result, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for r in regressions:
+                print(" -", r)
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
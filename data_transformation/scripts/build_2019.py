@@ -7,58 +7,67 @@ if str(SRC) not in sys.path:
     sys.path.insert(0, str(SRC))
 
 import argparse
-from cfb_analytics.etl.common import load_rosters, load_participation, load_pbp
-from cfb_analytics.etl.passing import assemble_passing
-from cfb_analytics.etl.rushing import assemble_rushing
-from cfb_analytics.etl.receiving import assemble_receiving
-from cfb_analytics.etl.defense import assemble_defense
-from cfb_analytics import validation
+from cfb_analytics.build import build_season, TABLES
+from cfb_analytics.instrument import Instrument, PROFILERS, print_report
+from cfb_analytics.streaming import BATCH_ROWS
+from cfb_analytics.uncertainty import REPLICATES
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument('--year', type=int, required=True)
     ap.add_argument('--outdir', type=str, required=True)
     ap.add_argument('--rawdir', type=str, default='../data_extraction/data/raw')
+    ap.add_argument('--formats', nargs='+', default=['parquet'], choices=['parquet', 'feather', 'csv'],
+                    help='output formats (typed by the players_*_schema_header/data_dictionary files)')
+    ap.add_argument('--tables', nargs='+', default=['passing'], choices=list(TABLES),
+                    help='player and team tables to build; each is grouped, validated and written on its own thread')
+    ap.add_argument('--threads', type=int, default=None,
+                    help='threads per season for the tables (default: one per table; 1 builds them in turn)')
+    ap.add_argument('--ep-model', type=str, default=None,
+                    help='fitted EP model artifact from scripts/fit_ep.py (default: the stub model)')
+    ap.add_argument('--partials', type=str, default=None,
+                    help='incremental mode: keep per-game sums here and only aggregate new/changed games')
+    ap.add_argument('--stream', type=int, nargs='?', const=BATCH_ROWS, default=None, metavar='ROWS',
+                    help=f'out-of-core mode: read pbp in game-aligned batches of about ROWS plays (default {BATCH_ROWS})')
+    ap.add_argument('--intervals', type=int, nargs='?', const=REPLICATES, default=None, metavar='N',
+                    help=f'bootstrap N replicates for <rate>_lo/<rate>_hi columns on the player tables (default {REPLICATES})')
+    ap.add_argument('--report', type=str, default=None,
+                    help='write a JSON run report (wall/CPU time, peak RSS, rows in/out per stage) here')
+    ap.add_argument('--profile', choices=PROFILERS, default=None,
+                    help='with --report: also dump a profile of the slowest stage next to the report')
     args = ap.parse_args()
+    if args.stream and args.partials:
+        ap.error('--stream and --partials are exclusive')
+    if args.stream and args.intervals:
+        ap.error('--stream and --intervals are exclusive')
 
-    year = args.year
-    raw = Path(args.rawdir)/str(year)
-    outdir = Path(args.outdir); outdir.mkdir(parents=True, exist_ok=True)
+    inst = Instrument(enabled=bool(args.report), profile=args.profile, command='build_2019', season=args.year)
+    summary = build_season(args.year, Path(args.rawdir), Path(args.outdir),
+                           partials_dir=Path(args.partials) if args.partials else None, formats=args.formats,
+                           ep_model=args.ep_model, instrument=inst, stream_rows=args.stream,
+                           tables=args.tables, threads=args.threads, intervals=args.intervals)
+    if summary['games']:
+        g = summary['games']
+        print(f"Games: {g['games']} ({g['new']} new, {g['changed']} changed, {g['removed']} removed)")
 
-    rosters = load_rosters(raw/'rosters.csv')
-    print('Rosters loaded successfully')
-    # parts   = load_participation(raw/'participation.csv') NEED TO ADD PARTICIPATION DATA
-    pbp     = load_pbp(raw/'pbp.parquet')
-    print('Play by play loaded successfully')
+    if 'passing' in summary['rows']:
+        print('Passing Stat Overview')
+        print('Number of players in passing dataset: ', summary['rows']['passing'])
+        for c, label in [('pass_yards', 'Max passing yards: '), ('pass_td', 'Max passing tds: ')]:
+            if c in summary['leaders']:
+                name, value = summary['leaders'][c]
+                print(label, name, ' ', value)
+    for t, n in summary['rows'].items():
+        if t != 'passing':
+            print(f"Number of {'rows' if t.startswith('team') else 'players'} in {t} dataset: ", n)
 
-    passing   = assemble_passing(pbp, rosters, [], year)
-    # running passing only for now, rushing, receiving, defense to be added later
-    # rushing   = assemble_rushing(pbp, rosters, parts, year)
-    # receiving = assemble_receiving(pbp, rosters, parts, year)
-    # defense   = assemble_defense(pbp, rosters, parts, year)
-
-    print('Passing Stat Overview')
-    print('Number of players in passing dataset: ', len(passing))
-    print('Max passing yards: ', passing.loc[passing['pass_yards'].idxmax(), 'player_name'], ' ', passing['pass_yards'].max())
-    print('Max passing tds: ', passing.loc[passing['pass_td'].idxmax(), 'player_name'], ' ', passing['pass_td'].max())
-
-    # Validate (basic)
-    issues = []
-    issues += validation.validate_passing(passing)
-    # issues += validation.validate_rushing(rushing)
-    # issues += validation.validate_receiving(receiving)
-    # issues += validation.validate_defense(defense)
-
-    passing.to_csv(outdir/f'players_passing_{year}.csv', index=False)
-    # rushing.to_csv(outdir/f'players_rushing_{year}.csv', index=False)
-    # receiving.to_csv(outdir/f'players_receiving_{year}.csv', index=False)
-    # defense.to_csv(outdir/f'players_defense_{year}.csv', index=False)
-
-    print('Wrote outputs to', outdir)
-    if issues:
+    print('Wrote outputs to', summary['outdir'])
+    if summary['issues']:
         print('Validation issues:')
-        for i in issues:
+        for i in summary['issues']:
             print(' -', i)
+    if args.report:
+        print_report(inst.write_report(args.report), args.report)
 
 if __name__ == '__main__':
     main()
@@ -1,12 +1,23 @@
 #!/usr/bin/env python
 from __future__ import annotations
-import argparse
+import sys
 from pathlib import Path
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+import argparse, time
 from subprocess import run, CalledProcessError
+from cfb_analytics.build import build_range, TABLES
+from cfb_analytics.instrument import Instrument, PROFILERS, print_report
+from cfb_analytics.streaming import BATCH_ROWS
+from cfb_analytics.uncertainty import REPLICATES
 
+# old mode: one build_2019.py subprocess per season (re-imports pandas/pyarrow every year)
 def run_year(year: int, outdir: Path, rawdir: Path):
     cmd = [
-        "python", "scripts/build_2019.py",
+        sys.executable, str(ROOT / "scripts" / "build_2019.py"),
         "--year", str(year),
         "--outdir", str(outdir / str(year)),
         "--rawdir", str(rawdir)
@@ -17,19 +28,77 @@ def run_year(year: int, outdir: Path, rawdir: Path):
     if rc.returncode != 0:
         raise CalledProcessError(rc.returncode, cmd)
 
+def print_summary(results: list, seconds: float):
+    print(f"\n=== Built {len(results)} season(s) in {seconds:.1f}s ===")
+    for r in results:
+        if "error" in r:
+            print(f"{r['season']}: FAILED {r['error']}")
+            continue
+        rows = ", ".join(f"{k}={v}" for k, v in r["rows"].items())
+        print(f"{r['season']}: {rows}  ({r['seconds']:.1f}s)  -> {r['outdir']}")
+        if r["games"]:
+            g = r["games"]
+            print(f"  games: {g['games']} ({g['new']} new, {g['changed']} changed, {g['removed']} removed)")
+        for i in r["issues"]:
+            print(f"  - {i}")
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--start", type=int, default=2019)
     ap.add_argument("--end", type=int, default=2024)  # inclusive
     ap.add_argument("--rawdir", type=str, default="data/raw")
     ap.add_argument("--outroot", type=str, default="data/processed")
+    ap.add_argument("--workers", type=int, default=None, help="seasons built in parallel (default: one per core)")
+    ap.add_argument("--formats", nargs="+", default=["parquet"], choices=["parquet", "feather", "csv"],
+                    help="output formats (typed by the players_*_schema_header/data_dictionary files)")
+    ap.add_argument("--tables", nargs="+", default=["passing"], choices=list(TABLES),
+                    help="player and team tables to build; each is grouped, validated and written on its own thread")
+    ap.add_argument("--threads", type=int, default=None,
+                    help="threads per season for the tables (default: one per table; 1 builds them in turn)")
+    ap.add_argument("--ep-model", type=str, default=None,
+                    help="fitted EP model artifact from scripts/fit_ep.py (default: the stub model)")
+    ap.add_argument("--partials", type=str, default=None,
+                    help="incremental mode: per-game sums kept under <partials>/<season>, only new/changed games aggregated")
+    ap.add_argument("--stream", type=int, nargs="?", const=BATCH_ROWS, default=None, metavar="ROWS",
+                    help=f"out-of-core mode: read pbp in game-aligned batches of about ROWS plays (default {BATCH_ROWS})")
+    ap.add_argument("--subprocess", action="store_true", help="old mode: run build_2019.py once per season, sequentially")
+    ap.add_argument("--intervals", type=int, nargs="?", const=REPLICATES, default=None, metavar="N",
+                    help=f"bootstrap N replicates for <rate>_lo/<rate>_hi columns on the player tables (default {REPLICATES})")
+    ap.add_argument("--report", type=str, default=None,
+                    help="write a JSON run report (wall/CPU time, peak RSS, rows in/out per stage and season) here")
+    ap.add_argument("--profile", choices=PROFILERS, default=None,
+                    help="with --report: also dump a profile of the slowest stage next to the report")
     args = ap.parse_args()
+    if args.stream and args.partials:
+        ap.error("--stream and --partials are exclusive")
+    if args.stream and args.intervals:
+        ap.error("--stream and --intervals are exclusive")
+    inst = Instrument(enabled=bool(args.report), profile=args.profile, command="build_range",
+                      seasons=[args.start, args.end], workers=args.workers)
 
     rawdir = Path(args.rawdir)
     outroot = Path(args.outroot)
+    years = range(args.start, args.end + 1)
+
+    if args.subprocess:
+        for yr in years:
+            # the child is a separate process: only its wall time is seen from here
+            with inst.stage("build_subprocess", season=yr):
+                run_year(yr, outroot, rawdir)
+        if args.report:
+            print_report(inst.write_report(args.report), args.report)
+        return
 
-    for yr in range(args.start, args.end + 1):
-        run_year(yr, outroot, rawdir)
+    t0 = time.perf_counter()
+    results = build_range(years, rawdir, outroot, workers=args.workers,
+                          partials_dir=Path(args.partials) if args.partials else None, formats=args.formats,
+                          ep_model=args.ep_model, instrument=inst, stream_rows=args.stream,
+                          tables=args.tables, threads=args.threads, intervals=args.intervals)
+    print_summary(results, time.perf_counter() - t0)
+    if args.report:
+        print_report(inst.write_report(args.report), args.report)
+    if any("error" in r for r in results):
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+from __future__ import annotations
+import sys
+from pathlib import Path
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+import argparse, os, subprocess
+
+# The incremental store (--partials) is only reused while incremental.spec_version is unchanged, so the
+# version has to come out the same in every interpreter; one that differs per process (e.g. a function
+# repr with its address) throws the store away on every build. This computes it in two fresh
+# interpreters for every table spec of the build and exits 1 if they disagree.
+
+def version_in_subprocess() -> str:
+    code = ("from cfb_analytics.build import TABLES; from cfb_analytics.incremental import spec_version; "
+            "print(spec_version(list({s.name: s for s, _ in TABLES.values()}.values())))")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                         env={**os.environ, "PYTHONPATH": str(SRC), "PYTHONHASHSEED": "random"})
+    return out.stdout.strip()
+
+def main():
+    argparse.ArgumentParser(description="Check that the partials spec version is stable across interpreter runs").parse_args()
+    first, second = version_in_subprocess(), version_in_subprocess()
+    if first != second:
+        print(f"spec_version differs between runs: {first} != {second}")
+        sys.exit(1)
+    print(f"spec_version stable across runs: {first}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+import sys
+from pathlib import Path
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+import argparse, time
+from cfb_analytics.ep_fit import fit_ep
+
+def main():
+    ap = argparse.ArgumentParser(description='Fit (or load, if already fit on the same data) the pooled EP model.')
+    ap.add_argument('--seasons', type=int, nargs='+', required=True)
+    ap.add_argument('--rawdir', type=str, default='../data_extraction/data/raw')
+    ap.add_argument('--artifacts', type=str, default='models/ep', help='model artifacts and per-season label counts')
+    ap.add_argument('--l2', type=float, default=1e-3, help='ridge penalty per play')
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    model, path = fit_ep(Path(args.rawdir), args.seasons, Path(args.artifacts), l2=args.l2)
+    print(f'EP model {model.key} for seasons {model.seasons} ({model.meta["plays"]} plays) in {time.perf_counter() - t0:.1f}s')
+    print('Artifact:', path)
+    print('Build with: --ep-model', path)
+
+if __name__ == '__main__':
+    main()
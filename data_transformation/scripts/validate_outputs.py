@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+from __future__ import annotations
+import sys
+from pathlib import Path
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+import argparse, time
+import pandas as pd
+from cfb_analytics.output import read_season, TABLES, TEAM_TABLES, WEEKLY_TABLES
+from cfb_analytics import validation
+
+# Check every rule in cfb_analytics.validation against built seasons (data/processed/<season>/),
+# all seasons of a table at once.
+
+def main():
+    ap = argparse.ArgumentParser(description="Validate built player and team tables; exit 1 on any violation")
+    ap.add_argument("--start", type=int, default=2019)
+    ap.add_argument("--end", type=int, default=2024)  # inclusive
+    ap.add_argument("--outroot", type=str, default="data/processed")
+    ap.add_argument("--tables", nargs="+", default=list(TABLES), choices=list(TABLES + TEAM_TABLES + WEEKLY_TABLES))
+    ap.add_argument("--out", type=str, default=None, help="write the violations (one row per rule and player) as CSV here")
+    args = ap.parse_args()
+
+    frames = {}
+    for year in range(args.start, args.end + 1):
+        for t, df in read_season(Path(args.outroot) / str(year), year, args.tables).items():
+            frames.setdefault(t, []).append(df)
+    tables = {t: pd.concat(dfs, ignore_index=True) for t, dfs in frames.items()}
+    if not tables:
+        sys.exit(f"no built tables for {args.start}-{args.end} under {args.outroot}")
+
+    t0 = time.perf_counter()
+    violations = validation.validate(tables)
+    seconds = time.perf_counter() - t0
+    rows = ", ".join(f"{t}={len(df)}" for t, df in tables.items())
+    print(f"Validated {rows} in {seconds * 1000:.1f} ms: {len(violations)} violation(s)")
+    for i in validation.issues(violations):
+        print(" -", i)
+    if args.out:
+        violations.to_csv(args.out, index=False)
+        print("Wrote", args.out)
+    if len(violations):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+import os, threading, time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+import pandas as pd
+
+from .etl.common import load_participation, load_pbp, enrich_pbp, pbp_path, pbp_columns
+from .etl.passing import assemble_passing, PASSING
+from .etl.rushing import assemble_rushing, RUSHING
+from .etl.receiving import assemble_receiving, RECEIVING
+from .etl.defense import assemble_defense, DEFENSE
+from .etl.team import assemble_team_season, assemble_team_game, TEAM
+from .incremental import PartialStore
+from .metrics import aggregate, combine, partials
+from .rosters import RosterIndex
+from .streaming import stream_accumulate
+from .ep_model import EPModel
+from .output import write_table
+from .weekly import assemble_weekly, game_weeks
+from .uncertainty import attach_intervals, intervals as rate_intervals
+from .instrument import Instrument
+from . import validation
+
+# table name -> (spec, assembler); the plays each spec reads (None: all plays)
+TABLES = {
+    'passing': (PASSING, assemble_passing),
+    'rushing': (RUSHING, assemble_rushing),
+    'receiving': (RECEIVING, assemble_receiving),
+    'defense': (DEFENSE, assemble_defense),
+    'team_season': (TEAM, assemble_team_season),
+    'team_game': (TEAM, assemble_team_game),
+}
+TABLE_PLAYS = {'passing': 'pass', 'rushing': 'rush', 'receiving': 'pass', 'defense': None,
+               'team_season': None, 'team_game': None}
+# tables summed per game as well as per key
+TABLE_GRAIN = {'team_game': ('game_id',)}
+# the player season tables, which can carry bootstrap intervals of their rates
+PLAYER_TABLES = ('passing', 'rushing', 'receiving', 'defense')
+# player-game time series of a player table (weekly.py): its spec and assembler over windows of games
+WEEKLY = {f'{t}_weekly': t for t in PLAYER_TABLES}
+TABLES.update({w: TABLES[t] for w, t in WEEKLY.items()})
+TABLE_PLAYS.update({w: TABLE_PLAYS[t] for w, t in WEEKLY.items()})
+
+def build_season(year: int, rawdir: Path, outdir: Path, rosters: RosterIndex = None, partials_dir: Path = None,
+                 formats=('parquet',), ep_model: Path = None, instrument: Instrument = None,
+                 stream_rows: int = None, tables=('passing',), threads: int = None, intervals: int = None) -> dict:
+    """Build and write one season's player tables; returns a summary (row counts, leaders, validation issues).
+
+    Rule violations (validation.validate_table) are also written to outdir/violations_<year>.csv.
+
+    rosters is a rosters.RosterIndex holding this season (a DataFrame is indexed first); by default
+    it is loaded from the roster cache under rawdir.
+    tables are names in TABLES. pbp is loaded and enriched once; then each table is grouped, joined
+    to the rosters, validated and written on its own thread (threads: pool size, default one per
+    table; 1 runs them in turn), so a table is written as soon as it is done. Each spec's per-game sums
+    (metrics.partials) are computed once and shared: the team-season totals (etl.team.TEAM), grouped
+    whenever receiving is built for its share metrics, and team_game come from the same partials.
+    The <table>_weekly tables are built from the same per-game sums as the season ones (weekly.py).
+    With partials_dir, per-game sums are kept in an incremental.PartialStore and only new or
+    changed games are aggregated; the season totals are merged from the store.
+    Tables are written in each of `formats` ('parquet', 'feather', 'csv'), typed by output.table_schema.
+    ep_model is a fitted EP artifact (scripts/fit_ep.py); it is loaded, never refit. Default: the stub.
+    instrument (instrument.Instrument) records each stage: load, EPA, grouping, roster join, validation, writes.
+    With stream_rows, pbp is never loaded whole: streaming.stream_totals reads it in batches of about that
+    many plays and folds them into the same totals (not combinable with partials_dir).
+    With intervals (a number of bootstrap replicates), the player season tables get <rate>_lo / <rate>_hi
+    columns for every rate (uncertainty.intervals, seeded by the season); they resample the plays, so
+    they need the whole season in memory and are not combinable with stream_rows.
+    """
+    if stream_rows and partials_dir is not None:
+        raise ValueError('stream_rows and partials_dir are exclusive')
+    if stream_rows and intervals:
+        raise ValueError('stream_rows and intervals are exclusive')
+    unknown = set(tables) - set(TABLES)
+    if unknown:
+        raise ValueError(f'unknown tables {sorted(unknown)}; expected some of {list(TABLES)}')
+    t0 = time.perf_counter()
+    inst = instrument or Instrument()
+    raw = Path(rawdir)/str(year)
+    outdir = Path(outdir); outdir.mkdir(parents=True, exist_ok=True)
+    # team totals are the denominators of the receiving share metrics
+    with_teams = 'receiving' in tables or 'team_season' in tables
+    specs = list({s.name: s for s in [TABLES[t][0] for t in tables] + ([TEAM] if with_teams else [])}.values())
+    # only pass plays if every table reads pass plays only (and so on), else all of them
+    plays = {TABLE_PLAYS[t] for t in tables} | ({None} if with_teams else set())
+    plays = plays.pop() if len(plays) == 1 else None
+
+    if rosters is None:
+        with inst.stage('load_rosters', season=year) as s:
+            rosters = RosterIndex.load(rawdir, [year])
+            if year not in rosters.bounds:
+                raise FileNotFoundError(raw/'rosters.csv')
+            s.rows_out = len(rosters)
+    rosters = RosterIndex.of(rosters)
+    # parts   = load_participation(raw/'participation.csv') NEED TO ADD PARTICIPATION DATA
+    parts = pd.DataFrame()
+    with inst.stage('load_ep_model', season=year):
+        model = EPModel.load(ep_model).for_season(year) if ep_model else None
+    # read just the plays and columns the tables use
+    pbp, games, store, streamed, game_parts = None, None, None, None, None
+    if not stream_rows:
+        with inst.stage('load_pbp', season=year) as s:
+            pbp = load_pbp(pbp_path(rawdir, year), columns=pbp_columns(*specs), season=year, plays=plays)
+            s.rows_out = len(pbp)
+    if stream_rows:
+        # load, EPA and grouping in one pass, one batch of plays in memory at a time
+        with inst.stage('stream_totals', season=year) as s:
+            keep = [TABLES[t][0].name for t in tables if t in TABLE_GRAIN or t in WEEKLY]
+            acc = stream_accumulate(pbp_path(rawdir, year), specs, season=year, plays=plays, model=model,
+                                    batch_rows=stream_rows)
+            streamed = {name: a.result() for name, a in acc.items()}
+            # per-game partials of the tables with a game grain
+            game_parts = {name: acc[name].parts() for name in keep}
+            s.rows_out = sum(len(t) for t in streamed.values())
+    elif partials_dir is not None:
+        with inst.stage('update_partials', rows_in=len(pbp), season=year) as s:
+            store = PartialStore(partials_dir, year)
+            games = store.update(pbp, specs, model=model)
+            s.rows_out = games['new'] + games['changed']
+        if intervals and any(t in PLAYER_TABLES for t in tables):
+            # the store only enriches new games; the bootstrap reweights every play
+            with inst.stage('enrich_pbp', rows_in=len(pbp), season=year) as s:
+                pbp = enrich_pbp(pbp, model)
+                s.rows_out = len(pbp)
+    else:
+        # EPA, success/explosive flags and role masks computed once and shared by every assembler
+        with inst.stage('enrich_pbp', rows_in=len(pbp), season=year) as s:
+            pbp = enrich_pbp(pbp, model)
+            s.rows_out = len(pbp)
+
+    # in memory, each spec's per-game sums are computed once and shared by every table built from it:
+    # team_season, team_game and the receiving denominators, and a season table and its weekly one
+    computed, locks = {}, {spec.name: threading.Lock() for spec in specs}
+
+    def parts_for(name, spec):
+        # per-game sums (metrics.partials) of a table
+        if streamed is not None:
+            return game_parts[spec.name]
+        if store is not None:
+            return store.load(spec)
+        with locks[spec.name]:
+            if spec.name not in computed:
+                with inst.stage('partials', rows_in=len(pbp), season=year, table=name) as s:
+                    computed[spec.name] = partials(pbp, spec)
+                    s.rows_out = sum(len(p) for p in computed[spec.name].values())
+        return computed[spec.name]
+
+    def totals_for(name, spec, by=()):
+        if streamed is not None:
+            return combine(game_parts[spec.name], spec, by, exact=True) if by else streamed[spec.name]
+        if store is not None:
+            with inst.stage('merge_partials', season=year, table=name) as s:
+                totals = store.totals(spec, by)
+                s.rows_out = len(totals)
+            return totals
+        if 'game_id' not in pbp.columns:
+            with inst.stage('aggregate', rows_in=len(pbp), season=year, table=name) as s:
+                totals = aggregate(pbp, spec, by=by)
+                s.rows_out = len(totals)
+            return totals
+        parts = parts_for(name, spec)
+        with inst.stage('aggregate', season=year, table=name) as s:
+            totals = combine(parts, spec, by)
+            s.rows_out = len(totals)
+        return totals
+
+    # team-season totals first: the receiving table joins them and team_season writes them
+    teams = totals_for('team_season', TEAM) if with_teams else None
+    notes = []
+    if with_teams and not len(teams):
+        # pbp mapped without rosters.csv (map_cfbd_pbp.py) has null offense_id/defense_id, or none at all
+        notes.append('no offense_id/defense_id in pbp: team tables are empty and receiving shares null '
+                     '(re-map the season with its rosters.csv)')
+    weeks = None
+    if any(t in WEEKLY for t in tables):
+        # without pbp in memory (streamed), just its game_id and week columns are read
+        weeks = game_weeks(pbp if pbp is not None else
+                           load_pbp(pbp_path(rawdir, year), columns=['game_id', 'week'], season=year, plays=plays))
+
+    def build_table(name):
+        # runs on a pool thread; pbp, rosters and teams are shared and only read
+        spec, assemble = TABLES[name]
+        if name in WEEKLY:
+            game_sums = parts_for(name, spec)
+            with inst.stage('player_weeks', season=year, table=name) as s:
+                df = assemble_weekly(assemble, game_sums, weeks, spec, rosters, year)
+                s.rows_out = len(df)
+        else:
+            totals = teams if name == 'team_season' else totals_for(name, spec, TABLE_GRAIN.get(name, ()))
+            extra = {'teams': teams} if name == 'receiving' else {}
+            with inst.stage('join_rosters', rows_in=len(totals), season=year, table=name) as s:
+                df = assemble(pbp, rosters, parts, year, totals, **extra)
+                s.rows_out = len(df)
+            if intervals and name in PLAYER_TABLES:
+                with inst.stage('intervals', rows_in=len(pbp), season=year, table=name) as s:
+                    df = attach_intervals(df, rate_intervals(pbp, spec, intervals, seed=year))
+                    s.rows_out = len(df)
+        with inst.stage('validate', rows_in=len(df), season=year, table=name) as s:
+            violations = validation.validate_table(name, df)
+            s.rows_out = len(violations)
+        for fmt in formats:
+            with inst.stage('write', rows_in=len(df), season=year, table=name, format=fmt):
+                write_table(df, name, year, outdir, (fmt,))
+        return df, violations
+
+    # groupby, merges and the Parquet/Arrow writers release the GIL for most of their work
+    workers = max(1, min(threads or len(tables), len(tables)))
+    if workers == 1:
+        built = {t: build_table(t) for t in tables}
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'build-{year}') as pool:
+            futures = {t: pool.submit(build_table, t) for t in tables}
+            built = {t: f.result() for t, f in futures.items()}
+
+    # one row per failing (rule, player), written next to the tables when there are any
+    violations = pd.concat([v for _, v in built.values()], ignore_index=True)
+    if len(violations):
+        violations.to_csv(outdir/f'violations_{year}.csv', index=False)
+    else:
+        (outdir/f'violations_{year}.csv').unlink(missing_ok=True)
+    leaders = {}
+    if 'passing' in built:
+        passing = built['passing'][0]
+        for c in ['pass_yards', 'pass_td']:
+            if passing[c].notna().any():
+                leaders[c] = (passing.loc[passing[c].idxmax(), 'player_name'], passing[c].max())
+    return {'season': year, 'outdir': str(outdir), 'rows': {t: len(df) for t, (df, _) in built.items()},
+            'games': games, 'leaders': leaders, 'issues': notes + validation.issues(violations), 'violations': len(violations),
+            'seconds': time.perf_counter() - t0}
+
+# roster index handed to each worker process once (at pool start), not once per season task
+_ROSTERS = None
+
+def _init_worker(rosters):
+    global _ROSTERS
+    _ROSTERS = rosters
+
+def _build_in_worker(year, rawdir, outroot, instrument=None, options=None):
+    # options: build_season keyword arguments shared by every season
+    season_rosters = _ROSTERS if year in _ROSTERS.bounds else None
+    # each worker records into its own Instrument and hands the records back with the summary
+    inst = Instrument(**instrument) if instrument else None
+    try:
+        summary = build_season(year, rawdir, Path(outroot)/str(year), season_rosters, instrument=inst, **(options or {}))
+    except Exception as e:
+        # one bad season shouldn't lose the others; the summary reports it
+        summary = {'season': year, 'error': f'{type(e).__name__}: {e}'}
+    if inst is not None:
+        summary['instrument'] = inst.export()
+    return summary
+
+def build_range(years, rawdir: Path, outroot: Path, workers: int = None, partials_dir: Path = None,
+                formats=('parquet',), ep_model: Path = None, instrument: Instrument = None,
+                stream_rows: int = None, tables=('passing',), threads: int = None, intervals: int = None) -> list:
+    """Build several seasons in-process on a process pool; summaries come back in season order.
+
+    The stages recorded in the workers are merged into `instrument`. threads and intervals are per season
+    (see build_season); each season's bootstrap runs in its worker.
+    """
+    years = list(years)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(years)))
+    inst = instrument or Instrument()
+    with inst.stage('load_rosters', seasons=len(years)) as s:
+        rosters = RosterIndex.load(rawdir, years)
+        s.rows_out = len(rosters)
+    settings = inst.settings() if inst.enabled else None
+    options = dict(partials_dir=partials_dir, formats=formats, ep_model=ep_model, stream_rows=stream_rows,
+                   tables=tables, threads=threads, intervals=intervals)
+    if workers == 1:
+        _init_worker(rosters)
+        results = [_build_in_worker(y, rawdir, outroot, settings, options) for y in years]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(rosters,)) as pool:
+            futures = [pool.submit(_build_in_worker, y, rawdir, outroot, settings, options) for y in years]
+            results = [f.result() for f in futures]
+    for r in results:
+        inst.absorb(r.pop('instrument', None))
+    return results
@@ -3,3 +3,4 @@ ROOT = Path(__file__).resolve().parents[2]
 RAW_DIR = ROOT/'data'/'raw'
 PROCESSED_DIR = ROOT/'data'/'processed'
 DEFINITIONS = ROOT/'definitions'/'cfb_player_definitions.yml'
+SCHEMA_DIR = ROOT  # <table>_schema_header.csv / <table>_data_dictionary.csv (output.stem)
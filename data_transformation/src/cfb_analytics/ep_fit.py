@@ -0,0 +1,204 @@
+import hashlib, json
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from .ep_model import EP_CLASSES, EP_FEATURES, EPModel, ep_features, softmax_with_reference
+from .etl.common import load_pbp, pbp_path
+
+# Fitting the multinomial next-score EP model.
+#
+# Every scrimmage play is labelled with the next score in the same half (TD / FG / safety, for
+# or against the offense, or none). Game states are discrete, so each season is reduced to a
+# table of class counts per (down, distance, yardline_100) state, cached by a hash of the
+# season's plays. Fitting is weighted Newton/IRLS over those tables. The model artifact is keyed by
+# the hash of every season in the pool: a build loads it and never refits. Adding a season only
+# counts that season and warm-starts from the artifact of the largest pool it extends.
+
+MODEL_VERSION = 1
+LABEL_COLUMNS = ['season', 'game_id', 'period', 'offense', 'defense', 'play_type',
+                 'down', 'distance', 'yardline_100', 'is_pass', 'is_rush']
+STATE = ['down', 'distance', 'yardline_100']
+
+# CFBD play types that end in a score, and which side of the play scored
+SCORING_PLAYS = {
+    'Passing Touchdown': ('td', 'offense'), 'Rushing Touchdown': ('td', 'offense'),
+    'Field Goal Good': ('fg', 'offense'),
+    'Interception Return Touchdown': ('td', 'defense'), 'Fumble Return Touchdown': ('td', 'defense'),
+    'Blocked Punt Touchdown': ('td', 'defense'), 'Punt Return Touchdown': ('td', 'defense'),
+    'Kickoff Return Touchdown': ('td', 'defense'), 'Blocked Field Goal Touchdown': ('td', 'defense'),
+    'Missed Field Goal Return Touchdown': ('td', 'defense'),
+    'Safety': ('safety', 'defense'),
+}
+
+def next_score_labels(pbp: pd.DataFrame) -> np.ndarray:
+    """Index into EP_CLASSES of the next score in the same game and half, from each play's offense's view.
+
+    pbp must be in play order within each game. Overtime periods count as their own half.
+    """
+    n = len(pbp)
+    pt = pbp['play_type'].astype(str)
+    kind = pt.map({t: k for t, (k, _) in SCORING_PLAYS.items()}).to_numpy(dtype=object)
+    side = pt.map({t: s for t, (_, s) in SCORING_PLAYS.items()}).to_numpy(dtype=object)
+    offense = pbp['offense'].astype(str).to_numpy()
+    defense = pbp['defense'].astype(str).to_numpy()
+    scorer = np.where(side == 'offense', offense, defense)
+
+    period = pbp['period'].to_numpy()
+    half = np.where(period <= 2, 1, np.where(period <= 4, 2, period))
+    # position of the next scoring play (this one included) in the same game and half
+    pos = pd.Series(np.where(pd.notna(kind), np.arange(n), np.nan), index=pbp.index)
+    nxt = pos.groupby([pbp['game_id'].to_numpy(), half]).bfill().to_numpy()
+
+    labels = np.full(n, EP_CLASSES.index('no_score'))
+    has = ~np.isnan(nxt)
+    j = nxt[has].astype(np.intp)
+    cls = pd.Series(kind[j]).where(scorer[j] == offense[has], 'opp_' + pd.Series(kind[j]))
+    labels[has] = pd.Index(EP_CLASSES).get_indexer(cls)
+    return labels
+
+def season_hash(pbp: pd.DataFrame) -> str:
+    """Fingerprint of the plays a season's labels come from."""
+    cols = [c for c in LABEL_COLUMNS if c in pbp.columns]
+    h = pd.util.hash_pandas_object(pbp[cols], index=False).to_numpy()
+    # order matters for the labels, so weight each row hash by its position
+    digest = (h * (np.arange(len(h), dtype='uint64') + 1)).sum()
+    return hashlib.sha1(f'{MODEL_VERSION}:{len(h)}:{digest}'.encode()).hexdigest()[:16]
+
+def state_counts(pbp: pd.DataFrame) -> pd.DataFrame:
+    """Scrimmage plays with a down, as class counts per (down, distance, yardline_100) state."""
+    labels = next_score_labels(pbp)
+    keep = ((pbp['is_pass'] == 1) | (pbp['is_rush'] == 1)).to_numpy() & pbp['down'].between(1, 4).to_numpy()
+    df = pbp.loc[keep, STATE].astype('int64')
+    onehot = pd.DataFrame(np.eye(len(EP_CLASSES), dtype='int64')[labels[keep]], columns=EP_CLASSES, index=df.index)
+    return pd.concat([df, onehot], axis=1).groupby(STATE, as_index=False).sum()
+
+def fit_multinomial(X: np.ndarray, counts: np.ndarray, coef0: np.ndarray = None, l2: float = 1e-3,
+                    max_iter: int = 50, tol: float = 1e-8):
+    """Weighted multinomial logit by Newton's method, 'no_score' as the reference class.
+
+    X is (states, features); counts is (states, classes) label counts per state. Returns
+    (coef of shape (features, classes - 1), iterations used, why it stopped): 'converged' once a
+    Newton step is below tol, 'line_search' if no fraction of a step improves the objective (coef is
+    the last improving one), 'max_iter' if neither happened in max_iter iterations.
+    """
+    ref = EP_CLASSES.index('no_score')
+    Y = np.delete(counts, ref, axis=1).astype('float64')
+    w = counts.sum(axis=1).astype('float64')
+    n_obs = w.sum()
+    p, k = X.shape[1], Y.shape[1]
+    coef = np.zeros((p, k)) if coef0 is None else coef0.copy()
+
+    def objective(c):
+        # penalized log-likelihood
+        logp = np.log(np.maximum(softmax_with_reference(X @ c), 1e-300))
+        return (counts * logp).sum() - 0.5 * l2 * n_obs * (c ** 2).sum()
+
+    current = objective(coef)
+    for it in range(1, max_iter + 1):
+        P = np.delete(softmax_with_reference(X @ coef), ref, axis=1)
+        grad = X.T @ (Y - w[:, None] * P) - l2 * n_obs * coef
+        # Hessian blocks: X' diag(w * (P_a [a == b] - P_a P_b)) X
+        H = np.empty((p, k, p, k))
+        for a in range(k):
+            for b in range(a, k):
+                s = w * (P[:, a] * ((a == b) - P[:, b]))
+                block = (X * s[:, None]).T @ X
+                H[:, a, :, b] = block
+                H[:, b, :, a] = block.T
+        H = H.reshape(p * k, p * k) + l2 * n_obs * np.eye(p * k)
+        step = np.linalg.solve(H, grad.reshape(-1)).reshape(p, k)
+        if np.abs(step).max() < tol:
+            return coef + step, it, 'converged'
+        # full Newton steps can overshoot far from the optimum; halve until the objective improves
+        for _ in range(30):
+            trial = objective(coef + step)
+            if trial >= current:
+                break
+            step /= 2
+        else:
+            return coef, it, 'line_search'
+        coef += step
+        current = trial
+    return coef, max_iter, 'max_iter'
+
+def design(counts: dict) -> tuple:
+    """Stacked design matrix (EP_FEATURES + season dummies, first season as baseline) and class counts."""
+    seasons = sorted(counts)
+    Xs, Ys = [], []
+    for i, season in enumerate(seasons):
+        c = counts[season]
+        X = ep_features(c['down'], c['distance'], c['yardline_100'])
+        fe = np.zeros((len(c), len(seasons) - 1))
+        if i > 0:
+            fe[:, i - 1] = 1.0
+        Xs.append(np.hstack([X, fe]))
+        Ys.append(c[EP_CLASSES].to_numpy())
+    return np.vstack(Xs), np.vstack(Ys)
+
+def pool_key(hashes: dict) -> str:
+    text = json.dumps({'version': MODEL_VERSION, 'features': EP_FEATURES, 'seasons': hashes}, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+def artifact_path(artifact_dir: Path, key: str) -> Path:
+    return Path(artifact_dir)/f'ep_v{MODEL_VERSION}_{key}.json'
+
+def _warm_start(artifact_dir: Path, seasons: list, hashes: dict):
+    """coef of the artifact for the largest pool of these exact seasons, with zero effects for the new ones."""
+    best = None
+    for p in Path(artifact_dir).glob(f'ep_v{MODEL_VERSION}_*.json'):
+        try:
+            m = EPModel.load(p)
+        except ValueError:
+            continue
+        old = m.meta.get('season_hashes', {})
+        if all(hashes.get(int(s)) == h for s, h in old.items()) and (best is None or len(old) > len(best.seasons)):
+            best = m
+    if best is None:
+        return None
+    p = len(EP_FEATURES)
+    coef = np.zeros((p + len(seasons) - 1, best.coef.shape[1]))
+    coef[:p] = best.coef[:p]
+    # season effects are relative to the first season; only reusable if the baseline is unchanged
+    if best.seasons[0] == seasons[0]:
+        for i, s in enumerate(best.seasons[1:], start=1):
+            coef[p + seasons.index(s) - 1] = best.coef[p + i - 1]
+    return coef
+
+def fit_ep(rawdir: Path, seasons, artifact_dir: Path, l2: float = 1e-3, log=print) -> tuple:
+    """Load or fit the pooled EP model for these seasons; returns (model, artifact path)."""
+    seasons = sorted(seasons)
+    artifact_dir = Path(artifact_dir)
+    counts, hashes = {}, {}
+    for season in seasons:
+        pbp = load_pbp(pbp_path(rawdir, season), columns=LABEL_COLUMNS, season=season)
+        missing = [c for c in LABEL_COLUMNS if c not in pbp.columns]
+        if missing:
+            raise ValueError(f'{season} pbp lacks {missing}; re-map it with data_extraction/scripts/map_cfbd_pbp.py')
+        h = hashes[season] = season_hash(pbp)
+        cache = artifact_dir/'counts'/f'{season}_{h}.parquet'
+        if cache.exists():
+            counts[season] = pd.read_parquet(cache)
+        else:
+            log(f'labelling {season} ({len(pbp)} plays)')
+            counts[season] = state_counts(pbp)
+            cache.parent.mkdir(parents=True, exist_ok=True)
+            counts[season].to_parquet(cache, index=False)
+
+    key = pool_key(hashes)
+    path = artifact_path(artifact_dir, key)
+    if path.exists():
+        return EPModel.load(path), path
+
+    X, Y = design(counts)
+    coef0 = _warm_start(artifact_dir, seasons, hashes)
+    coef, iters, stop = fit_multinomial(X, Y, coef0, l2=l2)
+    log(f'fit {len(seasons)} season(s), {int(Y.sum())} plays in {len(X)} states: '
+        f'{iters} Newton iterations ({"warm" if coef0 is not None else "cold"} start)')
+    if stop != 'converged':
+        log(f'warning: EP fit did not converge ({stop} after {iters} iterations); check the artifact before using it')
+    model = EPModel(coef, seasons, key, meta={'season_hashes': hashes, 'plays': int(Y.sum()), 'states': len(X),
+                                              'iterations': iters, 'converged': stop == 'converged', 'stop': stop,
+                                              'l2': l2})
+    model.save(path)
+    return model, path
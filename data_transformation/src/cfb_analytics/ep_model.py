@@ -1,4 +1,6 @@
-from dataclasses import dataclass
+import json
+from dataclasses import dataclass, field, replace
+from pathlib import Path
 import numpy as np
 import pandas as pd
 
@@ -15,11 +17,127 @@ class EPModelStub:
     b2: float = -0.9
     b3: float = 7.0
     def expected_points(self, down, distance, yardline_100):
-        dl = pd.Series(down).fillna(1).clip(1,4)
-        dst = pd.Series(distance).fillna(10).clip(lower=0)
-        yl = pd.Series(yardline_100).fillna(50).clip(0,100)
+        # float64 whatever the input dtype (compact int8/int16/nullable columns)
+        dl = pd.Series(down).astype('float64').fillna(1).clip(1,4)
+        dst = pd.Series(distance).astype('float64').fillna(10).clip(lower=0)
+        yl = pd.Series(yardline_100).astype('float64').fillna(50).clip(0,100)
         return self.b0 + self.b1*dl + self.b2*np.log1p(dst) + self.b3*((100-yl)/100.0)
 
+# next-score classes from the offense's point of view and what each is worth
+EP_CLASSES = ['td', 'fg', 'safety', 'no_score', 'opp_safety', 'opp_fg', 'opp_td']
+EP_CLASS_POINTS = np.array([7.0, 3.0, 2.0, 0.0, -2.0, -3.0, -7.0])
+EP_FEATURES = ['const', 'down_2', 'down_3', 'down_4', 'log_distance', 'yards_to_goal', 'yards_to_goal_sq',
+               'goal_to_go', 'log_distance_x_down']
+
+def ep_features(down, distance, yardline_100) -> np.ndarray:
+    """Design matrix (n, len(EP_FEATURES)); missing states take the stub's defaults."""
+    dl = np.clip(_state(down, 1), 1, 4)
+    dst = np.maximum(_state(distance, 10), 0)
+    yl = np.clip(_state(yardline_100, 50), 0, 100) / 100.0
+    ld = np.log1p(dst)
+    return np.column_stack([np.ones_like(dl), dl == 2, dl == 3, dl == 4, ld, yl, yl**2,
+                            dst >= yl * 100, ld * dl]).astype('float64')
+
+@dataclass
+class EPModel:
+    """Multinomial next-score EP model fit by ep_fit.fit_ep; EP = sum over classes of P(class) * points.
+
+    coef has one column per class except 'no_score' (the reference). With several seasons in
+    the pool, rows after EP_FEATURES are season fixed effects (the first season is the baseline);
+    `season` picks which one expected_points applies.
+    """
+    coef: np.ndarray
+    seasons: list
+    key: str = ''
+    season: int = None
+    meta: dict = field(default_factory=dict)
+
+    def for_season(self, season: int) -> 'EPModel':
+        # seasons outside the pool use the most recent one
+        return replace(self, season=season if season in self.seasons else self.seasons[-1])
+
+    def probabilities(self, down, distance, yardline_100) -> np.ndarray:
+        X = ep_features(down, distance, yardline_100)
+        logits = X @ self.coef[:len(EP_FEATURES)]
+        season = self.season if self.season is not None else self.seasons[-1]
+        i = self.seasons.index(season)
+        if i > 0:
+            logits = logits + self.coef[len(EP_FEATURES) + i - 1]
+        return softmax_with_reference(logits)
+
+    def expected_points(self, down, distance, yardline_100):
+        index = down.index if isinstance(down, pd.Series) else None
+        return pd.Series(self.probabilities(down, distance, yardline_100) @ EP_CLASS_POINTS, index=index)
+
+    def save(self, path: Path):
+        path = Path(path); path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({'key': self.key, 'classes': EP_CLASSES, 'features': EP_FEATURES,
+                                    'seasons': self.seasons, 'coef': self.coef.tolist(), 'meta': self.meta}, indent=1))
+
+    @classmethod
+    def load(cls, path: Path) -> 'EPModel':
+        d = json.loads(Path(path).read_text())
+        if d['classes'] != EP_CLASSES or d['features'] != EP_FEATURES:
+            raise ValueError(f'{path} was fit with different classes/features; refit it with scripts/fit_ep.py')
+        return cls(np.array(d['coef']), d['seasons'], d['key'], meta=d.get('meta', {}))
+
+def softmax_with_reference(logits: np.ndarray) -> np.ndarray:
+    """Class probabilities in EP_CLASSES order from logits of every class but the 'no_score' reference."""
+    ref = EP_CLASSES.index('no_score')
+    full = np.insert(logits, ref, 0.0, axis=1)
+    full -= full.max(axis=1, keepdims=True)
+    p = np.exp(full)
+    return p / p.sum(axis=1, keepdims=True)
+
+class EPGrid:
+    """Any EP model precomputed over the discrete game-state grid and answered by array lookup.
+
+    The wrapped model's expected_points(down, distance, yardline_100) runs once, over every
+    (down 1-4, distance 0-max_distance, yardline 0-100) state; per-play calls are integer
+    fancy indexing. Missing values take the stub's defaults (1st down, 10 to go, own 50) and
+    values are clipped the same way; a play outside the grid (distance > max_distance or a
+    fractional value) is passed to the wrapped model directly.
+    """
+    def __init__(self, model, max_distance: int = 99):
+        self.model = model
+        self.max_distance = max_distance
+        d, dist, yl = np.meshgrid(np.arange(1, 5), np.arange(max_distance + 1), np.arange(101), indexing='ij')
+        ep = model.expected_points(pd.Series(d.ravel()), pd.Series(dist.ravel()), pd.Series(yl.ravel()))
+        self.grid = np.asarray(ep, dtype='float64').reshape(d.shape)
+
+    def expected_points(self, down, distance, yardline_100):
+        index = down.index if isinstance(down, pd.Series) else None
+        dl = np.clip(_state(down, 1), 1, 4)
+        dst = np.maximum(_state(distance, 10), 0)
+        yl = np.clip(_state(yardline_100, 50), 0, 100)
+        # flat grid position; plays off the grid read cell 0 and are patched below
+        di, dsti, yli = dl.astype(np.intp), np.minimum(dst, self.max_distance).astype(np.intp), yl.astype(np.intp)
+        inside = (dst <= self.max_distance) & (di == dl) & (dsti == dst) & (yli == yl)
+        flat = ((di - 1) * (self.max_distance + 1) + dsti) * 101 + yli
+        ep = self.grid.ravel().take(np.where(inside, flat, 0))
+        if not inside.all():
+            rest = ~inside
+            ep[rest] = np.asarray(self.model.expected_points(pd.Series(dl[rest]), pd.Series(dst[rest]), pd.Series(yl[rest])))
+        return pd.Series(ep, index=index)
+
+def _state(values, default) -> np.ndarray:
+    # float64 with the stub's fillna default
+    a = values.to_numpy(dtype='float64', na_value=np.nan) if isinstance(values, pd.Series) else np.asarray(values, dtype='float64')
+    return np.where(np.isnan(a), default, a)
+
+def ep_lookup(model=None) -> EPGrid:
+    """model wrapped in an EPGrid (built once per model); the stub when model is None."""
+    if isinstance(model, EPGrid):
+        return model
+    if model is None:
+        global _DEFAULT_GRID
+        if _DEFAULT_GRID is None:
+            _DEFAULT_GRID = EPGrid(EPModelStub())
+        return _DEFAULT_GRID
+    return EPGrid(model)
+
+_DEFAULT_GRID = None
+
 # missing columns that need to be added for epa calculation: next_down, next_distance, next_yardline_100
 def compute_epa(df, model, down_col='down', dist_col='distance', yl_col='yardline_100',
                 points_col='points_scored', next_down_col='next_down',
@@ -27,5 +145,6 @@ def compute_epa(df, model, down_col='down', dist_col='distance', yl_col='yardlin
     """EPA = EP_after - EP_before - points_scored_on_play (placeholder)."""
     ep_before = model.expected_points(df[down_col], df[dist_col], df[yl_col])
     ep_after  = model.expected_points(df[next_down_col], df[next_dist_col], df[next_yl_col])
-    points = df.get(points_col, pd.Series(0, index=df.index)).fillna(0)
-    return df[next_possession_col] * points + df[next_possession_col] * ep_after - ep_before
+    points = df.get(points_col, pd.Series(0, index=df.index)).fillna(0).astype('float64')
+    poss = df[next_possession_col].astype('float64')
+    return poss * points + poss * ep_after - ep_before
@@ -1 +1 @@
-__all__ = ['common','passing','rushing','receiving','defense']
+__all__ = ['common','passing','rushing','receiving','defense','team']
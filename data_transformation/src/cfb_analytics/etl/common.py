@@ -1,16 +1,167 @@
-import pandas as pd
+import pandas as pd, pyarrow as pa, pyarrow.compute as pc, pyarrow.dataset as ds
 from pathlib import Path
+from ..ep_model import compute_epa, ep_lookup
+from ..metrics import TableSpec, meta, columns_used
+
+# Compact pbp schema, enforced once at load time (compact_pbp): ids as nullable Int32, 0/1 flags as
+# int8 (a play stat that was never recorded counts as 0), small counts/yardages as int8/int16,
+# next-state columns as nullable ints, names and play types categorical. Columns not listed keep their dtype.
+ID_COLUMNS = ['passer_player_id', 'rusher_player_id', 'receiver_player_id', 'fumble_recovery_id',
+              'primary_defender_id', 'pass_rusher_id', 'sacker_id', 'defender_id']
+# offense/defense team of each play (map_cfbd_pbp.py), keying the team tables (etl/team.py)
+TEAM_ID_COLUMNS = ['offense_id', 'defense_id']
+# the one player/team id dtype, shared by pbp ids, rosters (rosters.RosterIndex) and the player tables
+ID_DTYPE = 'Int32'
+FLAG_COLUMNS = ['is_pass', 'is_rush', 'complete', 'touchdown', 'safety', 'interception', 'sack', 'fumble',
+                'fumble_lost', 'fg_attempt', 'punt_attempt', 'scramble', 'pressure', 'drop', 'rpo', 'read_option',
+                'slot_aligned', 'wide_aligned', 'inline_aligned', 'vs_man', 'vs_zone',
+                'tackle_primary', 'tackle_assist', 'missed_tackle', 'tfl', 'stop', 'forced_fumble',
+                'fumble_recovery', 'defensive_td']
+PBP_DTYPES = {
+    'season': 'int16', 'week': 'int8', 'game_id': 'int32', 'period': 'int8',
+    'offense': 'category', 'defense': 'category',
+    'down': 'int8', 'distance': 'int16', 'yardline_100': 'int16', 'yards_gained': 'int16',
+    'points_scored': 'int8', 'sack_yards': 'int16', 'next_possession': 'int8',
+    'next_down': 'Int8', 'next_distance': 'Int16', 'next_yardline_100': 'Int16',
+    **{c: ID_DTYPE for c in ID_COLUMNS + TEAM_ID_COLUMNS},
+    **{c: 'int8' for c in FLAG_COLUMNS},
+}
+# a missing value in these means "didn't happen" rather than "unknown"
+ZERO_FILL = set(FLAG_COLUMNS) | {'sack_yards'}
+
+def compact_pbp(pbp: pd.DataFrame) -> pd.DataFrame:
+    """pbp in the compact schema above (about a quarter of the memory of the mapped parquet as loaded)."""
+    cols = {}
+    for c in pbp.columns:
+        s = pbp[c]
+        dtype = PBP_DTYPES.get(c)
+        if dtype is None:
+            if c.endswith('_name') or c == 'play_type':
+                dtype = 'category'
+            else:
+                cols[c] = s
+                continue
+        if c in ZERO_FILL:
+            s = s.fillna(0)
+        elif dtype.startswith('Int') and s.dtype != dtype:
+            cols[c] = _nullable_int(s, dtype)
+            continue
+        cols[c] = s.astype(dtype)
+    return pd.DataFrame(cols, index=pbp.index)
+
+def _nullable_int(s: pd.Series, dtype: str) -> pd.Series:
+    # values + mask directly: Series.astype('Int32') on float/object input goes element by element
+    if s.dtype == object:
+        # ids arrive as strings from the play stats
+        s = pd.to_numeric(s)
+    mask = s.isna().to_numpy()
+    values = s.to_numpy(dtype='float64', na_value=0).astype(dtype.lower())
+    return pd.Series(pd.arrays.IntegerArray(values, mask), index=s.index, name=s.name)
 
 def load_rosters(path: Path) -> pd.DataFrame:
     # season, player_id, player_name, team_id, team_name, conference, position/position_group
-    return pd.read_csv(path)
+    # ids in the same dtype as the pbp ids, so joins need no casts
+    return pd.read_csv(path, dtype={'player_id': ID_DTYPE, 'team_id': ID_DTYPE})
 
 def load_participation(path: Path) -> pd.DataFrame:
     # games, starts, snaps, routes, def_snaps, pass_rush_snaps, run_defense_snaps, etc.
     return pd.read_csv(path)
 
-def load_pbp(path: Path) -> pd.DataFrame:
-    # pbp.parquet preferred
-    if str(path).endswith('.parquet'):
-        return pd.read_parquet(path)
-    return pd.read_csv(path)
+# plays of each kind, for load_pbp(plays=...)
+PLAY_FILTERS = {'pass': ds.field('is_pass') == 1, 'rush': ds.field('is_rush') == 1}
+# columns enrich_pbp reads (EPA inputs, cutoffs, pass/rush flags); role ids come with each table's spec
+ENRICH_COLUMNS = ['down', 'distance', 'yardline_100', 'yards_gained', 'points_scored', 'next_down',
+                  'next_distance', 'next_yardline_100', 'next_possession', 'is_pass', 'is_rush']
+
+def pbp_columns(*tables: TableSpec) -> list:
+    """Columns to load for building these tables: keys, enrich_pbp inputs and every column the specs read."""
+    cols = ['season', 'week', 'game_id'] + ENRICH_COLUMNS
+    for t in tables:
+        cols += columns_used(t)
+    return list(dict.fromkeys(cols))
+
+def pbp_path(rawdir: Path, season: int) -> Path:
+    """The partitioned pbp dataset (<rawdir>/pbp/season=YYYY/week=W) if mapped into one, else <rawdir>/<season>/pbp.parquet."""
+    rawdir = Path(rawdir)
+    if (rawdir/'pbp'/f'season={season}').is_dir():
+        return rawdir/'pbp'
+    return rawdir/str(season)/'pbp.parquet'
+
+def load_pbp(path: Path, columns=None, season: int = None, weeks: tuple = None, plays: str = None) -> pd.DataFrame:
+    """Read pbp (in the compact schema) from a hive-partitioned dataset directory or a single parquet/csv file.
+
+    columns: only these are read (names not in the data are skipped, like missing columns elsewhere).
+    season / weeks=(first, last) / plays='pass'|'rush' are pushed down to pyarrow, so other
+    partitions are never opened and filtered-out rows never reach pandas.
+    """
+    path = Path(path)
+    if path.suffix == '.csv':
+        return compact_pbp(pd.read_csv(path, usecols=lambda c: columns is None or c in columns))
+    dataset, cols, expr = pbp_scan(path, columns, season, weeks, plays)
+    return arrow_to_pbp(dataset.to_table(columns=cols, filter=expr))
+
+def pbp_scan(path: Path, columns=None, season: int = None, weeks: tuple = None, plays: str = None) -> tuple:
+    """(dataset, columns, filter) for reading pbp: load_pbp's pushdown, shared with the streaming reader."""
+    dataset = ds.dataset(Path(path), format='parquet', partitioning='hive')
+    names = dataset.schema.names
+    filters = []
+    if season is not None and 'season' in names:
+        filters.append(ds.field('season') == season)
+    if weeks is not None:
+        if 'week' not in names:
+            raise ValueError(f'{path} has no week column; map it into the partitioned pbp dataset first')
+        filters.append((ds.field('week') >= weeks[0]) & (ds.field('week') <= weeks[1]))
+    if plays is not None:
+        filters.append(PLAY_FILTERS[plays])
+    expr = None
+    for f in filters:
+        expr = f if expr is None else expr & f
+    cols = None if columns is None else [c for c in dict.fromkeys(columns) if c in names]
+    return dataset, cols, expr
+
+def arrow_to_pbp(table) -> pd.DataFrame:
+    """An arrow Table/RecordBatch of mapped pbp as a DataFrame in the compact schema."""
+    # ids arrive as strings from the play stats; arrow parses them far faster than pd.to_numeric
+    for i, f in enumerate(table.schema):
+        if f.name in ID_COLUMNS and (pa.types.is_string(f.type) or pa.types.is_null(f.type)):
+            table = table.set_column(i, f.name, pc.cast(table[f.name], pa.int32()))
+    return compact_pbp(table.to_pandas())
+
+def enrich_pbp(pbp: pd.DataFrame, model=None, defs: dict = None) -> pd.DataFrame:
+    """Add epa, success, explosive flags and role masks once, for all the assemblers.
+
+    The assemblers treat the result as read-only: they select rows by role mask and
+    never add columns, so the frame is built once per season instead of once per table.
+    """
+    # EP precomputed over the state grid once per model; per play it is an array lookup
+    model = ep_lookup(model)
+    cutoffs = meta(defs)['explosive_cutoffs']
+    is_pass = pbp['is_pass'] == 1 if 'is_pass' in pbp.columns else pd.Series(False, index=pbp.index)
+    is_rush = pbp['is_rush'] == 1 if 'is_rush' in pbp.columns else pd.Series(False, index=pbp.index)
+    epa = compute_epa(pbp, model)
+    cols = {
+        'epa': epa,
+        'success': epa > 0,
+        'explosive_pass': pbp['yards_gained'] >= cutoffs['pass_yards'],
+        'explosive_rush': pbp['yards_gained'] >= cutoffs['rush_yards'],
+        'explosive_rec': pbp['yards_gained'] >= cutoffs['rec_yards'],
+        # role masks: which plays each assembler aggregates
+        'role_passer': is_pass,
+        'role_rusher': is_rush,
+    }
+    # loaded with a column projection, pbp may lack the id columns of tables not being built
+    if 'receiver_player_id' in pbp.columns:
+        cols['role_receiver'] = is_pass & pbp['receiver_player_id'].notna()
+    if 'primary_defender_id' in pbp.columns:
+        cols['role_defender'] = is_pass & pbp['primary_defender_id'].notna()
+    # scrimmage plays, by the team on each side of the ball
+    if 'offense_id' in pbp.columns:
+        cols['role_offense'] = (is_pass | is_rush) & pbp['offense_id'].notna()
+    if 'defense_id' in pbp.columns:
+        cols['role_defense'] = (is_pass | is_rush) & pbp['defense_id'].notna()
+    # concat without copy keeps the existing pbp columns shared instead of duplicating the frame
+    return pd.concat([pbp, pd.DataFrame(cols, index=pbp.index)], axis=1, copy=False)
+
+def ensure_enriched(pbp: pd.DataFrame) -> pd.DataFrame:
+    """Return pbp as-is if enrich_pbp already ran on it, otherwise enrich it now."""
+    return pbp if 'epa' in pbp.columns else enrich_pbp(pbp)
@@ -0,0 +1,68 @@
+import pandas as pd, numpy as np
+from .common import ensure_enriched
+from ..rosters import RosterIndex
+from ..metrics import Agg, RoleSpec, TableSpec, aggregate, finalize_rates
+
+# Team aggregates over scrimmage plays, by the offense and by the defense. The metric engine keys
+# every table on `player_id`; here that index holds the team id (renamed team_id on assembly).
+# One spec serves both team tables: season totals per team, and per game (grouped by game_id too).
+TEAM = TableSpec('team_season', roles=[
+    RoleSpec(key='offense_id', mask='role_offense', metrics={
+        'plays': Agg('size'),
+        'pass_attempts': Agg('sum', 'is_pass'),
+        'completions': Agg('sum', 'complete'),
+        'pass_yards': Agg('sum', 'yards_gained', where='is_pass == 1'),
+        'rush_att': Agg('sum', 'is_rush'),
+        'rush_yards': Agg('sum', 'yards_gained', where='is_rush == 1'),
+        'touchdowns': Agg('sum', 'touchdown'),
+        'interceptions': Agg('sum', 'interception'),
+        'sacks_taken': Agg('sum', 'sack == 1'),
+        'air_yards': Agg('sum', 'air_yards'),
+        'epa_total': Agg('sum', 'epa'),
+        'success_rate': Agg('mean', 'success'),
+    }),
+    RoleSpec(key='defense_id', mask='role_defense', metrics={
+        'plays_against': Agg('size'),
+        'yards_allowed': Agg('sum', 'yards_gained'),
+        'epa_allowed': Agg('sum', 'epa'),
+        'success_rate_allowed': Agg('mean', 'success'),
+    }),
+])
+# the same sums per game; its ratio metrics come from the YAML team_game section
+TEAM_GAME = TableSpec('team_game', roles=TEAM.roles, derived=TEAM.derived)
+
+TEAM_COLUMNS = ['team_id', 'team_name', 'conference',
+                'plays', 'pass_attempts', 'completions', 'pass_yards', 'rush_att', 'rush_yards', 'touchdowns',
+                'interceptions', 'sacks_taken', 'air_yards',
+                'completion_pct', 'yards_per_pass_att', 'yards_per_carry', 'pass_rate',
+                'epa_total', 'epa_per_play', 'success_rate',
+                'plays_against', 'yards_allowed', 'epa_allowed', 'epa_allowed_per_play', 'success_rate_allowed']
+
+def _name_teams(out, rosters, season):
+    out = out.rename_axis(index={'player_id': 'team_id'})
+    teams = RosterIndex.of(rosters).teams(season)
+    out['team_name'] = teams['team_name'].reindex(out.index.get_level_values('team_id')).to_numpy()
+    out['conference'] = teams['conference'].reindex(out.index.get_level_values('team_id')).to_numpy()
+    out['season'] = season
+    return out.reset_index()
+
+def assemble_team_season(pbp, rosters, parts, season, totals=None):
+    # totals: per-team sums merged elsewhere (incremental.PartialStore, streaming); pbp is not read then
+    out = aggregate(ensure_enriched(pbp), TEAM) if totals is None else totals
+    out = finalize_rates(_name_teams(out, rosters, season), TEAM)
+    return out.reindex(columns=['season'] + TEAM_COLUMNS)
+
+def assemble_team_game(pbp, rosters, parts, season, totals=None):
+    # totals: per-(game, team) sums, as aggregate(..., by=('game_id',))
+    out = aggregate(ensure_enriched(pbp), TEAM, by=('game_id',)) if totals is None else totals
+    out = finalize_rates(_name_teams(out, rosters, season), TEAM_GAME)
+    return out.reindex(columns=['season', 'game_id'] + TEAM_COLUMNS)
+
+def team_denominators(out: pd.DataFrame, teams: pd.DataFrame, columns: dict) -> pd.DataFrame:
+    """out with team totals (indexed by team id) joined on its team_id, as {new column: team column}; null for unknown teams."""
+    pos = teams.index.get_indexer(pd.Index(out['team_id']))
+    for name, col in columns.items():
+        # position -1 (team not found) picks the appended null
+        values = teams[col].to_numpy(dtype='float64', na_value=np.nan) if col in teams.columns else np.full(len(teams), np.nan)
+        out[name] = np.append(values, np.nan)[pos]
+    return out
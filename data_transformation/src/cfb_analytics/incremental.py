@@ -0,0 +1,117 @@
+import dataclasses, hashlib, inspect, json, os
+from pathlib import Path
+import pandas as pd
+
+from .etl.common import enrich_pbp, PBP_DTYPES
+from .metrics import TableSpec, meta, partials, combine
+
+# Incremental season builds: per-(game, player, role) additive sums are kept on disk, so a
+# weekly rebuild only enriches and aggregates games that are new or whose plays changed,
+# then re-derives every rate from the merged sums.
+#
+# layout: <root>/<season>/games.json                    game_id -> fingerprint of its plays
+#         <root>/<season>/<table>/<role key>.parquet    game_id, player_id, additive columns
+
+def game_fingerprints(pbp: pd.DataFrame) -> pd.Series:
+    """A hash of every play of each game (row order included); changes whenever a game is re-pulled with edits."""
+    h = pd.util.hash_pandas_object(pbp, index=False)
+    # weight by position in the game so reordered plays also change the fingerprint
+    pos = pbp.groupby('game_id').cumcount().to_numpy().astype('uint64') + 1
+    return (h * pos).groupby(pbp['game_id'].to_numpy()).sum().map(lambda v: format(v, '016x'))
+
+def spec_text(table: TableSpec) -> str:
+    """repr of a table spec that is the same in every process: callables (derived columns) by their source."""
+    def stable(fn):
+        if not callable(fn):
+            return fn
+        try:
+            return inspect.getsource(fn).strip()
+        except (OSError, TypeError):
+            return f'{fn.__module__}.{fn.__qualname__}'
+    # the repr of a function holds its address, which changes from one run to the next
+    return repr(dataclasses.replace(table, derived={k: stable(v) for k, v in table.derived.items()}))
+
+def spec_version(tables, defs: dict = None, model=None) -> str:
+    """Partials are only reusable while the table specs, YAML thresholds, pbp dtypes and EP model are unchanged."""
+    # a trained EPModel is identified by its artifact key and season; the stub by its parameters
+    ep = [getattr(model, 'key', None), getattr(model, 'season', None)] if model is not None else 'stub'
+    text = json.dumps([spec_text(t) for t in tables] + [meta(defs), PBP_DTYPES, ep], sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+class PartialStore:
+    def __init__(self, root: Path, season: int):
+        self.dir = Path(root)/str(season)
+        self.season = season
+        try:
+            self.manifest = json.loads((self.dir/'games.json').read_text())
+        except (OSError, ValueError):
+            self.manifest = {'version': None, 'games': {}}
+
+    def path(self, table: TableSpec, key: str) -> Path:
+        return self.dir/table.name/f'{key}.parquet'
+
+    def load(self, table: TableSpec) -> dict:
+        parts = {}
+        for role in table.roles:
+            p = self.path(table, role.key)
+            if p.exists():
+                parts[role.key] = pd.read_parquet(p)
+        return parts
+
+    def update(self, pbp: pd.DataFrame, tables, full: bool = True, model=None, defs: dict = None) -> dict:
+        """Bring the stored partials up to date with pbp; returns counts of games added/changed/removed.
+
+        full=True means pbp is the whole season so far (games missing from it are dropped);
+        with full=False pbp may hold just the new week.
+        """
+        version = spec_version(tables, defs, model)
+        stored = self.manifest['games'] if self.manifest['version'] == version else {}
+        fps = game_fingerprints(pbp)
+        fps.index = fps.index.astype(str)
+
+        todo = [g for g, fp in fps.items() if stored.get(g) != fp]
+        removed = [g for g in stored if g not in fps.index] if full else []
+        stats = {'games': len(fps), 'new': sum(g not in stored for g in todo),
+                 'changed': sum(g in stored for g in todo), 'removed': len(removed)}
+        if not todo and not removed and stored:
+            return stats
+
+        fresh = pbp[pbp['game_id'].astype(str).isin(todo)]
+        fresh = enrich_pbp(fresh, model, defs) if len(fresh) else fresh
+        drop = set(todo) | set(removed)
+        for table in tables:
+            old = self.load(table) if stored else {}
+            new = partials(fresh, table, defs) if len(fresh) else {}
+            for role in table.roles:
+                kept = old.get(role.key)
+                if kept is not None:
+                    kept = kept[~kept['game_id'].astype(str).isin(drop)]
+                frames = [f for f in (kept, new.get(role.key)) if f is not None and len(f)]
+                if not frames:
+                    self.path(table, role.key).unlink(missing_ok=True)
+                    continue
+                merged = pd.concat(frames, ignore_index=True).sort_values(['game_id', 'player_id'], kind='stable')
+                self._write(self.path(table, role.key), merged)
+
+        games = {g: fp for g, fp in stored.items() if g not in drop}
+        games.update({g: fps[g] for g in todo})
+        self.manifest = {'version': version, 'games': games}
+        self._write_manifest()
+        return stats
+
+    def totals(self, table: TableSpec, by: tuple = ()) -> pd.DataFrame:
+        """Season totals for a table (per game with by=('game_id',)), the same frame metrics.aggregate returns for the full pbp."""
+        return combine(self.load(table), table, by, exact=True)
+
+    # temp file + rename so an interrupted update never leaves a half-written partial
+    def _write(self, path: Path, df: pd.DataFrame):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+
+    def _write_manifest(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.dir/f'games.json.{os.getpid()}.tmp'
+        tmp.write_text(json.dumps(self.manifest, indent=1, sort_keys=True))
+        os.replace(tmp, self.dir/'games.json')
@@ -0,0 +1,176 @@
+import json, marshal, os, platform, sys, threading, time
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # not on Windows; RSS is reported as null there
+    resource = None
+
+# Stage-level instrumentation for a pipeline run (extraction and transformation scripts alike; stdlib only).
+#
+#     inst = Instrument(enabled=bool(args.report), profile=args.profile)
+#     with inst.stage('load_pbp', season=2019) as s:
+#         pbp = load_pbp(...)
+#         s.rows_out = len(pbp)
+#     inst.write_report('run.json')
+#
+# Each stage records wall and CPU time, the process's peak RSS after it (and how much the stage raised
+# it), and rows in/out. With profile='cprofile' (or 'pyinstrument', if installed) every stage runs under
+# a profiler and the slowest stage's profile is written next to the report. Disabled, stage() returns
+# one shared no-op object, so the instrumented code costs an attribute lookup and a `with` per stage.
+
+PROFILERS = ('cprofile', 'pyinstrument')
+
+class _Off:
+    """The stage handed out by a disabled Instrument: a context manager that ignores everything."""
+    __slots__ = ()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+    def __setattr__(self, name, value):
+        pass
+
+_OFF = _Off()
+
+def peak_rss_mib(children: bool = False):
+    """The process's peak resident set size so far, in MiB (None where unavailable).
+
+    children=True: the largest of its finished child processes (subprocesses, pool workers) instead.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+class _Stage:
+    def __init__(self, inst, name, rows_in, labels):
+        self.inst, self.name, self.rows_in, self.labels = inst, name, rows_in, labels
+        self.rows_out = None
+        self.profiler = None
+
+    def __enter__(self):
+        self.rss0 = peak_rss_mib()
+        if self.inst.profile and not self.inst._profiling:
+            self.inst._profiling = True
+            self.profiler = _start_profiler(self.inst.profile)
+        self.cpu0, self.t0 = time.process_time(), time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall, cpu = time.perf_counter() - self.t0, time.process_time() - self.cpu0
+        payload = None
+        if self.profiler is not None:
+            payload = _stop_profiler(self.inst.profile, self.profiler)
+            self.inst._profiling = False
+        rss = peak_rss_mib()
+        self.inst.stages.append({
+            'stage': self.name, **self.labels, 'wall_s': wall, 'cpu_s': cpu,
+            'peak_rss_mib': rss, 'rss_growth_mib': None if rss is None else rss - self.rss0,
+            'rows_in': self.rows_in, 'rows_out': self.rows_out, 'pid': os.getpid(),
+            # stages on concurrent threads overlap in wall time, and CPU time is the whole process's
+            'thread': threading.current_thread().name,
+            'error': None if exc_type is None else f'{exc_type.__name__}: {exc}',
+        })
+        if payload is not None and (self.inst.slowest is None or wall > self.inst.slowest['wall_s']):
+            self.inst.slowest = {'stage': self.name, **self.labels, 'wall_s': wall, 'payload': payload}
+        return False
+
+def _start_profiler(kind):
+    if kind == 'pyinstrument':
+        from pyinstrument import Profiler
+        p = Profiler()
+        p.start()
+    else:
+        import cProfile
+        p = cProfile.Profile()
+        p.enable()
+    return p
+
+def _stop_profiler(kind, p):
+    # picklable payloads, so worker processes can hand theirs back: cProfile's raw stats, pyinstrument's HTML
+    if kind == 'pyinstrument':
+        p.stop()
+        return p.output_html()
+    p.disable()
+    p.create_stats()
+    return p.stats
+
+class Instrument:
+    def __init__(self, enabled: bool = False, profile: str = None, **meta):
+        if profile is not None and profile not in PROFILERS:
+            raise ValueError(f'unknown profiler {profile!r}; expected one of {PROFILERS}')
+        if profile == 'pyinstrument':
+            import pyinstrument  # noqa: F401  fail at start-up, not in the first stage
+        self.enabled = enabled
+        self.profile = profile if enabled else None
+        self.meta = meta
+        self.stages = []
+        self.slowest = None
+        self._profiling = False
+        self.started = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        self.t0, self.cpu0 = time.perf_counter(), time.process_time()
+
+    def stage(self, name: str, rows_in: int = None, **labels):
+        """Context manager timing one stage; set .rows_out on it. labels (e.g. season=2019) go into the record."""
+        if not self.enabled:
+            return _OFF
+        return _Stage(self, name, rows_in, labels)
+
+    def settings(self) -> dict:
+        """What a worker process needs to build its own Instrument (see export/absorb)."""
+        return {'enabled': self.enabled, 'profile': self.profile}
+
+    def export(self) -> dict:
+        return {'stages': self.stages, 'slowest': self.slowest}
+
+    def absorb(self, exported: dict):
+        """Merge the stages (and slowest profile) recorded by another Instrument, e.g. in a worker process."""
+        if not exported:
+            return
+        self.stages += exported['stages']
+        s = exported.get('slowest')
+        if s is not None and (self.slowest is None or s['wall_s'] > self.slowest['wall_s']):
+            self.slowest = s
+
+    def report(self) -> dict:
+        by_stage = {}
+        for s in self.stages:
+            t = by_stage.setdefault(s['stage'], {'count': 0, 'wall_s': 0.0, 'cpu_s': 0.0})
+            t['count'] += 1; t['wall_s'] += s['wall_s']; t['cpu_s'] += s['cpu_s']
+        slowest = max(self.stages, key=lambda s: s['wall_s'], default=None)
+        return {
+            'started': self.started, 'argv': sys.argv, 'python': platform.python_version(),
+            'platform': platform.platform(), 'pid': os.getpid(), **self.meta,
+            'wall_s': time.perf_counter() - self.t0, 'cpu_s': time.process_time() - self.cpu0,
+            'peak_rss_mib': peak_rss_mib(), 'peak_rss_children_mib': peak_rss_mib(children=True), 'slowest': slowest, 'totals': by_stage, 'stages': self.stages,
+        }
+
+    def write_report(self, path: Path) -> dict:
+        """Write the JSON report (and the slowest stage's profile beside it, if profiling); returns the report."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        report = self.report()
+        if self.slowest is not None:
+            suffix = '.html' if self.profile == 'pyinstrument' else '.prof'
+            prof = path.with_name(path.stem + '.slowest' + suffix)
+            if self.profile == 'pyinstrument':
+                prof.write_text(self.slowest['payload'])
+            else:
+                # the format cProfile.Profile.dump_stats writes: load with pstats.Stats(path)
+                prof.write_bytes(marshal.dumps(self.slowest['payload']))
+            report['profile'] = {'path': str(prof), 'stage': self.slowest['stage'],
+                                 **{k: v for k, v in self.slowest.items() if k not in ('stage', 'payload')}}
+        path.write_text(json.dumps(report, indent=1, default=str))
+        return report
+
+def print_report(report: dict, path):
+    """A few lines on stdout: stage totals, slowest first, and where the profile went."""
+    print(f"Run report: {path} ({report['wall_s']:.2f}s wall, {report['cpu_s']:.2f}s CPU, "
+          f"peak RSS {report['peak_rss_mib'] or 0:.0f} MiB)")
+    for name, t in sorted(report['totals'].items(), key=lambda kv: -kv[1]['wall_s']):
+        print(f"  {name:<18} {t['wall_s']:8.3f}s wall {t['cpu_s']:8.3f}s CPU  x{t['count']}")
+    if 'profile' in report:
+        print(f"  profile of the slowest stage ({report['profile']['stage']}): {report['profile']['path']}")
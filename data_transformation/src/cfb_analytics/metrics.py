@@ -0,0 +1,299 @@
+import ast, math
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import yaml
+
+from .config import DEFINITIONS
+
+# Metric engine: each table is a thin spec of per-play aggregations; every role key is
+# aggregated with one fused groupby().sum() and the ratio formulas are read from the YAML.
+
+@lru_cache(maxsize=None)
+def load_definitions(path: Path = DEFINITIONS) -> dict:
+    with open(path) as f:
+        return yaml.load(f, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+def meta(defs: dict = None) -> dict:
+    """Thresholds from the YAML meta section (explosive_cutoffs, red_zone_yardline_max, early_downs, ...)."""
+    return (defs or load_definitions())['meta']
+
+@dataclass(frozen=True)
+class Agg:
+    """One per-play aggregation.
+
+    how: 'sum', 'mean' or 'size'. expr and where are pbp column names or pd.eval
+    expressions; {placeholders} are filled from the YAML meta section. If a column they
+    need is missing, the metric is `default` (sums) or NaN (means).
+    """
+    how: str
+    expr: str = ''
+    where: str = ''
+    default: float = 0
+
+@dataclass
+class RoleSpec:
+    """Plays selected by `mask`, grouped by the player id in `key`."""
+    key: str
+    mask: str
+    metrics: dict
+
+@dataclass
+class TableSpec:
+    """Roles outer-joined on player_id, then `derived` columns (eval string or callable) on the result.
+
+    Ratio formulas in the YAML section `name` fill any column not produced here.
+    """
+    name: str
+    roles: list
+    derived: dict = field(default_factory=dict)
+
+MISSING = (NameError, KeyError)
+
+def names_in(expr: str) -> set:
+    """Column names an expression refers to."""
+    return {n.id for n in ast.walk(ast.parse(expr, mode='eval')) if isinstance(n, ast.Name)}
+
+def evaluate(df: pd.DataFrame, expr: str):
+    """pd.eval over only the columns the expression names (DataFrame.eval resolves every column)."""
+    if expr in df.columns:
+        return df[expr]
+    names = names_in(expr)
+    return pd.eval(expr, engine='python', resolvers=({k: df[k] for k in names if k in df.columns},))
+
+def _eval(df: pd.DataFrame, expr: str, params: dict):
+    return evaluate(df, expr.format(**params))
+
+def partial_role(pbp: pd.DataFrame, spec: RoleSpec, params: dict, by: tuple = ()):
+    """Additive sums behind every metric of a role (means as __num/__den), grouped by (*by, player_id).
+
+    None if the role's mask or key columns are missing. Sums for disjoint sets of plays
+    (e.g. one frame per game) add up to the sums for all of them, so they can be merged later.
+    """
+    values = role_values(pbp, spec, params)
+    if values is None:
+        return None
+    df, key, cols = values
+    keys = [df[c] for c in by] + [key]
+    return cols.groupby(keys).sum()
+
+def role_values(pbp: pd.DataFrame, spec: RoleSpec, params: dict):
+    """The role's plays and their per-play values before grouping: (plays, player_id per play, additive columns).
+
+    None if the role's mask or key columns are missing. Nulls in the columns count as 0 once summed.
+    """
+    try:
+        df = pbp[_eval(pbp, spec.mask, params).astype(bool)] if spec.mask else pbp
+        key = df[spec.key].rename('player_id')
+    except MISSING:
+        return None
+
+    cols = {}
+    for name, agg in spec.metrics.items():
+        if agg.how == 'size':
+            cols[name] = np.ones(len(df), dtype='int64')
+            continue
+        try:
+            val = _eval(df, agg.expr, params)
+            valid = _eval(df, agg.where, params).astype(bool) if agg.where else None
+        except MISSING:
+            # left out of the sums; finish_role fills the default
+            continue
+        if agg.how == 'sum':
+            val = val if valid is None else val.where(valid)
+            # compact int8/int16 pbp columns would overflow once summed over a season
+            cols[name] = val.astype('int64') if val.dtype.kind in 'biu' else val
+        else:
+            # mean -> sum of values / count of non-null values (masked rows are NaN, so they are skipped)
+            keep = val.notna() if valid is None else val.notna() & valid
+            cols[f'{name}__num'] = val.astype('float64').where(keep)
+            cols[f'{name}__den'] = keep
+
+    return df, key, pd.DataFrame(cols, index=df.index)
+
+def finish_role(sums: pd.DataFrame, spec: RoleSpec) -> pd.DataFrame:
+    """Per-player metrics from partial_role sums indexed by player_id; means are derived from the summed parts."""
+    out = pd.DataFrame(index=sums.index)
+    for name, agg in spec.metrics.items():
+        if agg.how == 'mean':
+            if f'{name}__num' not in sums.columns:
+                out[name] = np.nan
+                continue
+            den = sums[f'{name}__den']
+            out[name] = sums[f'{name}__num'].div(den.where(den > 0))
+        elif name in sums.columns:
+            out[name] = sums[name]
+        else:
+            out[name] = agg.default if agg.how == 'sum' else np.nan
+    out.index.name = 'player_id'
+    return out
+
+def aggregate_role(pbp: pd.DataFrame, spec: RoleSpec, params: dict):
+    """Evaluate every metric of a role in one groupby pass; None if the role's columns are missing."""
+    sums = partial_role(pbp, spec, params)
+    return None if sums is None else finish_role(sums, spec)
+
+def columns_used(table: TableSpec, defs: dict = None) -> list:
+    """Every pbp column the table's role keys, masks and metrics read (for column projection at load time)."""
+    params = meta(defs)
+    cols = []
+    for role in table.roles:
+        cols.append(role.key)
+        exprs = [role.mask] + [e for agg in role.metrics.values() for e in (agg.expr, agg.where)]
+        for e in exprs:
+            if e:
+                cols += sorted(names_in(e.format(**params)))
+    return list(dict.fromkeys(cols))
+
+def _join_roles(parts, table: TableSpec) -> pd.DataFrame:
+    out = None
+    for part in parts:
+        if part is None:
+            continue
+        out = part if out is None else out.join(part, how='outer')
+    if out is None:
+        out = pd.DataFrame(index=pd.Index([], name='player_id'))
+    out.index.name = 'player_id'
+    return derive(out, table)
+
+def derive(out: pd.DataFrame, table: TableSpec) -> pd.DataFrame:
+    """Add the table's derived columns to per-player metrics (skipping any whose inputs are missing)."""
+    for name, fn in table.derived.items():
+        try:
+            out[name] = fn(out) if callable(fn) else evaluate(out, fn)
+        except MISSING:
+            pass
+    return out
+
+def aggregate(pbp: pd.DataFrame, table: TableSpec, defs: dict = None, by: tuple = ()) -> pd.DataFrame:
+    """Per-player counts, sums and means for a table, indexed by player_id (by=('game_id',): by game and player)."""
+    if 'game_id' in pbp.columns:
+        # summed per game first, as an incremental or streamed build merges them
+        return combine(partials(pbp, table, defs), table, by)
+    if by:
+        raise ValueError(f'grouping by {by} needs the game_id column')
+    params = meta(defs)
+    return _join_roles((aggregate_role(pbp, role, params) for role in table.roles), table)
+
+def partials(pbp: pd.DataFrame, table: TableSpec, defs: dict = None, by: tuple = ('game_id',)) -> dict:
+    """partial_role sums for every role of a table, as {role key: frame with by/player_id columns}."""
+    params = meta(defs)
+    out = {}
+    for role in table.roles:
+        sums = partial_role(pbp, role, params, by)
+        if sums is not None:
+            out[role.key] = sums.reset_index()
+    return out
+
+def combine(parts: dict, table: TableSpec, by: tuple = (), exact: bool = False) -> pd.DataFrame:
+    """aggregate() from stored partials: sum each role's parts per player (per (*by, player) with by), then derive the metrics.
+
+    One vectorized groupby().sum() per role. With exact, float columns are summed exactly instead
+    (exact_sums, one math.fsum per player and column), so the totals don't depend on the order or
+    grouping of the parts; the incremental store and Totals merge that way.
+    """
+    def role_totals(role):
+        df = parts.get(role.key)
+        if df is None:
+            return None
+        cols = [c for c in df.columns if c in role_columns(role)]
+        if not exact:
+            return finish_role(df.groupby([*by, 'player_id'])[cols].sum(), role)
+        floats = [c for c in cols if df[c].dtype.kind == 'f']
+        keys = [*by, 'player_id']
+        sums = df.groupby(keys)[[c for c in cols if c not in floats]].sum()
+        if floats:
+            sums = sums.join(exact_sums(df[keys + floats], keys))
+        return finish_role(sums[cols], role)
+    return _join_roles((role_totals(role) for role in table.roles), table)
+
+class Totals:
+    """Per-player totals for a table, fed partials() of one batch of plays at a time.
+
+    Each batch's per-game partials are kept as they come, with no per-row work, and merged once in
+    result() by combine(exact=True): a groupby().sum() of the integer columns and one math.fsum per player of
+    each float column. Memory grows with player-games, not plays, and result() does not depend on
+    how the plays were split into batches.
+    """
+    def __init__(self, table: TableSpec):
+        self.table = table
+        self.kept = []  # every batch's partials, {role key: frame}
+
+    def add(self, parts: dict):
+        self.kept.append(parts)
+
+    def parts(self) -> dict:
+        """Every batch's partials as one {role key: frame}, as partials() of all the plays."""
+        out = {}
+        for role in self.table.roles:
+            frames = [p[role.key] for p in self.kept if role.key in p]
+            if frames:
+                out[role.key] = pd.concat(frames, ignore_index=True)
+        return out
+
+    def result(self) -> pd.DataFrame:
+        return combine(self.parts(), self.table, exact=True)
+
+def exact_sums(df: pd.DataFrame, keys: list) -> pd.DataFrame:
+    """math.fsum of every other column of df per distinct `keys`, indexed by them in sorted order.
+
+    One sort of the rows, then one fsum per group and column over a slice of a Python list.
+    """
+    groups = df.groupby(keys, sort=True).ngroup().to_numpy()
+    order = np.argsort(groups, kind='stable')
+    starts = np.flatnonzero(np.r_[True, groups[order][1:] != groups[order][:-1]]) if len(df) else np.array([], dtype='int64')
+    bounds = list(zip(starts.tolist(), np.r_[starts[1:], len(df)].tolist()))
+    index = pd.MultiIndex.from_frame(df[keys].iloc[order[starts]]) if len(keys) > 1 else \
+        pd.Index(df[keys[0]].array.take(order[starts]), name=keys[0])
+    out = {}
+    for c in df.columns.drop(keys):
+        values = df[c].to_numpy(dtype='float64')[order].tolist()
+        out[c] = np.array([math.fsum(values[a:b]) for a, b in bounds], dtype='float64')
+    return pd.DataFrame(out, index=index)
+
+def role_columns(role: RoleSpec) -> set:
+    """Every column partial_role can produce for a role."""
+    cols = set()
+    for name, agg in role.metrics.items():
+        cols |= {f'{name}__num', f'{name}__den'} if agg.how == 'mean' else {name}
+    return cols
+
+def _split_ratio(formula: str):
+    """'a / (b + c)' -> ('a', '(b + c)'); None unless there is exactly one top-level '/'."""
+    depth, cuts = 0, []
+    for i, ch in enumerate(formula):
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == '/' and depth == 0:
+            cuts.append(i)
+    if len(cuts) != 1:
+        return None
+    return formula[:cuts[0]].strip(), formula[cuts[0] + 1:].strip()
+
+def ratio_formulas(name: str, defs: dict = None) -> dict:
+    """Every metric in a YAML section whose formula is a ratio, as {metric: (numerator, denominator)}."""
+    section = (defs or load_definitions())[name]
+    ratios = {}
+    for group in section.values():
+        for metric, d in group.items():
+            parsed = _split_ratio(str((d or {}).get('formula', '')))
+            if parsed:
+                ratios[metric] = parsed
+    return ratios
+
+def finalize_rates(out: pd.DataFrame, table: TableSpec, defs: dict = None) -> pd.DataFrame:
+    """Add the YAML ratio metrics the spec did not produce; null when the denominator is 0 or a term is unavailable."""
+    for metric, (num, den) in ratio_formulas(table.name, defs).items():
+        if metric in out.columns:
+            continue
+        try:
+            n, d = evaluate(out, num), evaluate(out, den)
+        except (NameError, KeyError, SyntaxError, ValueError, TypeError):
+            out[metric] = np.nan
+            continue
+        out[metric] = n / d.where(d != 0)
+    return out
@@ -0,0 +1,116 @@
+import re
+from functools import lru_cache
+from pathlib import Path
+import pandas as pd, pyarrow as pa, pyarrow.compute as pc, pyarrow.feather as feather, pyarrow.parquet as pq
+
+from .config import SCHEMA_DIR
+from .metrics import meta
+
+# Typed outputs: each table is conformed to <stem>_schema_header.csv (column order) and
+# <stem>_data_dictionary.csv (types, definitions) and written as Parquet, Feather/Arrow IPC
+# and/or CSV. Parquet is the default; reading it back needs no text parsing. The stem is
+# players_<table> for player tables and the table name itself for team tables. The weekly player
+# tables (weekly.py) have their season table's schema with the per-game keys after season.
+
+TABLES = ('passing', 'rushing', 'receiving', 'defense')
+TEAM_TABLES = ('team_season', 'team_game')
+WEEKLY_TABLES = tuple(f'{t}_weekly' for t in TABLES)
+# (field, type, definition) of the weekly tables' keys
+WEEKLY_KEYS = [
+    ('week', 'int', 'Week of the game (null when the pbp has no week column).'),
+    ('game_id', 'int', 'CFBD game identifier; the window ends with this game.'),
+    ('window', 'string', "Games the row covers: 'game' (this one), 'last_3' (the player's last 3 through this one) "
+                         "or 'to_date' (all of the player's games of the season through this one)."),
+]
+ARROW_TYPES = {'int': pa.int64(), 'float': pa.float64(), 'string': pa.string()}
+SUFFIXES = {'parquet': '.parquet', 'feather': '.arrow', 'csv': '.csv'}
+# int columns as nullable Int64 in pandas, so a count with nulls stays an integer
+INT_MAPPER = {pa.int64(): pd.Int64Dtype()}.get
+
+def stem(table: str) -> str:
+    return table if table in TEAM_TABLES else f'players_{table}'
+
+@lru_cache(maxsize=None)
+def table_schema(table: str) -> pa.Schema:
+    """Arrow schema for a player or team table; each field carries its category, definition and formula as metadata."""
+    if table in WEEKLY_TABLES:
+        season = table_schema(table[:-len('_weekly')])
+        keys = [pa.field(c, ARROW_TYPES[t], metadata={'category': 'identifiers', 'definition': d, 'formula': ''})
+                for c, t, d in WEEKLY_KEYS]
+        fields = list(season)
+        return pa.schema(fields[:1] + keys + fields[1:], metadata={'table': stem(table)})
+    header = pd.read_csv(SCHEMA_DIR/f'{stem(table)}_schema_header.csv', nrows=0).columns
+    dictionary = pd.read_csv(SCHEMA_DIR/f'{stem(table)}_data_dictionary.csv', dtype=str).fillna('')
+    fields = dictionary.set_index('Field')
+    return pa.schema([
+        pa.field(c, ARROW_TYPES[fields.at[c, 'Type']], metadata={
+            'category': fields.at[c, 'Category'], 'definition': fields.at[c, 'Definition'],
+            'formula': fields.at[c, 'Formula/Notes']})
+        for c in header
+    ], metadata={'table': stem(table)})
+
+def with_intervals(schema: pa.Schema, columns) -> pa.Schema:
+    """schema plus the optional <rate>_lo / <rate>_hi bootstrap interval columns (uncertainty.py) among `columns`, each after its rate."""
+    present = set(columns)
+    fields = []
+    for f in schema:
+        fields.append(f)
+        for suffix, bound in (('_lo', 'Lower'), ('_hi', 'Upper')):
+            if pa.types.is_floating(f.type) and f.name + suffix in present:
+                fields.append(pa.field(f.name + suffix, f.type, metadata={
+                    'category': 'uncertainty', 'definition': f'{bound} bound of the bootstrap interval of {f.name}.',
+                    'formula': 'percentile of the Poisson-bootstrap replicates (cfb_analytics.uncertainty)'}))
+    return pa.schema(fields, metadata=schema.metadata)
+
+def rounding_decimals(defs: dict = None) -> int:
+    """Decimals for float columns, from the YAML meta rounding rule ('Rates to 4 decimals; ...')."""
+    m = re.search(r'(\d+)\s*decimals', str(meta(defs).get('rounding', '')))
+    return int(m.group(1)) if m else 4
+
+def conform(df: pd.DataFrame, table: str, defs: dict = None) -> pa.Table:
+    """Columns in schema order (missing ones null, extras dropped), cast to the schema types, floats rounded.
+
+    Interval columns (<rate>_lo / <rate>_hi) are kept when df has them.
+    """
+    schema = with_intervals(table_schema(table), df.columns)
+    decimals = rounding_decimals(defs)
+    arrays = []
+    for f in schema:
+        if f.name not in df.columns:
+            arrays.append(pa.nulls(len(df), f.type))
+            continue
+        # safe cast: a float count with a fractional part raises instead of truncating
+        arr = pa.Array.from_pandas(df[f.name]).cast(f.type)
+        if pa.types.is_floating(f.type):
+            arr = pc.round(arr, decimals)
+        arrays.append(arr)
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+def write_table(df: pd.DataFrame, table: str, season: int, outdir: Path, formats=('parquet',)) -> list:
+    """Write one season's table in each format; returns the paths written."""
+    data = conform(df, table)
+    outdir = Path(outdir); outdir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for fmt in formats:
+        if fmt not in SUFFIXES:
+            raise ValueError(f'unknown output format {fmt!r}; expected one of {sorted(SUFFIXES)}')
+        p = outdir/f'{stem(table)}_{season}{SUFFIXES[fmt]}'
+        if fmt == 'parquet':
+            pq.write_table(data, p)
+        elif fmt == 'feather':
+            feather.write_feather(data, p)
+        else:
+            data.to_pandas(types_mapper=INT_MAPPER).to_csv(p, index=False)
+        paths.append(p)
+    return paths
+
+def read_season(outdir: Path, season: int, tables=TABLES) -> dict:
+    """A season's tables as {table: DataFrame}, from Feather (memory-mapped) or Parquet, whichever was written."""
+    out = {}
+    for t in tables:
+        base = Path(outdir)/f'{stem(t)}_{season}'
+        if base.with_suffix('.arrow').exists():
+            out[t] = feather.read_table(base.with_suffix('.arrow'), memory_map=True).to_pandas(types_mapper=INT_MAPPER)
+        elif base.with_suffix('.parquet').exists():
+            out[t] = pq.read_table(base.with_suffix('.parquet')).to_pandas(types_mapper=INT_MAPPER)
+    return out
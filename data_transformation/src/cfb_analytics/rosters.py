@@ -0,0 +1,127 @@
+import json, os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .etl.common import ID_DTYPE, load_rosters
+
+# Every season's rosters in one table sorted by (season, player_id), one row per player-season.
+# A season is a contiguous block of rows, so slicing it is a lookup of its bounds, and each season
+# has a prebuilt player_id -> row index that every assembler (and every table thread) reuses for its
+# roster join.
+#
+# The table is cached as <rawdir>/rosters.parquet and rebuilt from the rosters.csv files
+# (<rawdir>/<season>/rosters.csv) whenever one of them is added, removed or modified.
+
+CACHE_NAME = 'rosters.parquet'
+SOURCES_KEY = b'cfb_analytics.roster_sources'
+
+def roster_sources(rawdir: Path) -> dict:
+    """{season dir: [mtime_ns, size]} of every rosters.csv under rawdir; the cache is valid while this is unchanged."""
+    out = {}
+    for p in sorted(Path(rawdir).glob('*/rosters.csv')):
+        st = p.stat()
+        out[p.parent.name] = [st.st_mtime_ns, st.st_size]
+    return out
+
+class RosterIndex:
+    def __init__(self, frame: pd.DataFrame):
+        frame = frame.copy()
+        frame['season'] = frame['season'].astype('int16')
+        for c in ('player_id', 'team_id'):
+            if c in frame.columns and frame[c].dtype != ID_DTYPE:
+                frame[c] = frame[c].astype(ID_DTYPE)
+        # a player listed twice in a season (traded rows in the CFBD pull) would duplicate joined rows
+        frame = frame.dropna(subset=['player_id']).drop_duplicates(['season', 'player_id'])
+        self.frame = frame.sort_values(['season', 'player_id'], kind='stable').reset_index(drop=True)
+        seasons = self.frame['season'].to_numpy()
+        uniq, starts = np.unique(seasons, return_index=True)
+        stops = np.append(starts[1:], len(seasons))
+        self.bounds = {int(s): (int(a), int(b)) for s, a, b in zip(uniq, starts, stops)}
+        self.ids = {s: pd.Index(self.frame['player_id'].array[a:b]) for s, (a, b) in self.bounds.items()}
+        # an Index builds its hash table and uniqueness flag on first use, which is not thread-safe, and
+        # the build's table threads share these: build both here, before any thread gets the index
+        for ids in self.ids.values():
+            ids.is_unique
+            ids.get_indexer(ids[:1])
+
+    @classmethod
+    def of(cls, rosters) -> 'RosterIndex':
+        """rosters as an index (a DataFrame of any seasons is indexed; an index is returned as is)."""
+        if isinstance(rosters, cls):
+            return rosters
+        if rosters is None or len(rosters) == 0:
+            return cls(pd.DataFrame({'season': pd.Series(dtype='int16'), 'player_id': pd.Series(dtype=ID_DTYPE)}))
+        return cls(rosters)
+
+    @classmethod
+    def load(cls, rawdir: Path, years=None, cache: bool = True) -> 'RosterIndex':
+        """Every season under rawdir (or just `years`), from the Parquet cache when it is current."""
+        rawdir = Path(rawdir)
+        sources = roster_sources(rawdir)
+        path = rawdir/CACHE_NAME
+        frame = None
+        if cache and path.exists():
+            meta = pq.read_schema(path).metadata or {}
+            if json.loads(meta.get(SOURCES_KEY, b'null')) == sources:
+                frame = pd.read_parquet(path)
+        if frame is None:
+            frames = [load_rosters(rawdir/s/'rosters.csv') for s in sources]
+            frame = cls.of(pd.concat(frames, ignore_index=True) if frames else None).frame
+            if cache and sources:
+                table = pa.Table.from_pandas(frame, preserve_index=False)
+                table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                                       SOURCES_KEY: json.dumps(sources).encode()})
+                # write then rename, so a concurrent reader never sees half a file
+                tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+                pq.write_table(table, tmp)
+                os.replace(tmp, path)
+        index = cls(frame)
+        return index.subset(years) if years is not None else index
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    @property
+    def columns(self) -> pd.Index:
+        return self.frame.columns
+
+    @property
+    def seasons(self) -> list:
+        return list(self.bounds)
+
+    def subset(self, years) -> 'RosterIndex':
+        """The seasons in `years` only (e.g. the ones a build covers)."""
+        keep = [self.bounds[y] for y in sorted(set(int(y) for y in years)) if y in self.bounds]
+        rows = np.concatenate([np.arange(a, b) for a, b in keep]) if keep else np.array([], dtype='int64')
+        return RosterIndex(self.frame.iloc[rows])
+
+    def season(self, year: int) -> pd.DataFrame:
+        """One season's rows (a slice, not a copy)."""
+        a, b = self.bounds.get(int(year), (0, 0))
+        return self.frame.iloc[a:b]
+
+    def lookup(self, year: int, player_ids) -> np.ndarray:
+        """Row positions in self.season(year) of player_ids; -1 where a player is not on that season's rosters."""
+        ids = self.ids.get(int(year))
+        if ids is None:
+            return np.full(len(player_ids), -1, dtype='int64')
+        return ids.get_indexer(pd.Index(player_ids, dtype=ID_DTYPE))
+
+    def attach(self, out: pd.DataFrame, year: int, columns) -> pd.DataFrame:
+        """out (indexed by player_id) with roster `columns` of that season added, null where the player is not listed."""
+        pos = self.lookup(year, out.index)
+        season = self.season(year)
+        values = {c: season[c].array.take(pos, allow_fill=True) if c in season.columns else np.nan
+                  for c in columns}
+        return out.assign(**values)
+
+    def teams(self, year: int) -> pd.DataFrame:
+        """One season's teams (team_name, conference), indexed by team_id."""
+        season = self.season(year)
+        if 'team_id' not in season.columns:
+            return pd.DataFrame(columns=['team_name', 'conference'], index=pd.Index([], dtype=ID_DTYPE, name='team_id'))
+        teams = season.dropna(subset=['team_id']).drop_duplicates('team_id').set_index('team_id')
+        return teams.reindex(columns=['team_name', 'conference'])
@@ -0,0 +1,63 @@
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from .etl.common import pbp_scan, arrow_to_pbp, enrich_pbp, pbp_columns
+from .metrics import Totals, partials
+
+# Out-of-core aggregation: pbp is read in record batches of about `batch_rows` plays, each batch is
+# enriched and reduced to per-game partial sums for every table at once, and the sums are kept in
+# per-table Totals and merged per player at the end. Only one batch of plays is in memory at a time.
+#
+# Batches are cut on game boundaries (the plays of the game still being read are carried into the next
+# batch), so each game's partial sums are computed from all of its plays, as in aggregate(); Totals sums
+# them exactly (combine(exact=True)), so the totals do not depend on the batch size.
+
+BATCH_ROWS = 64 * 1024  # one row group of the pbp dataset (pbp_dataset.ROW_GROUP_ROWS)
+
+def iter_games(path: Path, columns=None, season: int = None, weeks: tuple = None, plays: str = None,
+               batch_rows: int = BATCH_ROWS):
+    """pbp (compact schema) in frames of whole games, about batch_rows plays each, in file order."""
+    dataset, cols, expr = pbp_scan(path, columns, season, weeks, plays)
+    # single-threaded, no read-ahead: a threaded scan keeps decoding batches while the consumer
+    # is busy and the buffered ones would not count against the memory bound
+    batches = dataset.to_batches(columns=cols, filter=expr, batch_size=batch_rows, batch_readahead=0,
+                                 fragment_readahead=0, use_threads=False)
+    carry = None
+    for batch in batches:
+        if batch.num_rows == 0:
+            continue
+        df = arrow_to_pbp(batch)
+        if carry is not None:
+            df = pd.concat([carry, df], ignore_index=True)
+        games = df['game_id'].to_numpy()
+        # the last game may continue in the next batch
+        start = np.flatnonzero(games != games[-1])
+        if len(start) == 0:
+            carry = df
+            continue
+        cut = start[-1] + 1
+        carry = df.iloc[cut:]
+        yield df.iloc[:cut]
+    if carry is not None and len(carry):
+        yield carry
+
+def stream_accumulate(path: Path, tables, season: int = None, weeks: tuple = None, plays: str = None,
+                      model=None, defs: dict = None, batch_rows: int = BATCH_ROWS) -> dict:
+    """{table name: metrics.Totals} fed every batch of pbp, in one pass; Totals.parts are the per-game
+    partials, for outputs with a game grain.
+
+    season=None pools every season in the dataset (game ids are unique across seasons).
+    """
+    acc = {t.name: Totals(t) for t in tables}
+    for games in iter_games(path, pbp_columns(*tables), season, weeks, plays, batch_rows):
+        games = enrich_pbp(games, model, defs)
+        for t in tables:
+            acc[t.name].add(partials(games, t, defs))
+    return acc
+
+def stream_totals(path: Path, tables, season: int = None, weeks: tuple = None, plays: str = None,
+                  model=None, defs: dict = None, batch_rows: int = BATCH_ROWS) -> dict:
+    """{table name: per-player totals} for every table in one pass over pbp; equal to aggregate() on the whole frame."""
+    acc = stream_accumulate(path, tables, season, weeks, plays, model, defs, batch_rows)
+    return {name: a.result() for name, a in acc.items()}
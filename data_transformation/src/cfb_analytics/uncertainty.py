@@ -0,0 +1,151 @@
+import math
+import numpy as np
+import pandas as pd
+
+from .etl.common import ensure_enriched
+from .metrics import TableSpec, derive, finalize_rates, finish_role, meta, ratio_formulas, role_values
+
+# Bootstrap intervals for the rate metrics of a player table. A replicate gives every play a
+# Poisson(1) weight, which resamples each player's plays with replacement without drawing per
+# player (the Poisson bootstrap); one play keeps its weight in every role it is in. Replicates are
+# drawn BLOCK at a time as one (plays x replicates) weight matrix. A player's weighted sums for the
+# whole block are one matrix product, (replicates x plays) @ (plays x columns); players with about as
+# many plays (up to the same power of two) are padded to the same length with zero weights, so each such
+# class is one stacked np.matmul, not a Python loop over players. The rates of every replicate then go
+# through finish_role / derive / the YAML ratios at once, as the point estimates do. Memory is about
+# 2 x plays x BLOCK weights (padding at most doubles a class), whatever the number of replicates.
+
+REPLICATES = 1000
+LEVEL = 0.95
+BLOCK = 100  # replicates per weight matrix
+# Poisson(1) inverse CDF at the midpoints of 2**16 equal steps: a weight is one lookup of a uint16 draw
+# (weights above 8, probability ~1e-6, are cut to 8)
+POISSON_LUT = np.searchsorted(np.cumsum([math.exp(-1) / math.factorial(k) for k in range(12)]),
+                              (np.arange(2**16) + 0.5) / 2**16, side='right').astype('float32')
+
+def rate_columns(table: TableSpec, defs: dict = None) -> list:
+    """The table's rate metrics: the spec's means and every YAML ratio formula."""
+    means = [name for role in table.roles for name, agg in role.metrics.items() if agg.how == 'mean']
+    return list(dict.fromkeys(means + list(ratio_formulas(table.name, defs))))
+
+def poisson_weights(rng: np.random.Generator, shape: tuple) -> np.ndarray:
+    """Poisson(1) weights by inverse CDF (POISSON_LUT), float32."""
+    return POISSON_LUT[rng.integers(0, 2**16, shape, dtype='uint16')]
+
+def _role_plays(pbp: pd.DataFrame, table: TableSpec, params: dict) -> list:
+    """(role, player ids, columns, size classes) per role.
+
+    A role's plays are sorted by player and its players split into classes by play count (up to the
+    same power of two). A class is (positions of its players, row in pbp of each of their plays, -1
+    past a player's last, values), all of its players padded to its longest; values are role_values as
+    float32, 0 in the padding.
+    """
+    out = []
+    for role in table.roles:
+        got = role_values(pbp, role, params)
+        if got is None:
+            continue
+        df, key, cols = got
+        keep = key.notna().to_numpy()
+        key = key[keep].to_numpy(dtype='int64')
+        order = np.argsort(key, kind='stable')
+        key = key[order]
+        starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]]) if len(key) else np.array([], dtype='int64')
+        counts = np.diff(np.r_[starts, len(key)])
+        # the last entry of each is the padding
+        values = np.vstack([cols.to_numpy(dtype='float32', na_value=0.0)[keep][order],
+                            np.zeros((1, len(cols.columns)), dtype='float32')])
+        # pbp has a RangeIndex, so the index of a role's plays is their row in pbp
+        plays = np.r_[df.index.to_numpy()[keep][order], -1]
+        size = np.ceil(np.log2(np.maximum(counts, 1))).astype('int64')
+        classes = []
+        for k in np.unique(size):
+            idx = np.flatnonzero(size == k)
+            steps = np.arange(counts[idx].max())
+            at = np.where(steps < counts[idx, None], starts[idx, None] + steps, len(key))
+            classes.append((idx, plays[at], values[at]))
+        out.append((role, key[starts], cols.columns, classes))
+    return out
+
+def replicate_rates(pbp: pd.DataFrame, table: TableSpec, replicates: int = REPLICATES, seed: int = 0,
+                    defs: dict = None) -> tuple:
+    """(players, {rate: (players x replicates) float32 array}) for every rate metric of the table.
+
+    Block k of replicates is drawn from the stream [seed, k], so a seed always gives the same replicates.
+    """
+    params = meta(defs)
+    pbp = ensure_enriched(pbp).reset_index(drop=True)
+    roles = _role_plays(pbp, table, params)
+    players = pd.Index(np.unique(np.concatenate([r[1] for r in roles])) if roles else [], name='player_id')
+    # weights only for the plays some role reads; the padding (-1) reads the zero row after them
+    used = np.unique(np.concatenate([p[p >= 0] for r in roles for _, p, _ in r[3]] or [np.array([], dtype='int64')]))
+    rows = np.full(len(pbp) + 1, len(used), dtype='int64')
+    rows[used] = np.arange(len(used))
+    roles = [(role, ids, columns, [(idx, rows[plays], values) for idx, plays, values in classes])
+             for role, ids, columns, classes in roles]
+    rates = rate_columns(table, defs)
+    store = {}
+    for k, first in enumerate(range(0, replicates, BLOCK)):
+        b = min(BLOCK, replicates - first)
+        weights = poisson_weights(np.random.default_rng([seed, k]), (len(used), b))
+        weights = np.vstack([weights, np.zeros((1, b), dtype='float32')])
+        index = pd.MultiIndex.from_product([players, np.arange(b)], names=['player_id', 'replicate'])
+        frames = []
+        for role, ids, columns, classes in roles:
+            sums = np.empty((len(ids), b, len(columns)), dtype='float32')
+            for idx, plays, values in classes:
+                # (players x replicates x plays) @ (players x plays x columns), one stacked matmul per class
+                sums[idx] = np.matmul(weights[plays].transpose(0, 2, 1), values)
+            sums = pd.DataFrame(sums.reshape(-1, len(columns)), columns=columns,
+                                index=pd.MultiIndex.from_product([ids, np.arange(b)], names=index.names))
+            frames.append(finish_role(sums, role))
+        out = pd.concat(frames, axis=1).reindex(index) if frames else pd.DataFrame(index=index)
+        out = finalize_rates(derive(out, table), table, defs)
+        for c in rates:
+            if c not in out.columns:
+                continue
+            col = store.setdefault(c, np.full((len(players), replicates), np.nan, dtype='float32'))
+            col[:, first:first + b] = out[c].to_numpy(dtype='float32', na_value=np.nan).reshape(len(players), b)
+    return players, store
+
+def intervals(pbp: pd.DataFrame, table: TableSpec, replicates: int = REPLICATES, level: float = LEVEL,
+              seed: int = 0, defs: dict = None) -> pd.DataFrame:
+    """Percentile bootstrap intervals of every rate metric, as <rate>_lo / <rate>_hi columns indexed by player_id.
+
+    Null where no replicate defines the rate (e.g. a metric the pbp has no column for).
+    """
+    players, reps = replicate_rates(pbp, table, replicates, seed, defs)
+    q = [(1 - level) / 2, 1 - (1 - level) / 2]
+    out = {}
+    for c, values in reps.items():
+        out[f'{c}_lo'], out[f'{c}_hi'] = quantiles(values, q)
+    return pd.DataFrame(out, index=players)
+
+def quantiles(values: np.ndarray, q) -> list:
+    """np.nanquantile(values, q, axis=1) (linear interpolation) of a players x replicates array, from one sort.
+
+    nanquantile goes row by row once there are NaNs (replicates where a rate is undefined); NaN if a row has none.
+    """
+    v = np.sort(values, axis=1).astype('float64')  # NaNs sort last
+    n = (~np.isnan(v)).sum(axis=1)
+    out = []
+    for p in q:
+        pos = np.maximum(p * (n - 1), 0)
+        lo = np.floor(pos).astype('int64')
+        hi = np.minimum(lo + 1, np.maximum(n - 1, 0))
+        a = np.take_along_axis(v, lo[:, None], axis=1)[:, 0]
+        b = np.take_along_axis(v, hi[:, None], axis=1)[:, 0]
+        out.append(a + (pos - lo) * (b - a))
+    return out
+
+def attach_intervals(out: pd.DataFrame, ci: pd.DataFrame) -> pd.DataFrame:
+    """out (an assembled player table) with each rate's _lo/_hi columns right after the rate; null for players not in ci."""
+    pos = pd.Index(ci.index).get_indexer(pd.Index(out['player_id']))
+    cols = []
+    for c in out.columns:
+        cols.append(c)
+        for s in ('_lo', '_hi'):
+            if c + s in ci.columns:
+                out[c + s] = np.append(ci[c + s].to_numpy(dtype='float64'), np.nan)[pos]
+                cols.append(c + s)
+    return out[cols]
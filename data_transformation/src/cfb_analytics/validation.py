@@ -1,23 +1,210 @@
+from dataclasses import dataclass
+import numpy as np
 import pandas as pd
 
-def validate_passing(df: pd.DataFrame): 
-    issues = []
-    if (df['completions'] > df['pass_attempts']).any(): issues.append('completions > attempts')
-    if (df['pressures_faced'] < df['sacks_taken']).any(): issues.append('pressures_faced < sacks_taken')
-    return issues
+from .metrics import MISSING, evaluate, meta, names_in, ratio_formulas
+from .output import TABLES, WEEKLY_TABLES, rounding_decimals
 
-def validate_rushing(df: pd.DataFrame): 
-    return []
+# Invariants of the player tables, declared once below (bounds and cross-column inequalities) or derived
+# from the YAML (every ratio formula, the meta primary key). Each rule is one vectorized comparison over a
+# whole table, which may hold any number of seasons; failing rows come back in a violations frame keyed by
+# the table's key columns (season, then player_id, team_id, game_id or window; null where not a key of the table).
+# A rule skips rows where one of its sides is null (metric unavailable), and tables that lack a column it names.
+
+@dataclass(frozen=True)
+class Check:
+    """lhs op rhs on every row where both sides are known; sides are column names or pd.eval expressions."""
+    lhs: str
+    op: str
+    rhs: str
+
+    @property
+    def name(self) -> str:
+        return f'{self.lhs} {self.op} {self.rhs}'
+
+@dataclass(frozen=True)
+class Bounds:
+    """Each of `columns` within [lo, hi] where known (None: unbounded)."""
+    columns: tuple
+    lo: float = None
+    hi: float = None
+
+OPS = {'<=': np.less_equal, '>=': np.greater_equal, '<': np.less, '>': np.greater, '==': np.equal}
+# key columns a violation carries from its row, with their dtypes
+VIOLATION_KEYS = {'season': 'Int32', 'player_id': 'Int32', 'team_id': 'Int32', 'game_id': 'Int64', 'window': 'object'}
+VIOLATION_COLUMNS = ['table', 'rule', *VIOLATION_KEYS, 'value', 'expected']
+
+RULES = {
+    'passing': [
+        Bounds(('games', 'starts', 'dropbacks', 'pass_attempts', 'sacks_taken', 'pressures_faced', 'completions',
+                'pass_td', 'interceptions'), lo=0),
+        Bounds(('completion_pct', 'td_rate', 'int_rate', 'pressure_rate', 'sack_rate', 'success_rate',
+                'explosive_pass_rate'), lo=0, hi=1),
+        Check('starts', '<=', 'games'),
+        Check('completions', '<=', 'pass_attempts'),
+        Check('pass_td', '<=', 'completions'),
+        Check('interceptions', '<=', 'pass_attempts - completions'),
+        Check('dropbacks', '>=', 'pass_attempts + sacks_taken'),
+        # pressures are not charted yet (null), so this one checks nothing until they are
+        Check('sacks_taken', '<=', 'pressures_faced'),
+    ],
+    'rushing': [
+        Bounds(('games', 'snaps', 'rush_att', 'rush_td', 'fumbles', 'broken_tackles', 'forced_missed_tackles'), lo=0),
+        Bounds(('td_rate', 'fumble_rate', 'success_rate', 'explosive_rush_rate', 'rpo_carry_rate', 'read_option_rate',
+                'att_light_box_rate', 'att_heavy_box_rate'), lo=0, hi=1),
+        Check('rush_td', '<=', 'rush_att'),
+        Check('fumbles', '<=', 'rush_att'),
+    ],
+    'receiving': [
+        Bounds(('games', 'snaps', 'routes', 'targets', 'receptions', 'rec_td', 'drops', 'fumbles'), lo=0),
+        Bounds(('tgt_per_route', 'catch_pct', 'drop_rate', 'tds_per_target', 'success_rate', 'explosive_rec_rate',
+                'slot_rate', 'wide_rate', 'inline_te_rate', 'man_tgt_rate', 'zone_tgt_rate'), lo=0, hi=1),
+        Check('receptions', '<=', 'targets'),
+        Check('rec_td', '<=', 'receptions'),
+        Check('drops', '<=', 'targets - receptions'),
+        Check('targets', '<=', 'routes'),
+    ],
+    'defense': [
+        Bounds(('games', 'starts', 'def_snaps', 'total_tackles', 'solo_tackles', 'assists', 'missed_tackles',
+                'pressures', 'sacks', 'targets', 'receptions_allowed', 'td_allowed', 'interceptions', 'pass_breakups',
+                'stops', 'tackles_for_loss', 'forced_fumbles', 'fumble_recoveries', 'defensive_tds'), lo=0),
+        Bounds(('pressure_rate', 'win_rate', 'completion_pct_allowed', 'missed_tackle_rate', 'stop_rate',
+                'coverage_success_rate_allowed', 'explosive_allowed_rate'), lo=0, hi=1),
+        Check('starts', '<=', 'games'),
+        Check('total_tackles', '==', 'solo_tackles + assists'),
+        Check('receptions_allowed', '<=', 'targets'),
+        Check('td_allowed', '<=', 'receptions_allowed'),
+    ],
+}
+TEAM_RULES = [
+    Bounds(('plays', 'pass_attempts', 'completions', 'rush_att', 'touchdowns', 'interceptions', 'sacks_taken',
+            'plays_against'), lo=0),
+    Bounds(('completion_pct', 'pass_rate', 'success_rate', 'success_rate_allowed'), lo=0, hi=1),
+    Check('completions', '<=', 'pass_attempts'),
+    Check('plays', '==', 'pass_attempts + rush_att'),
+]
+RULES.update(team_season=TEAM_RULES, team_game=TEAM_RULES)
+# a weekly table's rows are its season table's metrics over fewer games, so the same rules hold
+RULES.update({w: RULES[t] for t, w in zip(TABLES, WEEKLY_TABLES)})
+# the YAML meta primary key is the player tables'
+KEYS = {'team_season': ['season', 'team_id'], 'team_game': ['season', 'game_id', 'team_id'],
+        **{w: ['season', 'player_id', 'game_id', 'window'] for w in WEEKLY_TABLES}}
+
+def _values(df: pd.DataFrame, expr: str) -> np.ndarray:
+    return np.asarray(evaluate(df, expr).to_numpy(dtype='float64', na_value=np.nan), dtype='float64')
+
+def _known(df: pd.DataFrame, *exprs) -> bool:
+    try:
+        return all(names_in(e) <= set(df.columns) for e in exprs)
+    except SyntaxError:
+        # free-text YAML formulas ('mean(epa > 0) over dropbacks') are not checkable
+        return False
+
+def _keys(table: str, defs: dict = None) -> list:
+    return KEYS.get(table) or meta(defs).get('primary_key', ['season', 'player_id'])
+
+def _checks(df: pd.DataFrame, table: str, defs: dict = None):
+    """(rule, bad-row mask, value, expected) for every rule that applies to this table."""
+    keys = _keys(table, defs)
+    cache = {}
+    def values(expr):
+        # a column is usually named by several rules; convert it once
+        if expr not in cache:
+            cache[expr] = _values(df, expr)
+        return cache[expr]
+
+    for k in keys:
+        if k in df.columns:
+            yield f'{k} not null', df[k].isna().to_numpy(), np.full(len(df), np.nan), np.full(len(df), np.nan)
+    if set(keys) <= set(df.columns):
+        size = df.groupby(keys, dropna=False)[keys[0]].transform('size').to_numpy(dtype='float64')
+        yield f'unique ({", ".join(keys)})', size > 1, size, np.ones(len(df))
+
+    for rule in RULES.get(table, []):
+        if isinstance(rule, Bounds):
+            for c in rule.columns:
+                if c not in df.columns:
+                    continue
+                v = values(c)
+                if rule.lo is not None:
+                    yield f'{c} >= {rule.lo:g}', v < rule.lo, v, np.full(len(v), rule.lo, dtype='float64')
+                if rule.hi is not None:
+                    yield f'{c} <= {rule.hi:g}', v > rule.hi, v, np.full(len(v), rule.hi, dtype='float64')
+        elif _known(df, rule.lhs, rule.rhs):
+            lhs, rhs = values(rule.lhs), values(rule.rhs)
+            with np.errstate(invalid='ignore'):
+                bad = ~OPS[rule.op](lhs, rhs) & ~np.isnan(lhs) & ~np.isnan(rhs)
+            yield rule.name, bad, lhs, rhs
+
+    # rate vs count: every YAML ratio is its numerator over its denominator (null when that is 0 or null),
+    # up to the output rounding of the rate and of a float numerator
+    tol = 10.0 ** -rounding_decimals(defs)
+    for metric, (num, den) in ratio_formulas(table, defs).items():
+        if metric not in df.columns or not _known(df, num, den):
+            continue
+        try:
+            n, d = values(num), values(den)
+        except MISSING:
+            continue
+        rate = values(metric)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            expected = np.where(d != 0, n / d, np.nan)
+            bad = (np.isnan(rate) != np.isnan(expected)) | (np.abs(rate - expected) > tol)
+        yield f'{metric} = {num} / {den}', bad, rate, expected
+
+def _key_values(df: pd.DataFrame, column: str, rows: np.ndarray, keys: list):
+    """A VIOLATION_KEYS column of df at rows, null unless it is one of the table's keys."""
+    dtype = VIOLATION_KEYS[column]
+    if column not in keys or column not in df.columns:
+        return pd.array([pd.NA] * len(rows), dtype=dtype)
+    if dtype == 'object':
+        return df[column].to_numpy(dtype=object)[rows]
+    return pd.array(df[column].to_numpy(dtype='float64', na_value=np.nan)[rows], dtype=dtype)
+
+def validate_table(table: str, df: pd.DataFrame, defs: dict = None) -> pd.DataFrame:
+    """Every violated rule of one table, one row per failing (rule, row) keyed by the row's keys; see VIOLATION_COLUMNS."""
+    rules, rows, values, expected = [], [], [], []
+    for rule, bad, v, e in _checks(df, table, defs):
+        idx = np.flatnonzero(bad)
+        if len(idx):
+            rules.append(np.full(len(idx), rule, dtype=object)); rows.append(idx)
+            values.append(v[idx]); expected.append(e[idx])
+    if not rows:
+        dtypes = {'table': 'object', 'rule': 'object', **VIOLATION_KEYS, 'value': 'float64', 'expected': 'float64'}
+        return pd.DataFrame({c: pd.Series(dtype=t) for c, t in dtypes.items()})
+    rows, keys = np.concatenate(rows), _keys(table, defs)
+    return pd.DataFrame({
+        'table': table, 'rule': np.concatenate(rules),
+        **{k: _key_values(df, k, rows, keys) for k in VIOLATION_KEYS},
+        'value': np.concatenate(values), 'expected': np.concatenate(expected),
+    })
+
+def validate(tables: dict, defs: dict = None) -> pd.DataFrame:
+    """Violations of every rule in {table name: frame} (any number of seasons per frame), in one frame."""
+    frames = [validate_table(t, df, defs) for t, df in tables.items()]
+    return pd.concat(frames, ignore_index=True) if frames else validate_table('', pd.DataFrame(), defs)
+
+def _describe(violation: pd.Series) -> str:
+    """'player 1234 in 2019', 'team 12, game 401112233 in 2019': the violation's known keys."""
+    names = {'player_id': 'player', 'team_id': 'team', 'game_id': 'game', 'window': 'window'}
+    keys = ', '.join(f'{name} {violation[k]}' for k, name in names.items() if k in violation and pd.notna(violation[k]))
+    return f"{keys or 'row'} in {violation['season']}"
+
+def issues(violations: pd.DataFrame) -> list:
+    """One line per violated rule: 'passing: completions <= pass_attempts (3 rows, e.g. player 1234 in 2019)'."""
+    out = []
+    for (table, rule), g in violations.groupby(['table', 'rule'], sort=False):
+        out.append(f"{table}: {rule} ({len(g)} row{'s' if len(g) > 1 else ''}, e.g. {_describe(g.iloc[0])})")
+    return out
+
+def validate_passing(df: pd.DataFrame):
+    return issues(validate_table('passing', df))
+
+def validate_rushing(df: pd.DataFrame):
+    return issues(validate_table('rushing', df))
 
 def validate_receiving(df: pd.DataFrame):
-    issues = []
-    if 'routes' in df.columns and (df['routes'].notna() & (df['routes'] < df['targets'])).any():
-        issues.append('routes < targets')
-    return issues
+    return issues(validate_table('receiving', df))
 
 def validate_defense(df: pd.DataFrame):
-    issues = []
-    if {'receptions_allowed','targets'}.issubset(df.columns):
-        if (df['receptions_allowed'] > df['targets']).any():
-            issues.append('receptions_allowed > targets')
-    return issues
+    return issues(validate_table('defense', df))
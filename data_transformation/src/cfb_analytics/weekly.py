@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+from .metrics import TableSpec, derive, finish_role, role_columns
+
+# Player-game time series. The per-game sums behind a table (metrics.partials: one groupby over
+# (game_id, player_id), or the partials an incremental store or a streamed build already keeps)
+# are sorted once by (player, week, game) and every window is a cumulative sum over those groups:
+# to date is the running sum, the last n games the running sum less its value n games earlier.
+# Rates are derived from the window sums as for a season, so the to_date row of a player's last game
+# through week N holds what a season build of weeks 1..N would, without rebuilding per cutoff.
+
+# window -> games it spans (None: every game so far)
+WINDOWS = {'game': 1, 'last_3': 3, 'to_date': None}
+KEY_COLUMNS = ['week', 'game_id', 'window']
+
+def game_weeks(pbp: pd.DataFrame) -> pd.Series:
+    """week of each game_id in pbp; null when pbp has no week column (games then follow game_id order)."""
+    games = pbp['game_id'].drop_duplicates()
+    if 'week' not in pbp.columns:
+        return pd.Series(np.nan, index=pd.Index(games, name='game_id'), name='week')
+    return pbp.drop_duplicates('game_id').set_index('game_id')['week'].astype('float64')
+
+def game_sums(parts: dict, table: TableSpec, weeks: pd.Series) -> pd.DataFrame:
+    """Every role's per-game sums side by side, one row per (player_id, game_id) in (player, week, game) order.
+
+    A role a player had no plays in that game sums to 0 there; `<role key>__games` counts the games it did.
+    """
+    frames, dtypes = [], {}
+    for role in table.roles:
+        df = parts.get(role.key)
+        if df is None:
+            continue
+        cols = [c for c in df.columns if c in role_columns(role)]
+        sums = df.groupby(['game_id', 'player_id'])[cols].sum()
+        sums[f'{role.key}__games'] = 1
+        dtypes.update(sums.dtypes.to_dict())
+        frames.append(sums)
+    if not frames:
+        return pd.DataFrame(columns=['player_id', 'game_id', 'week'])
+    out = pd.concat(frames, axis=1).fillna(0).astype(dtypes).reset_index()
+    out.insert(2, 'week', weeks.reindex(out['game_id']).to_numpy(dtype='float64', na_value=np.nan))
+    return out.sort_values(['player_id', 'week', 'game_id'], na_position='last', kind='stable', ignore_index=True)
+
+def window_sums(sums: pd.DataFrame, games) -> pd.DataFrame:
+    """Sums over each player's last `games` games up to every row (None: all of them), for game_sums' additive columns."""
+    values = sums.drop(columns=['player_id', 'game_id', 'week'])
+    if games == 1:
+        return values
+    player = sums['player_id'].to_numpy()
+    run = values.groupby(player, sort=False).cumsum()
+    if games is None:
+        return run
+    return run - run.groupby(player, sort=False).shift(games, fill_value=0)
+
+def finish_windows(window: pd.DataFrame, table: TableSpec) -> pd.DataFrame:
+    """Metrics from window sums, as metrics.combine derives them; a role with no plays in the window is null."""
+    roles = []
+    for role in table.roles:
+        games = window.get(f'{role.key}__games')
+        if games is None:
+            continue
+        cols = [c for c in window.columns if c in role_columns(role)]
+        roles.append(finish_role(window[cols], role).mask(games == 0, axis=0))
+    out = pd.concat(roles, axis=1) if roles else pd.DataFrame(index=window.index)
+    return derive(out, table)
+
+def player_weeks(parts: dict, table: TableSpec, weeks: pd.Series, windows: dict = WINDOWS) -> pd.DataFrame:
+    """A table's per-player metrics over each window ending at each of the player's games.
+
+    parts are metrics.partials (per-game sums) of the season; weeks maps game_id to week (game_weeks).
+    Indexed by player_id (one row per player, game and window) with week, game_id and window columns.
+    """
+    sums = game_sums(parts, table, weeks)
+    frames = []
+    for name, games in windows.items():
+        out = finish_windows(window_sums(sums, games), table)
+        out.index = pd.Index(sums['player_id'], name='player_id')
+        out['week'] = sums['week'].to_numpy()
+        out['game_id'] = sums['game_id'].to_numpy()
+        out['window'] = name
+        frames.append(out)
+    return pd.concat(frames) if frames else pd.DataFrame(columns=KEY_COLUMNS)
+
+def assemble_weekly(assemble, parts: dict, weeks: pd.Series, table: TableSpec, rosters, season: int) -> pd.DataFrame:
+    """The season table's assembler over player_weeks: same roster columns, YAML rates and columns, keyed per game and window."""
+    frame = player_weeks(parts, table, weeks)
+    keys = frame[KEY_COLUMNS].reset_index(drop=True)
+    # the assemblers keep row order, so the keys line up again afterwards
+    out = assemble(None, rosters, pd.DataFrame(), season, frame.drop(columns=KEY_COLUMNS))
+    return pd.concat([out[['season']], keys, out.drop(columns='season')], axis=1)
+
+def as_of(weekly: pd.DataFrame, week: int, window: str = 'to_date') -> pd.DataFrame:
+    """Each player's `window` row at their last game through `week`: with to_date, the season-to-date leaderboard.
+
+    Without weeks (pbp with no week column) games follow game_id order, and `week` N is each player's Nth game.
+    """
+    rows = weekly[weekly['window'] == window]
+    if len(rows) and rows['week'].isna().all():
+        nth = rows.sort_values('game_id', kind='stable').groupby('player_id').cumcount() + 1
+        rows = rows[nth.reindex(rows.index) <= week]
+    else:
+        rows = rows[rows['week'] <= week]
+    return rows.sort_values(['week', 'game_id'], kind='stable').drop_duplicates('player_id', keep='last')